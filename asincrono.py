@@ -0,0 +1,64 @@
+import sys
+
+import psycopg2
+import psycopg2.extensions
+
+# Modo asíncrono con workers gevent de gunicorn (ver start.sh): gunicorn
+# parchea sockets e hilos antes de cargar la aplicación, y aquí se hace que
+# psycopg2 también ceda el control mientras espera a PostgreSQL. Así un
+# solo proceso atiende muchas peticiones a la vez con las vistas de siempre.
+
+
+def gevent_activo():
+    """True si el proceso corre con los módulos de la biblioteca estándar parcheados por gevent."""
+    # El worker gevent de gunicorn importa gevent antes que la aplicación; si
+    # no está cargado no hay nada parcheado y se evita importarlo (~30 ms)
+    if 'gevent' not in sys.modules:
+        return False
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def _esperar(conn, timeout=None):
+    """Callback de espera de psycopg2 que suspende solo el greenlet actual."""
+    from gevent.socket import wait_read, wait_write
+
+    while True:
+        estado = conn.poll()
+        if estado == psycopg2.extensions.POLL_OK:
+            break
+        elif estado == psycopg2.extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif estado == psycopg2.extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Estado de poll() inesperado: {estado}")
+
+
+def preparar():
+    """
+    Con gevent activo instala el callback de espera. Debe llamarse antes de
+    abrir la primera conexión. Sin gevent no hace nada.
+    """
+    if gevent_activo():
+        psycopg2.extensions.set_wait_callback(_esperar)
+
+
+def modo_verde():
+    """True si psycopg2 está en modo cooperativo (no admite COPY)."""
+    return psycopg2.extensions.get_wait_callback() is not None
+
+
+def en_hilo(funcion, *args):
+    """
+    Ejecuta una función de CPU (p. ej. comprobar una contraseña) en el pool
+    de hilos de gevent para no congelar las demás peticiones del worker.
+    Sin gevent la llama directamente.
+    """
+    if gevent_activo():
+        import gevent
+        return gevent.get_hub().threadpool.apply(funcion, args)
+    return funcion(*args)
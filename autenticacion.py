@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import asincrono
+
+# Método y coste con el que se guardan las contraseñas (formato de werkzeug).
+# Al cambiarlo, cada usuario se vuelve a hashear al iniciar sesión.
+METODO_HASH = os.environ.get('LOGIN_HASH_METODO', 'scrypt:32768:8:1')
+
+# Fallos permitidos por nombre de usuario y por IP dentro de la ventana
+MAX_FALLOS_USUARIO = int(os.environ.get('LOGIN_MAX_FALLOS', 5))
+MAX_FALLOS_IP = int(os.environ.get('LOGIN_MAX_FALLOS_IP', 20))
+VENTANA = int(os.environ.get('LOGIN_VENTANA', 300))
+# Proxies de confianza delante de la aplicación (para leer la IP real de X-Forwarded-For)
+PROXIES = int(os.environ.get('LOGIN_PROXIES', 0))
+
+_metodo_efectivo = None
+
+
+def _prefijo_hash():
+    """
+    Prefijo que genera METODO_HASH (werkzeug completa los parámetros que
+    faltan, p. ej. las iteraciones de pbkdf2). Se calcula una sola vez.
+    """
+    global _metodo_efectivo
+    if _metodo_efectivo is None:
+        _metodo_efectivo = generate_password_hash('x', METODO_HASH).split('$', 1)[0]
+    return _metodo_efectivo
+
+
+def hashear(password):
+    return generate_password_hash(password, METODO_HASH)
+
+
+def necesita_rehash(hash_guardado):
+    return hash_guardado.split('$', 1)[0] != _prefijo_hash()
+
+
+def verificar_usuario(db, cursor, username, password):
+    """
+    Devuelve el usuario {id, username, rol} si la contraseña es correcta, o
+    None. Si el hash guardado usa otro método o coste, lo actualiza.
+    """
+    cursor.execute("SELECT id, username, password, rol FROM usuarios WHERE username = %s", (username,))
+    usuario = cursor.fetchone()
+    if usuario is None:
+        return None
+    hash_guardado = usuario['password']
+    # El hash es trabajo de CPU: con gevent se calcula fuera del bucle de eventos
+    if not asincrono.en_hilo(check_password_hash, hash_guardado, password):
+        return None
+    if necesita_rehash(hash_guardado):
+        cursor.execute("UPDATE usuarios SET password = %s WHERE id = %s",
+                       (asincrono.en_hilo(hashear, password), usuario['id']))
+        db.commit()
+    return {'id': usuario['id'], 'username': usuario['username'], 'rol': usuario['rol']}
+
+
+def ip_cliente(request):
+    """IP del cliente; con LOGIN_PROXIES > 0 la toma de X-Forwarded-For."""
+    if PROXIES and len(request.access_route) >= PROXIES:
+        return request.access_route[-PROXIES]
+    return request.remote_addr
+
+
+class LimitadorIntentos:
+    """
+    Cuenta los inicios de sesión fallidos por clave (usuario o IP) en una
+    ventana fija de `ventana` segundos. En memoria y por worker: con varios
+    workers el límite efectivo se multiplica por su número.
+    """
+
+    def __init__(self, max_fallos, ventana, max_claves=10000):
+        self.max_fallos = max_fallos
+        self.ventana = ventana
+        self.max_claves = max_claves
+        self._lock = threading.Lock()
+        self._fallos = {}       # clave -> [fallos, inicio de la ventana]
+
+    def bloqueado(self, clave):
+        """Segundos que faltan para poder volver a intentarlo (0 si no está bloqueada)."""
+        ahora = time.monotonic()
+        with self._lock:
+            registro = self._fallos.get(clave)
+            if registro is None:
+                return 0
+            fallos, inicio = registro
+            if ahora - inicio >= self.ventana:
+                del self._fallos[clave]
+                return 0
+            return self.ventana - (ahora - inicio) if fallos >= self.max_fallos else 0
+
+    def fallo(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            registro = self._fallos.get(clave)
+            if registro is None or ahora - registro[1] >= self.ventana:
+                if len(self._fallos) >= self.max_claves:
+                    self._limpiar(ahora)
+                self._fallos[clave] = [1, ahora]
+            else:
+                registro[0] += 1
+
+    def exito(self, clave):
+        with self._lock:
+            self._fallos.pop(clave, None)
+
+    def _limpiar(self, ahora):
+        caducadas = [clave for clave, (_, inicio) in self._fallos.items() if ahora - inicio >= self.ventana]
+        for clave in caducadas:
+            del self._fallos[clave]
+        # Si aún no hay sitio se olvidan las ventanas más antiguas
+        if len(self._fallos) >= self.max_claves:
+            for clave, _ in sorted(self._fallos.items(), key=lambda e: e[1][1])[:len(self._fallos) // 10 + 1]:
+                del self._fallos[clave]
+
+
+intentos_usuario = LimitadorIntentos(MAX_FALLOS_USUARIO, VENTANA)
+intentos_ip = LimitadorIntentos(MAX_FALLOS_IP, VENTANA)
@@ -0,0 +1,209 @@
+import bisect
+import heapq
+import os
+import select
+import threading
+import time
+import unicodedata
+
+import psycopg2
+import psycopg2.extensions
+
+# Canal de NOTIFY por el que las rutas avisan de cambios en clientes.
+# El payload es el id del cliente, o '*' para pedir una recarga completa.
+CANAL_CLIENTES = 'clientes_cambios'
+
+
+def activado():
+    """El índice en memoria es opcional: AUTOCOMPLETADO_MEMORIA=1 lo activa."""
+    return os.environ.get('AUTOCOMPLETADO_MEMORIA', '').lower() in ('1', 'true', 'si', 'sí')
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes, para que 'maria' encuentre a 'María'."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower().strip()
+
+
+class IndiceClientes:
+    """
+    Índice en memoria de (cedula, nombre) para el autocompletado.
+
+    Guarda una lista ordenada de claves (cada palabra del nombre y la
+    cédula, normalizadas) y busca por prefijo con bisect, así que una
+    consulta no depende del número total de clientes sino de cuántos
+    comparten el prefijo.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clientes = {}     # id -> (cedula, nombre, nombre_normalizado, palabras)
+        self._claves = []       # [(clave, id)] ordenada
+        self.cargado = False
+        self.version = 0
+
+    @staticmethod
+    def _entrada(cedula, nombre):
+        nombre_normalizado = normalizar(nombre)
+        return (cedula, nombre, nombre_normalizado, tuple(nombre_normalizado.split()))
+
+    @staticmethod
+    def _claves_de(entrada):
+        claves = set(entrada[3])
+        if entrada[0]:
+            claves.add(normalizar(entrada[0]))
+        return claves
+
+    def cargar(self, filas):
+        """Reemplaza el contenido con las filas (id, cedula, nombre)."""
+        clientes = {}
+        claves = []
+        for cliente_id, cedula, nombre in filas:
+            entrada = self._entrada(cedula, nombre)
+            clientes[cliente_id] = entrada
+            claves.extend((clave, cliente_id) for clave in self._claves_de(entrada))
+        claves.sort()
+        with self._lock:
+            self._clientes = clientes
+            self._claves = claves
+            self.cargado = True
+            self.version += 1
+
+    def _quitar(self, cliente_id):
+        anterior = self._clientes.pop(cliente_id, None)
+        if anterior is None:
+            return
+        for clave in self._claves_de(anterior):
+            posicion = bisect.bisect_left(self._claves, (clave, cliente_id))
+            if posicion < len(self._claves) and self._claves[posicion] == (clave, cliente_id):
+                del self._claves[posicion]
+
+    def actualizar(self, cliente_id, cedula, nombre):
+        with self._lock:
+            self._quitar(cliente_id)
+            entrada = self._entrada(cedula, nombre)
+            self._clientes[cliente_id] = entrada
+            for clave in self._claves_de(entrada):
+                bisect.insort(self._claves, (clave, cliente_id))
+            self.version += 1
+
+    def eliminar(self, cliente_id):
+        with self._lock:
+            self._quitar(cliente_id)
+            self.version += 1
+
+    def _rango(self, prefijo):
+        inicio = bisect.bisect_left(self._claves, (prefijo,))
+        fin = bisect.bisect_left(self._claves, (prefijo + '\U0010ffff',))
+        return inicio, fin
+
+    def buscar(self, q, limite=10):
+        """
+        Devuelve [{'cedula', 'nombre'}] de los clientes cuyo nombre tiene una
+        palabra que empieza por cada término de `q`, o cuya cédula empieza por `q`.
+        Primero los que empiezan por el texto completo y luego por nombre.
+        """
+        terminos = normalizar(q).split()
+        if not terminos:
+            return []
+        texto = ' '.join(terminos)
+
+        with self._lock:
+            # Se recorre solo el rango del término más selectivo
+            rangos = {t: self._rango(t) for t in terminos}
+            guia = min(terminos, key=lambda t: rangos[t][1] - rangos[t][0])
+            resto = list(terminos)
+            resto.remove(guia)
+
+            inicio, fin = rangos[guia]
+            candidatos = {cliente_id for _, cliente_id in self._claves[inicio:fin]}
+
+            encontrados = []
+            for cliente_id in candidatos:
+                cedula, nombre, nombre_normalizado, palabras = self._clientes[cliente_id]
+                if not resto or all(any(p.startswith(t) for p in palabras) for t in resto) \
+                        or normalizar(cedula).startswith(texto):
+                    encontrados.append((not nombre_normalizado.startswith(texto), nombre, cedula))
+
+        mejores = heapq.nsmallest(limite, encontrados)
+        return [{'cedula': cedula, 'nombre': nombre} for _, nombre, cedula in mejores]
+
+
+indice_clientes = IndiceClientes()
+
+_hilo = None
+_hilo_pid = None
+_hilo_lock = threading.Lock()
+
+
+def _cargar_todo(db):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT id, cedula, nombre FROM clientes")
+        indice_clientes.cargar(cursor.fetchall())
+
+
+def _aplicar(db, payload):
+    if payload == '*':
+        _cargar_todo(db)
+        return
+    cliente_id = int(payload)
+    with db.cursor() as cursor:
+        cursor.execute("SELECT cedula, nombre FROM clientes WHERE id = %s", (cliente_id,))
+        fila = cursor.fetchone()
+    if fila:
+        indice_clientes.actualizar(cliente_id, fila[0], fila[1])
+    else:
+        indice_clientes.eliminar(cliente_id)
+
+
+def _escuchar(dsn):
+    """
+    Hilo de fondo: carga el índice y aplica los NOTIFY de todos los workers,
+    también los del propio proceso, releyendo la fila ya confirmada.
+    Si se pierde la conexión, se reconecta y recarga todo, porque los avisos
+    enviados mientras tanto se han perdido.
+    """
+    while True:
+        db = None
+        try:
+            db = psycopg2.connect(dsn)
+            db.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with db.cursor() as cursor:
+                cursor.execute(f"LISTEN {CANAL_CLIENTES}")
+            _cargar_todo(db)
+            while True:
+                if select.select([db], [], [], 60) == ([], [], []):
+                    continue
+                db.poll()
+                while db.notifies:
+                    _aplicar(db, db.notifies.pop(0).payload)
+        except (psycopg2.Error, ValueError) as err:
+            print(f"Error en el índice de autocompletado, reintentando: {err}")
+            time.sleep(5)
+        finally:
+            if db is not None:
+                db.close()
+
+
+def iniciar(dsn):
+    """
+    Arranca (una vez por proceso) el hilo que precarga y mantiene el índice.
+    Tras un fork el hilo del padre no existe, así que se vuelve a arrancar.
+    """
+    global _hilo, _hilo_pid
+    with _hilo_lock:
+        if _hilo is not None and _hilo_pid == os.getpid() and _hilo.is_alive():
+            return
+        _hilo = threading.Thread(target=_escuchar, args=(dsn,), name='autocompletado', daemon=True)
+        _hilo_pid = os.getpid()
+        _hilo.start()
+
+
+def notificar_cambio(cursor, payload):
+    """
+    Avisa a todos los workers de un cambio en clientes. Se envía dentro de la
+    transacción de la ruta, así que solo llega si se confirma el commit.
+    """
+    if not activado():
+        return
+    cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_CLIENTES, str(payload)))
@@ -0,0 +1,140 @@
+"""
+Coste de arrancar la aplicación: tiempo de `import app` y memoria de los
+workers de gunicorn, con las bibliotecas de los reportes cargadas al
+importar (como antes: pandas, xlsxwriter, fpdf) y cargadas al generar el
+primer reporte, con y sin SERVIDOR_PRECARGA (gunicorn.conf.py).
+
+De cada worker se da el RSS y el PSS: el RSS cuenta entera cada página
+compartida con el maestro, el PSS la reparte entre los procesos que la
+comparten, así que la suma de PSS es la memoria que ocupa de verdad el
+servidor. No necesita base de datos.
+
+Uso: python -m benchmarks.arranque --workers 4 --repeticiones 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.asincrono import RAIZ
+
+# Lo que importaba app.py al cargarse antes de hacer diferidos los reportes
+BIBLIOTECAS_REPORTES = ['pandas', 'xlsxwriter', 'fpdf']
+
+MEDIR_IMPORT = """
+import sys, time
+inicio = time.perf_counter()
+for nombre in sys.argv[1:]:
+    try:
+        __import__(nombre)
+    except ImportError:
+        pass
+import app
+segundos = time.perf_counter() - inicio
+with open('/proc/self/status') as f:
+    rss = next(int(l.split()[1]) for l in f if l.startswith('VmRSS:'))
+print(segundos, rss / 1024)
+"""
+
+
+def app_con_reportes():
+    """Para gunicorn ('benchmarks.arranque:app_con_reportes()'): la aplicación con los reportes ya cargados."""
+    for nombre in BIBLIOTECAS_REPORTES:
+        try:
+            __import__(nombre)
+        except ImportError:
+            pass
+    from app import app
+    return app
+
+
+def entorno(precarga=False):
+    return dict(os.environ, DATABASE_URL=os.environ.get('DATABASE_URL', 'postgresql:///sin_uso'),
+                SERVIDOR_PRECARGA='1' if precarga else '0', AUTOCOMPLETADO_MEMORIA='0')
+
+
+def medir_import(bibliotecas, repeticiones):
+    """Mediana de (segundos, MB de RSS) de importar app en un intérprete nuevo."""
+    resultados = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, '-c', MEDIR_IMPORT, *bibliotecas], cwd=RAIZ, env=entorno(),
+                                capture_output=True, text=True, check=True).stdout
+        resultados.append(tuple(float(v) for v in salida.split()))
+    return statistics.median(r[0] for r in resultados), statistics.median(r[1] for r in resultados)
+
+
+def memoria(pid):
+    """(RSS, PSS) en MB del proceso (Linux, /proc/<pid>/smaps_rollup)."""
+    valores = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linea in f:
+            partes = linea.split()
+            if partes[0] in ('Rss:', 'Pss:'):
+                valores[partes[0]] = int(partes[1]) / 1024
+    return valores['Rss:'], valores['Pss:']
+
+
+def hijos(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(hijo) for hijo in f.read().split()]
+
+
+def medir_gunicorn(aplicacion, precarga, workers, puerto):
+    """Segundos hasta la primera respuesta y (RSS, PSS) del maestro y de cada worker."""
+    comando = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--workers', str(workers),
+               '--bind', f"127.0.0.1:{puerto}", '--log-level', 'warning', aplicacion]
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(comando, cwd=RAIZ, env=entorno(precarga))
+    try:
+        url = f"http://127.0.0.1:{puerto}/login"
+        for _ in range(3000):
+            try:
+                urllib.request.urlopen(url).read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        else:
+            raise RuntimeError("gunicorn no arrancó")
+        segundos = time.perf_counter() - inicio
+        # Se da tiempo a que todos los workers carguen y atiendan alguna petición
+        time.sleep(2)
+        for _ in range(workers * 10):
+            urllib.request.urlopen(url).read()
+        return segundos, memoria(proceso.pid), [memoria(pid) for pid in hijos(proceso.pid)]
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--puerto', type=int, default=8766)
+    args = parser.parse_args()
+
+    print(f"{'import app':<34} {'ms':>8} {'RSS MB':>8}")
+    for nombre, bibliotecas in (('con los reportes (antes)', BIBLIOTECAS_REPORTES), ('reportes diferidos', [])):
+        segundos, rss = medir_import(bibliotecas, args.repeticiones)
+        print(f"{nombre:<34} {segundos * 1000:8.1f} {rss:8.1f}")
+
+    print()
+    print(f"{'gunicorn, ' + str(args.workers) + ' workers':<34} {'arranque s':>10} {'RSS/worker':>10} "
+          f"{'PSS/worker':>10} {'PSS total':>10}")
+    for nombre, aplicacion, precarga in (
+            ('con los reportes (antes)', 'benchmarks.arranque:app_con_reportes()', False),
+            ('reportes diferidos', 'app:app', False),
+            ('reportes diferidos + precarga', 'app:app', True)):
+        segundos, maestro, workers = medir_gunicorn(aplicacion, precarga, args.workers, args.puerto)
+        rss = statistics.mean(w[0] for w in workers)
+        pss = statistics.mean(w[1] for w in workers)
+        total = maestro[1] + sum(w[1] for w in workers)
+        print(f"{nombre:<34} {segundos:10.2f} {rss:10.1f} {pss:10.1f} {total:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Compara el modo síncrono (workers sync de gunicorn, un proceso por
+petición en curso) con el modo asíncrono (workers gevent, ver asincrono.py)
+en las rutas de lectura: peticiones por segundo, latencia y memoria a
+distintas concurrencias, y la concurrencia que cada modo sostiene por GB de
+RAM sin errores y con un p95 por debajo de --p95-max.
+
+Necesita gunicorn y gevent instalados. Usa los mismos datos que
+benchmarks.rutas (se generan si no existen).
+
+Uso: BENCH_DATABASE_URL=... python -m benchmarks.asincrono --concurrencias 8,32,128
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks import rutas
+from benchmarks.comun import conectar, resumen
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTAS_LECTURA = ['inventario', 'buscar_cliente', 'historial_ventas', 'clientes']
+
+
+def memoria_mb(pid):
+    """RSS del proceso y de todos sus descendientes (Linux, /proc)."""
+    total = 0
+    pendientes = [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with open(f"/proc/{actual}/status") as f:
+                for linea in f:
+                    if linea.startswith('VmRSS:'):
+                        total += int(linea.split()[1])
+            with open(f"/proc/{actual}/task/{actual}/children") as f:
+                pendientes.extend(int(hijo) for hijo in f.read().split())
+        except FileNotFoundError:
+            continue
+    return total / 1024
+
+
+def arrancar(modo, puerto, url_db, esquema, args):
+    separador = '&' if '?' in url_db else '?'
+    entorno = dict(os.environ, DATABASE_URL=f"{url_db}{separador}options=-csearch_path%3D{esquema},public")
+    comando = [sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{puerto}", '--log-level', 'warning']
+    if modo == 'gevent':
+        comando += ['--workers', str(args.workers_gevent), '--worker-class', 'gevent',
+                    '--worker-connections', str(args.conexiones_gevent)]
+        entorno['DB_POOL_MAX'] = str(args.pool_gevent)
+    else:
+        comando += ['--workers', str(args.workers_sync)]
+    comando.append('app:app')
+    proceso = subprocess.Popen(comando, cwd=RAIZ, env=entorno)
+
+    base = f"http://127.0.0.1:{puerto}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + '/login').read()
+            return proceso, base
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError(f"gunicorn ({modo}) no arrancó")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--esquema', default='bench_rutas')
+    parser.add_argument('--productos', type=int, default=10000)
+    parser.add_argument('--clientes', type=int, default=50000)
+    parser.add_argument('--ventas', type=int, default=200000)
+    parser.add_argument('--lineas', type=int, default=2)
+    parser.add_argument('--concurrencias', default='4,16,64,128')
+    parser.add_argument('--peticiones', type=int, default=400, help="peticiones por nivel de concurrencia")
+    parser.add_argument('--workers-sync', type=int, default=4)
+    parser.add_argument('--workers-gevent', type=int, default=1)
+    parser.add_argument('--conexiones-gevent', type=int, default=500)
+    parser.add_argument('--pool-gevent', type=int, default=20, help="DB_POOL_MAX de cada worker gevent")
+    parser.add_argument('--p95-max', type=float, default=1000, help="ms")
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    url_db = os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL')
+    db = conectar()
+    if not rutas.esquema_poblado(db, args.esquema):
+        rutas.poblar(db, args.esquema, args)
+    db.close()
+
+    escenarios = rutas.escenarios(args)
+
+    def mezcla(azar):
+        return escenarios[azar.choice(RUTAS_LECTURA)](azar)
+
+    concurrencias = [int(c) for c in args.concurrencias.split(',')]
+
+    print(f"{'modo':<8} {'conc.':>5} {'pet/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'errores':>7} {'RSS MB':>8}")
+    capacidades = {}
+    for modo in ('sync', 'gevent'):
+        proceso, base = arrancar(modo, args.puerto, url_db, args.esquema, args)
+        try:
+            capacidad = None
+            for concurrencia in concurrencias:
+                tiempos, errores, _, segundos = rutas.ejecutar(base, mezcla, args.peticiones, concurrencia,
+                                                               random.randrange(1000))
+                memoria = memoria_mb(proceso.pid)
+                r = resumen(tiempos)
+                print(f"{modo:<8} {concurrencia:>5} {len(tiempos) / segundos:8.1f} {r['p50']:9.2f} "
+                      f"{r['p95']:9.2f} {len(errores):>7} {memoria:8.1f}")
+                if not errores and r['p95'] <= args.p95_max:
+                    capacidad = (concurrencia, memoria)
+            capacidades[modo] = capacidad
+        finally:
+            proceso.terminate()
+            proceso.wait()
+
+    print()
+    for modo, capacidad in capacidades.items():
+        if capacidad is None:
+            print(f"{modo:<8} ningún nivel con p95 <= {args.p95_max:g} ms y sin errores")
+            continue
+        concurrencia, memoria = capacidad
+        print(f"{modo:<8} {concurrencia} peticiones simultáneas con {memoria:.0f} MB "
+              f"= {concurrencia / (memoria / 1024):.0f} por GB de RAM")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Latencia de los listados paginados, las búsquedas de inventario y clientes
+y el autocompletado en tres fases: sin índices, con los índices del keyset
+y de prefijo, y con los índices pg_trgm de busqueda.py (si la extensión
+está instalada en el servidor).
+
+Uso: BENCH_DATABASE_URL=... python -m benchmarks.busqueda --filas 100000
+"""
+import argparse
+
+import psycopg2
+
+from busqueda import (INDICES_BUSQUEDA, INDICES_PREFIJO, buscar_clientes, condicion_clientes,
+                      condicion_productos)
+from benchmarks.comun import (conectar, crear_tablas, esquema_temporal, imprimir,
+                              medir, poblar_clientes, poblar_productos)
+
+TERMINOS_PRODUCTOS = ['Escritorio Lima', 'nogal', 'Butaca Quito 77']
+TERMINOS_CLIENTES = ['María López', 'rojas', '1004567', 'Sector 12']
+TERMINOS_AUTOCOMPLETADO = ['Ma', 'Carmen Sán', '10045', 'vargas']
+
+
+INDICES_KEYSET = [
+    ("idx_productos_orden", "productos (categoria, nombre, id)"),
+    ("idx_clientes_orden", "clientes (nombre, id)"),
+]
+
+
+def crear_indices(db, indices):
+    with db.cursor() as cursor:
+        for nombre, definicion in indices:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {definicion}")
+    analizar(db)
+
+
+def analizar(db):
+    with db.cursor() as cursor:
+        cursor.execute("ANALYZE productos")
+        cursor.execute("ANALYZE clientes")
+    db.commit()
+
+
+def instalar_pg_trgm(db):
+    try:
+        with db.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        db.commit()
+        return True
+    except psycopg2.Error as err:
+        db.rollback()
+        print(f"pg_trgm no disponible en este servidor ({str(err).splitlines()[0]}); "
+              f"se omite la fase con índices trigram.")
+        return False
+
+
+def ejecutar(db, repeticiones, filas):
+    def listado(sql_base, condicion, orden):
+        def consulta():
+            sql, params = condicion
+            with db.cursor() as cursor:
+                cursor.execute(f"{sql_base} WHERE {sql} ORDER BY {orden} LIMIT 51", params)
+                cursor.fetchall()
+        return consulta
+
+    # Primera página y una página a mitad de la tabla, como las pide el
+    # listado con el cursor (categoria, nombre, id) de la página anterior
+    with db.cursor() as cursor:
+        cursor.execute("SELECT categoria, nombre, id FROM productos ORDER BY categoria, nombre, id "
+                       "OFFSET %s LIMIT 1", (filas // 2,))
+        mitad_productos = cursor.fetchone()
+        cursor.execute("SELECT nombre, id FROM clientes ORDER BY nombre, id OFFSET %s LIMIT 1",
+                       (filas // 2,))
+        mitad_clientes = cursor.fetchone()
+    imprimir("inventario página 1", medir(
+        listado("SELECT * FROM productos", ("TRUE", []), "categoria, nombre, id"), repeticiones))
+    imprimir("inventario página a mitad (keyset)", medir(
+        listado("SELECT * FROM productos", ("(categoria, nombre, id) > (%s, %s, %s)", list(mitad_productos)),
+                "categoria, nombre, id"), repeticiones))
+    imprimir("clientes página 1", medir(
+        listado("SELECT * FROM clientes", ("TRUE", []), "nombre, id"), repeticiones))
+    imprimir("clientes página a mitad (keyset)", medir(
+        listado("SELECT * FROM clientes", ("(nombre, id) > (%s, %s)", list(mitad_clientes)), "nombre, id"),
+        repeticiones))
+
+    for termino in TERMINOS_PRODUCTOS:
+        imprimir(f"inventario '{termino}'", medir(
+            listado("SELECT * FROM productos", condicion_productos(termino), "categoria, nombre, id"),
+            repeticiones))
+    for termino in TERMINOS_CLIENTES:
+        imprimir(f"clientes '{termino}'", medir(
+            listado("SELECT * FROM clientes", condicion_clientes(termino), "nombre, id"),
+            repeticiones))
+    for termino in TERMINOS_AUTOCOMPLETADO:
+        def autocompletar(termino=termino):
+            with db.cursor() as cursor:
+                buscar_clientes(cursor, termino)
+        imprimir(f"buscar_cliente '{termino}'", medir(autocompletar, repeticiones))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=100000)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    db = conectar()
+    try:
+        with esquema_temporal(db, 'bench_busqueda'):
+            crear_tablas(db)
+            poblar_productos(db, args.filas)
+            poblar_clientes(db, args.filas)
+            # El orden por relevancia usa word_similarity() también sin índices
+            trigramas = instalar_pg_trgm(db)
+            analizar(db)
+
+            print(f"--- Sin índices ({args.filas} productos y clientes) ---")
+            ejecutar(db, args.repeticiones, args.filas)
+
+            crear_indices(db, INDICES_KEYSET + INDICES_PREFIJO)
+            print("--- Con índices del keyset y de prefijo ---")
+            ejecutar(db, args.repeticiones, args.filas)
+
+            if trigramas:
+                crear_indices(db, INDICES_BUSQUEDA)
+                print("--- Con índices pg_trgm ---")
+                ejecutar(db, args.repeticiones, args.filas)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+# Los benchmarks trabajan en un esquema propio para no tocar los datos reales.
+# Aun así, usa una base de datos de pruebas: BENCH_DATABASE_URL o DATABASE_URL.
+
+
+def conectar():
+    url = os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL')
+    if url is None:
+        raise ValueError("Configura BENCH_DATABASE_URL con una base de datos de pruebas")
+    return psycopg2.connect(url)
+
+
+@contextmanager
+def esquema_temporal(db, nombre):
+    """Crea el esquema `nombre`, lo pone primero en el search_path y lo borra al terminar."""
+    with db.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {nombre} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {nombre}")
+        cursor.execute(f"SET search_path TO {nombre}, public")
+    db.commit()
+    try:
+        yield
+    finally:
+        db.rollback()
+        with db.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {nombre} CASCADE")
+            cursor.execute("SET search_path TO DEFAULT")
+        db.commit()
+
+
+def crear_tablas(db):
+    with db.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE productos (
+                id SERIAL PRIMARY KEY,
+                nombre TEXT NOT NULL,
+                categoria TEXT NOT NULL,
+                color TEXT NOT NULL,
+                precio NUMERIC(12, 2) NOT NULL,
+                cantidad INTEGER NOT NULL,
+                descripcion TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE clientes (
+                id SERIAL PRIMARY KEY,
+                nombre TEXT NOT NULL,
+                cedula TEXT NOT NULL UNIQUE,
+                telefono TEXT,
+                direccion TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE ventas (
+                id SERIAL PRIMARY KEY,
+                id_cliente INTEGER NOT NULL REFERENCES clientes (id),
+                fecha TIMESTAMP NOT NULL DEFAULT NOW(),
+                total NUMERIC(12, 2) NOT NULL,
+                metodo_pago TEXT,
+                descripcion TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE detalle_ventas (
+                id SERIAL PRIMARY KEY,
+                id_venta INTEGER NOT NULL REFERENCES ventas (id),
+                id_producto INTEGER NOT NULL REFERENCES productos (id),
+                cantidad INTEGER NOT NULL,
+                precio_unitario NUMERIC(12, 2) NOT NULL,
+                descripcion TEXT
+            )
+        """)
+    db.commit()
+
+
+def poblar_productos(db, n):
+    with db.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO productos (nombre, categoria, color, precio, cantidad, descripcion)
+            SELECT
+                (ARRAY['Silla','Mesa','Sofá','Cama','Escritorio','Armario','Repisa','Butaca'])[1 + i %% 8]
+                    || ' ' || (ARRAY['Roma','Lisboa','Caracas','Lima','Quito','Bogotá'])[1 + (i / 8) %% 6]
+                    || ' ' || i,
+                (ARRAY['Sala','Comedor','Dormitorio','Oficina','Exterior'])[1 + i %% 5],
+                (ARRAY['Negro','Blanco','Roble','Nogal','Gris','Azul','Rojo'])[1 + i %% 7],
+                (10 + i %% 990)::numeric,
+                1000000,
+                'Producto de prueba ' || i
+            FROM generate_series(1, %s) AS i
+        """, (n,))
+        cursor.execute("ANALYZE productos")
+    db.commit()
+
+
+def poblar_clientes(db, n):
+    with db.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO clientes (nombre, cedula, telefono, direccion)
+            SELECT
+                (ARRAY['Ana','Luis','María','José','Carmen','Pedro','Rosa','Juan'])[1 + i %% 8]
+                    || ' ' || (ARRAY['Pérez','González','Rodríguez','López','Martínez','Sánchez'])[1 + (i / 8) %% 6]
+                    || ' ' || (ARRAY['Díaz','Torres','Rojas','Vargas','Castro'])[1 + (i / 48) %% 5],
+                (1000000 + i)::text,
+                '0414' || lpad(i::text, 7, '0'),
+                'Calle ' || (i %% 500) || ', Sector ' || (i %% 37)
+            FROM generate_series(1, %s) AS i
+        """, (n,))
+        cursor.execute("ANALYZE clientes")
+    db.commit()
+
+
+def poblar_ventas(db, n, clientes, productos, dias=365, lineas=2):
+    """
+    `n` ventas repartidas en los últimos `dias` días entre `clientes`
+    clientes, con `lineas` líneas de detalle cada una sobre `productos` productos.
+    """
+    with db.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO ventas (id_cliente, fecha, total, metodo_pago, descripcion)
+            SELECT
+                1 + (i::bigint * 7919) %% %s,
+                NOW() - (i %% (%s * 24)) * INTERVAL '1 hour' - (i %% 3600) * INTERVAL '1 second',
+                (20 + i %% 2000)::numeric,
+                (ARRAY['Efectivo','Tarjeta','Zelle','Pago Móvil'])[1 + i %% 4],
+                ''
+            FROM generate_series(1, %s) AS i
+        """, (clientes, dias, n))
+        cursor.execute("""
+            INSERT INTO detalle_ventas (id_venta, id_producto, cantidad, precio_unitario, descripcion)
+            SELECT v.id, 1 + (v.id::bigint * l * 104729) %% %s, l, 10 + v.id %% 990, ''
+            FROM ventas v CROSS JOIN generate_series(1, %s) AS l
+        """, (productos, lineas))
+        cursor.execute("ANALYZE ventas")
+        cursor.execute("ANALYZE detalle_ventas")
+    db.commit()
+
+
+def medir(funcion, repeticiones):
+    """Ejecuta `funcion` varias veces y devuelve percentiles de latencia en milisegundos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resumen(tiempos)
+
+
+def resumen(tiempos):
+    tiempos = sorted(tiempos)
+    if not tiempos:
+        return {'n': 0}
+
+    def percentil(p):
+        return tiempos[min(len(tiempos) - 1, int(round(p / 100 * (len(tiempos) - 1))))]
+
+    return {
+        'n': len(tiempos),
+        'media': statistics.mean(tiempos),
+        'p50': percentil(50),
+        'p95': percentil(95),
+        'p99': percentil(99),
+    }
+
+
+def imprimir(titulo, resultado):
+    if not resultado.get('n'):
+        print(f"{titulo:<45} sin datos")
+        return
+    print(f"{titulo:<45} n={resultado['n']:<5} p50={resultado['p50']:8.2f} ms  "
+          f"p95={resultado['p95']:8.2f} ms  p99={resultado['p99']:8.2f} ms")
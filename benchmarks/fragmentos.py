@@ -0,0 +1,81 @@
+"""
+Tiempo de renderizar el listado de inventario (listados/productos.html)
+con y sin la caché de fragmentos de fragmentos.py, para varios tamaños de
+página. No usa la base de datos: las filas se generan en memoria.
+
+Casos:
+- sin caché: todas las filas se renderizan en cada petición
+- filas en caché: la caché está caliente salvo una fila que cambió
+  (lo habitual tras una venta)
+- bloque en caché: el mismo listado con los mismos datos
+
+Uso: python -m benchmarks.fragmentos --filas 50,200,500
+"""
+import argparse
+import os
+from decimal import Decimal
+
+os.environ.setdefault('DATABASE_URL', 'postgresql:///sin_uso')
+
+import app as modulo_app  # noqa: E402
+from benchmarks.comun import imprimir, medir  # noqa: E402
+from fragmentos import CacheFragmentos  # noqa: E402
+
+
+def generar_productos(n):
+    return [{
+        'id': i,
+        'nombre': f"Mesa Roma {i}",
+        'categoria': ['Sala', 'Comedor', 'Dormitorio'][i % 3],
+        'color': ['Negro', 'Roble', 'Nogal'][i % 3],
+        'precio': Decimal('100.00') + i,
+        'cantidad': 10 + i % 7,
+        'descripcion': f"Producto de prueba {i} con una descripción algo larga",
+        'version': '1000',
+    } for i in range(1, n + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', default='50,200,500', help="tamaños de página")
+    parser.add_argument('--repeticiones', type=int, default=200)
+    args = parser.parse_args()
+
+    app = modulo_app.app
+    plantilla = app.jinja_env.get_template('listados/productos.html')
+
+    with app.test_request_context('/inventario'):
+        modulo_app.session['rol'] = 'gerente'
+        for n in (int(f) for f in args.filas.split(',')):
+            productos = generar_productos(n)
+            # fila_cacheada() usa la caché global del módulo app: se sustituye por una nueva
+            cache = CacheFragmentos()
+            modulo_app.cache_fragmentos = cache
+
+            def renderizar():
+                return plantilla.render(productos=productos, pagina=None, session=modulo_app.session)
+
+            def sin_cache():
+                cache.vaciar()
+                renderizar()
+
+            contador = [0]
+
+            def una_fila_cambiada():
+                contador[0] += 1
+                productos[0]['version'] = str(contador[0])
+                renderizar()
+
+            def bloque():
+                clave = ('bloque', 'inventario', n)
+                if cache.obtener(clave) is None:
+                    cache.guardar(clave, renderizar())
+
+            imprimir(f"{n} filas, sin caché", medir(sin_cache, args.repeticiones))
+            renderizar()
+            imprimir(f"{n} filas, filas en caché", medir(una_fila_cambiada, args.repeticiones))
+            imprimir(f"{n} filas, bloque en caché", medir(bloque, args.repeticiones))
+
+
+if __name__ == '__main__':
+    main()
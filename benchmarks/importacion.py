@@ -0,0 +1,143 @@
+"""
+Importación masiva de productos: filas/segundo de importacion.importar()
+desde CSV y XLSX (COPY a la tabla temporal, y por lotes como en modo
+gevent) frente al alta de uno en uno de nuevo_producto() (un INSERT y un
+commit por fila).
+
+La mitad de las filas del archivo ya existen (se actualizan) y hay un
+porcentaje de filas inválidas.
+
+Uso: BENCH_DATABASE_URL=... python -m benchmarks.importacion --filas 20000
+"""
+import argparse
+import csv
+import io
+import random
+import time
+
+import xlsxwriter
+
+import importacion
+from benchmarks.comun import conectar, crear_tablas, esquema_temporal, poblar_productos
+
+ESQUEMA = 'bench_importacion'
+COLUMNAS = ['nombre', 'categoria', 'color', 'precio', 'cantidad', 'descripcion']
+
+
+def claves_existentes(db):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT nombre, color FROM productos ORDER BY id")
+        return cursor.fetchall()
+
+
+def generar_filas(n, existentes, invalidas, semilla=1):
+    """Filas del archivo: las primeras usan el nombre y color de `existentes`."""
+    azar = random.Random(semilla)
+    filas = []
+    for i in range(n):
+        if i < len(existentes):
+            nombre, color = existentes[i]
+        else:
+            nombre, color = f"Importado {i}", f"Color {i % 12}"
+        precio = f"{azar.uniform(10, 5000):.2f}"
+        if azar.random() < invalidas:
+            precio = 'n/d'
+        filas.append([nombre, f"Categoría {i % 20}", color, precio, azar.randint(0, 100), f"Fila {i}"])
+    return filas
+
+
+def archivo_csv(filas):
+    texto = io.StringIO()
+    escritor = csv.writer(texto)
+    escritor.writerow(COLUMNAS)
+    escritor.writerows(filas)
+    return io.BytesIO(texto.getvalue().encode('utf-8'))
+
+
+def archivo_xlsx(filas):
+    archivo = io.BytesIO()
+    libro = xlsxwriter.Workbook(archivo, {'constant_memory': True})
+    hoja = libro.add_worksheet()
+    hoja.write_row(0, 0, COLUMNAS)
+    for i, fila in enumerate(filas, start=1):
+        hoja.write_row(i, 0, fila)
+    libro.close()
+    archivo.seek(0)
+    return archivo
+
+
+def alta_por_fila(db, filas):
+    """Lo que costaría con nuevo_producto(): una sentencia y un commit por fila."""
+    insertadas = 0
+    with db.cursor() as cursor:
+        for fila in filas:
+            try:
+                cursor.execute("INSERT INTO productos (nombre, categoria, color, precio, cantidad, descripcion) "
+                               "VALUES (%s, %s, %s, %s, %s, %s)", fila)
+                db.commit()
+                insertadas += 1
+            except Exception:
+                db.rollback()
+    return insertadas
+
+
+def importar_por_lotes(db, archivo, nombre):
+    """importar() con la carga que se usa en modo gevent (sin COPY)."""
+    anterior = importacion.asincrono.modo_verde
+    importacion.asincrono.modo_verde = lambda: True
+    try:
+        return importacion.importar(db, 'productos', archivo, nombre)
+    finally:
+        importacion.asincrono.modo_verde = anterior
+
+
+def preparar(db, existentes):
+    with db.cursor() as cursor:
+        cursor.execute("TRUNCATE productos CASCADE")
+        cursor.execute("ALTER SEQUENCE productos_id_seq RESTART")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_nombre_color ON productos (nombre, color)")
+    db.commit()
+    poblar_productos(db, existentes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, default=20000)
+    parser.add_argument('--invalidas', type=float, default=0.01, help="proporción de filas con errores")
+    parser.add_argument('--filas-por-fila', type=int, default=2000,
+                        help="filas para el alta de uno en uno (es mucho más lenta)")
+    args = parser.parse_args()
+
+    existentes = args.filas // 2
+
+    db = conectar()
+    try:
+        with esquema_temporal(db, ESQUEMA):
+            crear_tablas(db)
+            preparar(db, existentes)
+            filas = generar_filas(args.filas, claves_existentes(db), args.invalidas)
+            casos = [
+                ('CSV, COPY', lambda: importacion.importar(db, 'productos', archivo_csv(filas), 'p.csv')),
+                ('CSV, por lotes', lambda: importar_por_lotes(db, archivo_csv(filas), 'p.csv')),
+                ('XLSX, COPY', lambda: importacion.importar(db, 'productos', archivo_xlsx(filas), 'p.xlsx')),
+            ]
+            for nombre, funcion in casos:
+                preparar(db, existentes)
+                r = funcion()
+                print(f"{nombre:<20} {r['filas_por_segundo']:9.0f} filas/s  leídas={r['leidas']} "
+                      f"insertadas={r['insertadas']} actualizadas={r['actualizadas']} "
+                      f"sin_cambios={r['sin_cambios']} errores={r['total_errores']} ({r['segundos']:.2f} s)")
+
+            preparar(db, 0)
+            muestra = filas[:args.filas_por_fila]
+            inicio = time.perf_counter()
+            insertadas = alta_por_fila(db, muestra)
+            segundos = time.perf_counter() - inicio
+            print(f"{'uno en uno':<20} {len(muestra) / segundos:9.0f} filas/s  leídas={len(muestra)} "
+                  f"insertadas={insertadas} ({segundos:.2f} s)")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Reposición de stock mientras se vende: compara editar_producto() por
+artículo (lee el stock, y al guardar reescribe las seis columnas con el
+valor leído más la entrada, una conexión por artículo) con
+movimientos.aplicar_movimientos() (un lote, un UPDATE relativo).
+
+Mide artículos repuestos por segundo y cuenta los productos cuyo stock
+final no cuadra con stock inicial + entradas - vendido (actualizaciones
+perdidas).
+
+Uso: BENCH_DATABASE_URL=... python -m benchmarks.movimientos --hilos-venta 4 --articulos 200
+"""
+import argparse
+import random
+import threading
+import time
+
+import psycopg2.errors
+
+import movimientos
+from benchmarks.comun import conectar, crear_tablas, esquema_temporal, poblar_clientes
+from ventas import VentaRechazada, registrar_venta
+
+ESQUEMA = 'bench_movimientos'
+STOCK = 100000
+
+
+def conectar_esquema():
+    db = conectar()
+    with db.cursor() as cursor:
+        cursor.execute(f"SET search_path TO {ESQUEMA}, public")
+    db.commit()
+    return db
+
+
+def preparar(db, productos):
+    with db.cursor() as cursor:
+        cursor.execute("TRUNCATE movimientos_inventario, detalle_ventas, ventas, productos RESTART IDENTITY CASCADE")
+        cursor.execute("""
+            INSERT INTO productos (nombre, categoria, color, precio, cantidad, descripcion)
+            SELECT 'Producto ' || i, 'Sala', 'Negro', 100, %s, '' FROM generate_series(1, %s) AS i
+        """, (STOCK, productos))
+    db.commit()
+
+
+def reponer_editando(articulos, pausa):
+    """Como el formulario de edición anterior: lee, espera al usuario y sobrescribe."""
+    for id_producto, cantidad in articulos:
+        db = conectar_esquema()
+        with db.cursor() as cursor:
+            cursor.execute("SELECT nombre, categoria, color, precio, cantidad, descripcion FROM productos WHERE id = %s",
+                           (id_producto,))
+            nombre, categoria, color, precio, stock, descripcion = cursor.fetchone()
+            db.commit()
+            time.sleep(pausa)
+            cursor.execute("UPDATE productos SET nombre = %s, categoria = %s, color = %s, precio = %s, cantidad = %s, descripcion = %s WHERE id = %s",
+                           (nombre, categoria, color, precio, stock + cantidad, descripcion, id_producto))
+        db.commit()
+        db.close()
+
+
+def reponer_en_lote(articulos, pausa):
+    time.sleep(pausa)
+    db = conectar_esquema()
+    with db.cursor() as cursor:
+        movimientos.aplicar_movimientos(cursor, [{'id': i, 'cantidad': c, 'tipo': 'entrada'} for i, c in articulos],
+                                        'benchmark')
+    db.commit()
+    db.close()
+
+
+def vender(parar, productos, semilla, contadores, lock):
+    azar = random.Random(semilla)
+    db = conectar_esquema()
+    while not parar.is_set():
+        carrito = [{'id': azar.randint(1, productos), 'cantidad': azar.randint(1, 3), 'descripcion_producto': ''}
+                   for _ in range(3)]
+        try:
+            with db.cursor() as cursor:
+                registrar_venta(cursor, str(1000000 + azar.randint(1, 100)), None, 'Efectivo', '', carrito)
+            db.commit()
+            clave = 'ventas'
+        except (VentaRechazada, psycopg2.errors.DeadlockDetected):
+            db.rollback()
+            clave = 'rechazadas'
+        with lock:
+            contadores[clave] += 1
+    db.close()
+
+
+def descuadres(db, entradas):
+    with db.cursor() as cursor:
+        cursor.execute("""
+            SELECT p.id, p.cantidad, coalesce(v.vendido, 0)
+            FROM productos p
+            LEFT JOIN (SELECT id_producto, sum(cantidad) AS vendido
+                       FROM detalle_ventas GROUP BY id_producto) v ON v.id_producto = p.id
+        """)
+        filas = cursor.fetchall()
+    db.rollback()
+    return sum(1 for id_producto, cantidad, vendido in filas
+               if cantidad != STOCK + entradas.get(id_producto, 0) - vendido)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--productos', type=int, default=50)
+    parser.add_argument('--articulos', type=int, default=200, help="artículos a reponer")
+    parser.add_argument('--hilos-venta', type=int, default=4)
+    parser.add_argument('--pausa', type=float, default=0.005,
+                        help="segundos entre leer el stock y guardarlo (el usuario rellenando el formulario)")
+    args = parser.parse_args()
+
+    azar = random.Random(1)
+    articulos = [(azar.randint(1, args.productos), azar.randint(1, 20)) for _ in range(args.articulos)]
+    entradas = {}
+    for id_producto, cantidad in articulos:
+        entradas[id_producto] = entradas.get(id_producto, 0) + cantidad
+
+    db = conectar()
+    try:
+        with esquema_temporal(db, ESQUEMA):
+            crear_tablas(db)
+            movimientos.crear_tablas(db)
+            poblar_clientes(db, 100)
+            for nombre, reponer in (('editar_producto (anterior)', reponer_editando), ('movimientos en lote', reponer_en_lote)):
+                preparar(db, args.productos)
+                parar = threading.Event()
+                contadores = {'ventas': 0, 'rechazadas': 0}
+                lock = threading.Lock()
+                vendedores = [threading.Thread(target=vender, args=(parar, args.productos, i, contadores, lock))
+                              for i in range(args.hilos_venta)]
+                for t in vendedores:
+                    t.start()
+                inicio = time.perf_counter()
+                reponer(articulos, args.pausa)
+                segundos = time.perf_counter() - inicio
+                parar.set()
+                for t in vendedores:
+                    t.join()
+                print(f"{nombre:<28} {len(articulos) / segundos:9.1f} artículos/s  "
+                      f"ventas={contadores['ventas']} descuadres={descuadres(db, entradas)}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+Comprueba los planes de ejecución de las consultas de las rutas sobre una
+base de datos poblada a escala: falla (código de salida 1) si alguna
+consulta frecuente recorre entera una de las tablas grandes (Seq Scan, o
+un índice leído casi entero descartando filas).
+
+Las consultas no se copian de app.py: se hacen las peticiones a las rutas
+con el cliente de pruebas de Flask y se capturan las sentencias que
+ejecutan las conexiones de su pool (ConexionRegistro), así que un cambio
+en una ruta o en las funciones que usa se comprueba sin tocar este archivo.
+
+Las tablas e índices se crean con esquema.py, así que un índice que falte
+allí aparece aquí como regresión.
+
+Uso: BENCH_DATABASE_URL=... python -m benchmarks.planes --filas 100000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+import psycopg2.extensions
+import psycopg2.sql
+from werkzeug.security import generate_password_hash
+
+import resumenes
+from benchmarks.comun import (conectar, esquema_temporal, poblar_clientes, poblar_productos,
+                              poblar_ventas)
+from benchmarks.replicas import con_esquema
+from benchmarks.rutas import CLAVE, USUARIO
+from esquema import crear_esquema
+from metricas import ConexionMedida
+from paginacion import codificar_cursor
+
+ESQUEMA = 'bench_planes'
+TABLAS_GRANDES = {'usuarios', 'productos', 'clientes', 'ventas', 'detalle_ventas',
+                  'resumen_ventas_diario', 'resumen_productos_diario',
+                  'resumen_clientes', 'resumen_clientes_productos', 'movimientos_inventario'}
+
+# Recorridos completos aceptados: el reporte y el resumen por producto leen
+# todo el rango y unirlos por hash con clientes/productos sale más barato
+# que buscar las filas una a una; el catálogo del formulario de venta son
+# todos los productos (se guarda en caché, ver catalogo.py)
+PERMITIDOS = {'reporte de una semana': {'clientes'}, 'resumen por producto': {'productos'},
+              'catálogo de venta': {'productos'}}
+# Un índice recorrido casi entero descartando filas es tan malo como un Seq Scan
+MAXIMO_DESCARTADAS = 10000
+
+SENTENCIAS_CON_PLAN = re.compile(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.I)
+
+# Sentencias ejecutadas por las conexiones de la aplicación: (sql, params)
+_capturadas = []
+
+
+def _texto(cursor, query):
+    if isinstance(query, psycopg2.sql.Composable):
+        return query.as_string(cursor)
+    # execute_values() manda la consulta ya compuesta, en bytes
+    return query.decode('utf-8') if isinstance(query, bytes) else query
+
+
+class CursorRegistro:
+    """Mezcla para cualquier clase de cursor: guarda cada consulta ejecutada para luego pedir su plan."""
+
+    def execute(self, query, vars=None):
+        _capturadas.append((_texto(self, query), vars))
+        return super().execute(query, vars)
+
+    def copy_expert(self, sql, file, size=8192):
+        # De un COPY (consulta) TO STDOUT interesa el plan de la consulta
+        encontrado = re.match(r"\s*COPY \((.*)\) TO STDOUT", _texto(self, sql), re.S)
+        if encontrado:
+            _capturadas.append((encontrado.group(1), None))
+        return super().copy_expert(sql, file, size)
+
+
+_clases_registro = {}
+
+
+class ConexionRegistro(ConexionMedida):
+    """Conexión del pool de la aplicación cuyos cursores pasan por CursorRegistro."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        if base not in _clases_registro:
+            _clases_registro[base] = type(f"{base.__name__}Registro", (CursorRegistro, base), {})
+        kwargs['cursor_factory'] = _clases_registro[base]
+        return super().cursor(*args, **kwargs)
+
+
+def escenarios(db, filas):
+    """
+    (nombre, método, url, datos, necesita_trigramas) de las peticiones con
+    sus parámetros típicos. `datos` es un dict (formulario), una lista u
+    objeto JSON envuelto en {'json': ...}, o None.
+    """
+    medio = filas // 2
+    hoy = date.today()
+    hace_una_semana = (hoy - timedelta(days=7)).isoformat()
+    with db.cursor() as cursor:
+        cursor.execute("SELECT nombre, categoria, color, precio, cantidad FROM productos WHERE id = %s", (medio,))
+        nombre, categoria, color, precio, cantidad = cursor.fetchone()
+        cursor.execute("SELECT nombre, cedula, telefono, direccion FROM clientes WHERE id = %s", (medio,))
+        cliente = cursor.fetchone()
+    db.rollback()
+    cedula = cliente[1]
+    return [
+        ("login", 'POST', '/login', {'username': USUARIO, 'password': CLAVE}, False),
+        ("inventario", 'GET', '/inventario', None, False),
+        ("inventario página siguiente", 'GET',
+         '/inventario?cursor=' + codificar_cursor(['Oficina', 'Mesa Lima', medio]), None, False),
+        ("inventario búsqueda", 'GET', '/inventario?query=Escritorio+Lima', None, True),
+        ("editar producto", 'POST', '/inventario/editar', {
+            'id': medio, 'nombre': nombre, 'categoria': categoria, 'color': color, 'precio': precio,
+            'cantidad': cantidad + 1, 'cantidad_original': cantidad, 'descripcion': ''}, False),
+        ("movimientos de inventario", 'POST', '/api/inventario/movimientos',
+         {'json': {'movimientos': [{'id': medio, 'cantidad': 5, 'tipo': 'entrada'}]}}, False),
+        ("historial de un producto", 'GET', f'/api/inventario/{medio}/movimientos', None, False),
+        ("clientes", 'GET', '/clientes', None, False),
+        ("clientes página siguiente", 'GET', '/clientes?cursor=' + codificar_cursor(['Luis', medio]), None, False),
+        ("clientes búsqueda", 'GET', '/clientes?query=Mar%C3%ADa+L%C3%B3pez', None, True),
+        ("editar cliente", 'POST', '/clientes/editar', {
+            'id': medio, 'nombre': cliente[0], 'cedula': cedula, 'telefono': cliente[2] or '',
+            'direccion': cliente[3] or ''}, False),
+        ("autocompletado cédula", 'GET', '/buscar_cliente?q=1004567', None, False),
+        ("autocompletado prefijo", 'GET', '/buscar_cliente?q=Ma', None, False),
+        ("autocompletado texto", 'GET', '/buscar_cliente?q=Carmen+S%C3%A1n', None, True),
+        ("historial", 'GET', '/historial/ventas', None, False),
+        ("historial página siguiente", 'GET', '/historial/ventas?cursor=' + codificar_cursor(
+            [(datetime.now() - timedelta(days=30)).isoformat(), medio]), None, False),
+        ("historial por fechas", 'GET', f'/historial/ventas?fecha_inicio={hace_una_semana}&fecha_fin={hoy}',
+         None, False),
+        ("historial por cédula", 'GET', '/historial/ventas?query=100456', None, False),
+        ("historial por nombre", 'GET', '/historial/ventas?query=Carmen+S%C3%A1nchez', None, True),
+        ("historial de un cliente", 'GET', f'/api/clientes/{cedula}/historial', None, False),
+        ("historial de un cliente página siguiente", 'GET', f'/api/clientes/{cedula}/historial?cursor='
+         + codificar_cursor([(datetime.now() - timedelta(days=30)).isoformat(), filas * 2]), None, False),
+        ("catálogo de venta", 'GET', '/ventas/catalogo', None, False),
+        ("validar carrito", 'POST', '/api/ventas/carrito',
+         {'json': {'productos': [{'id': 10, 'cantidad': 1}, {'id': medio, 'cantidad': 2}]}}, False),
+        ("nueva venta", 'POST', '/ventas/nueva', {
+            'cliente_cedula': '1000010', 'metodo_pago': 'Efectivo', 'descripcion_general': '',
+            'productos_vendidos': json.dumps([{'id': 10, 'cantidad': 1, 'descripcion_producto': ''},
+                                              {'id': medio, 'cantidad': 2, 'descripcion_producto': ''}]),
+            'clave_venta': 'planes'}, False),
+        ("resumen por día", 'GET', f'/api/resumen/ventas?agrupar=dia&desde={hace_una_semana}&hasta={hoy}',
+         None, False),
+        ("resumen por producto", 'GET',
+         f'/api/resumen/ventas?agrupar=producto&desde={hace_una_semana}&hasta={hoy}', None, False),
+        ("reporte de una semana", 'POST', '/reportes/generar',
+         {'report_type': 'csv', 'start_date': hace_una_semana, 'end_date': hoy.isoformat()}, False),
+    ]
+
+
+def consultas_rutas(db, filas):
+    """
+    (escenario, nombre, sql, params, necesita_trigramas, error) de las
+    sentencias que ejecuta cada ruta, capturadas al hacerle la petición.
+    `nombre` numera las sentencias del escenario; `error` explica por qué
+    falló la petición (código HTTP o mensaje flash de error), o None.
+    """
+    url = con_esquema(os.environ.get('BENCH_DATABASE_URL') or os.environ['DATABASE_URL'], ESQUEMA)
+    # La configuración se lee al importar la aplicación: sin réplicas y sin el
+    # índice de autocompletado en memoria, para que todo vaya a la base de datos
+    os.environ.update({'DATABASE_URL': url, 'DATABASE_REPLICAS': '', 'AUTOCOMPLETADO_MEMORIA': '0'})
+    from conexion import obtener_pool
+    # El pool se crea antes que la aplicación, con la conexión que captura las consultas
+    obtener_pool(url, connection_factory=ConexionRegistro)
+    import app as modulo_app
+
+    cliente = modulo_app.app.test_client()
+    consultas = []
+    for nombre, metodo, ruta, datos, necesita_trigramas in escenarios(db, filas):
+        _capturadas.clear()
+        if datos is not None and 'json' in datos:
+            respuesta = cliente.open(ruta, method=metodo, json=datos['json'])
+        else:
+            respuesta = cliente.open(ruta, method=metodo, data=datos)
+        with cliente.session_transaction() as sesion:
+            errores = [mensaje for categoria, mensaje in sesion.pop('_flashes', []) if categoria == 'danger']
+        error = f"HTTP {respuesta.status_code}" if respuesta.status_code >= 400 else '; '.join(errores) or None
+
+        vistas = set()
+        unicas = []
+        for query, params in _capturadas:
+            # Solo las sentencias con plan (no SET, NOTIFY, LISTEN...)
+            if not SENTENCIAS_CON_PLAN.match(query):
+                continue
+            clave = (query, repr(params))
+            if clave not in vistas:
+                vistas.add(clave)
+                unicas.append((query, params))
+        if error or not unicas:
+            consultas.append((nombre, nombre, None, None, necesita_trigramas, error or "la ruta no hizo consultas"))
+            continue
+        for numero, (query, params) in enumerate(unicas, start=1):
+            etiqueta = nombre if len(unicas) == 1 else f"{nombre} ({numero})"
+            consultas.append((nombre, etiqueta, query, params, necesita_trigramas, None))
+    return consultas
+
+
+def problemas(nodo):
+    """Tablas grandes que el plan recorre enteras o casi enteras."""
+    encontrados = []
+    tabla = nodo.get('Relation Name')
+    if tabla in TABLAS_GRANDES:
+        if nodo.get('Node Type') == 'Seq Scan':
+            encontrados.append((tabla, f"Seq Scan en {tabla}"))
+        elif nodo.get('Rows Removed by Filter', 0) > MAXIMO_DESCARTADAS:
+            encontrados.append((tabla, f"{nodo['Rows Removed by Filter']} filas descartadas en {tabla}"))
+    for hijo in nodo.get('Plans', []):
+        encontrados.extend(problemas(hijo))
+    return encontrados
+
+
+def explicar(db, sql, params):
+    """
+    Plan de la consulta, sin dejar cambios. Las lecturas se ejecutan (EXPLAIN
+    ANALYZE); de las escrituras, que la ruta ya ha hecho, solo se pide el
+    plan para no repetirlas.
+    """
+    lectura = sql.lstrip().upper().startswith('SELECT')
+    opciones = "ANALYZE, FORMAT JSON" if lectura else "FORMAT JSON"
+    with db.cursor() as cursor:
+        cursor.execute(f"EXPLAIN ({opciones}) " + sql, params)
+        plan = cursor.fetchone()[0]
+    db.rollback()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def pg_trgm_disponible(db):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone()[0] > 0
+
+
+def poblar(db, filas):
+    crear_esquema(db)
+    poblar_productos(db, filas)
+    poblar_clientes(db, filas)
+    poblar_ventas(db, filas * 2, filas, filas)
+    with db.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO usuarios (username, password, rol)
+            SELECT 'usuario' || i, 'x', 'trabajador' FROM generate_series(1, %s) AS i
+        """, (max(filas // 10, 1000),))
+        # El usuario con el que se hacen las peticiones a las rutas
+        cursor.execute("INSERT INTO usuarios (username, password, rol) VALUES (%s, %s, 'gerente')",
+                       (USUARIO, generate_password_hash(CLAVE)))
+        cursor.execute("ANALYZE usuarios")
+    db.commit()
+    resumenes.reconstruir(db)
+    with db.cursor() as cursor:
+        cursor.execute("ANALYZE resumen_ventas_diario")
+        cursor.execute("ANALYZE resumen_productos_diario")
+        cursor.execute("ANALYZE resumen_clientes")
+        cursor.execute("ANALYZE resumen_clientes_productos")
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=100000)
+    args = parser.parse_args()
+
+    db = conectar()
+    fallos = 0
+    try:
+        with esquema_temporal(db, ESQUEMA):
+            poblar(db, args.filas)
+            trigramas = pg_trgm_disponible(db)
+            if not trigramas:
+                print("pg_trgm no está instalada: se omiten las búsquedas ILIKE '%...%'.")
+
+            for escenario, nombre, sql, params, necesita_trigramas, error in consultas_rutas(db, args.filas):
+                if necesita_trigramas and not trigramas:
+                    print(f"OMITIDA {nombre}")
+                    continue
+                if error:
+                    fallos += 1
+                    print(f"FALLO  {nombre:<50} la ruta falló: {error}")
+                    continue
+                plan = explicar(db, sql, params)
+                encontrados = [texto for tabla, texto in problemas(plan['Plan'])
+                               if tabla not in PERMITIDOS.get(escenario, ())]
+                estado = 'FALLO  ' if encontrados else 'OK     '
+                fallos += bool(encontrados)
+                tiempo = f"{plan['Execution Time']:9.2f} ms" if 'Execution Time' in plan else '        -   '
+                detalle = f"  {'; '.join(encontrados)}" if encontrados else ''
+                print(f"{estado}{nombre:<50} {tiempo}{detalle}")
+    finally:
+        db.close()
+
+    if fallos:
+        print(f"{fallos} consultas recorren tablas completas o rutas fallidas.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Comprueba el reparto de lecturas de replicas.py con dos instancias locales
+de PostgreSQL: el primario (BENCH_DATABASE_URL) y una réplica en streaming
+(BENCH_REPLICA_URL). Para crear la réplica en el puerto 5433:
+
+    pg_basebackup -h localhost -p 5432 -U postgres -D /tmp/replica -R -X stream
+    pg_ctl -D /tmp/replica -o "-p 5433" -l /tmp/replica.log start
+
+Se añade además una réplica inexistente (--replica-caida) para comprobar
+que el turno se la salta. Pausar la réplica (pg_wal_replay_pause) requiere
+un usuario con permisos de superusuario en ella.
+
+Falla (código de salida 1) si alguna comprobación no se cumple.
+
+Uso: BENCH_DATABASE_URL=... BENCH_REPLICA_URL=... python -m benchmarks.replicas
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+from benchmarks import rutas
+from benchmarks.comun import conectar
+
+RUTAS_LECTURA = ['/inventario', '/historial/ventas', '/clientes', '/buscar_cliente?q=Ma',
+                 '/inventario?query=Sala']
+
+
+def con_esquema(url, esquema):
+    separador = '&' if '?' in url else '?'
+    return f"{url}{separador}options=-csearch_path%3D{esquema},public"
+
+
+def esperar_replica(primario, replica, segundos=30):
+    """Espera a que la réplica aplique todo el WAL actual del primario."""
+    with primario.cursor() as cursor:
+        cursor.execute("SELECT pg_current_wal_lsn()::text")
+        lsn = cursor.fetchone()[0]
+    limite = time.time() + segundos
+    with replica.cursor() as cursor:
+        while time.time() < limite:
+            cursor.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn", (lsn,))
+            if cursor.fetchone()[0]:
+                return
+            time.sleep(0.1)
+    raise RuntimeError("La réplica no alcanza al primario: ¿está en streaming?")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--esquema', default='bench_rutas')
+    parser.add_argument('--productos', type=int, default=2000)
+    parser.add_argument('--clientes', type=int, default=5000)
+    parser.add_argument('--ventas', type=int, default=20000)
+    parser.add_argument('--lineas', type=int, default=2)
+    parser.add_argument('--replica-caida', default='postgresql://postgres@127.0.0.1:1/postgres')
+    parser.add_argument('--peticiones', type=int, default=50)
+    args = parser.parse_args()
+
+    url_primario = os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL')
+    url_replica = os.environ.get('BENCH_REPLICA_URL')
+    if url_replica is None:
+        raise ValueError("Configura BENCH_REPLICA_URL con una réplica en streaming de BENCH_DATABASE_URL")
+
+    db = conectar()
+    db.autocommit = True
+    if not rutas.esquema_poblado(db, args.esquema):
+        db.autocommit = False
+        rutas.poblar(db, args.esquema, args)
+        db.autocommit = True
+    replica = psycopg2.connect(url_replica)
+    replica.autocommit = True
+    esperar_replica(db, replica)
+
+    # La configuración se lee al importar la aplicación
+    os.environ.update({
+        'DATABASE_URL': con_esquema(url_primario, args.esquema),
+        'DATABASE_REPLICAS': ' '.join([con_esquema(args.replica_caida, args.esquema),
+                                       con_esquema(url_replica, args.esquema)]),
+        'REPLICA_RETRASO_MAXIMO': '1',
+        'REPLICA_CHEQUEO': '1',
+        'REPLICA_TIEMPO_CONEXION': '1',
+    })
+    import app as modulo_app
+    from replicas import enrutador_lecturas
+
+    cliente = modulo_app.app.test_client()
+    cliente.post('/login', data={'username': rutas.USUARIO, 'password': rutas.CLAVE})
+    with cliente.session_transaction() as sesion:
+        sesion.pop('primario_hasta', None)
+
+    fallos = 0
+
+    def comprobar(nombre, correcto, detalle=''):
+        nonlocal fallos
+        fallos += not correcto
+        print(f"{'OK   ' if correcto else 'FALLO'} {nombre:<58} {detalle}")
+
+    def contadores():
+        stats = enrutador_lecturas.estadisticas()
+        return stats['replica'], stats['primario'] + stats['atrasada'] + stats['tras_escribir']
+
+    def leer(n):
+        # Un parámetro distinto en cada URL para que no respondan las cachés de listados
+        antes = contadores()
+        estados = [cliente.get(f"{ruta}{'&' if '?' in ruta else '?'}n={time.perf_counter_ns()}").status_code
+                   for _, ruta in zip(range(n), RUTAS_LECTURA * n)]
+        despues = contadores()
+        return despues[0] - antes[0], despues[1] - antes[1], estados
+
+    en_replica, en_primario, estados = leer(args.peticiones)
+    comprobar("las lecturas van a la réplica sana", en_replica == args.peticiones and set(estados) == {200},
+              f"réplica={en_replica} primario={en_primario}")
+    caida = enrutador_lecturas.estadisticas()['replicas'][0]
+    comprobar("la réplica caída queda fuera del turno", not caida['sana'], caida['error'] or '')
+
+    cliente.post('/inventario/eliminar/0')
+    en_replica, en_primario, _ = leer(5)
+    comprobar("tras un POST las lecturas van al primario", en_replica == 0 and en_primario == 5,
+              f"réplica={en_replica} primario={en_primario}")
+    with cliente.session_transaction() as sesion:
+        sesion.pop('primario_hasta', None)
+
+    with replica.cursor() as cursor:
+        cursor.execute("SELECT pg_wal_replay_pause()")
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(f"UPDATE {args.esquema}.productos SET descripcion = descripcion "
+                           f"WHERE id = (SELECT min(id) FROM {args.esquema}.productos)")
+        antes = enrutador_lecturas.estadisticas()['atrasada']
+        cliente.get(f"/inventario?query=Butaca&n={time.perf_counter_ns()}")
+        comprobar("una página con ETag no lee de una réplica atrasada",
+                  enrutador_lecturas.estadisticas()['atrasada'] == antes + 1)
+        time.sleep(2.5)
+        en_replica, en_primario, _ = leer(5)
+        retrasada = enrutador_lecturas.estadisticas()['replicas'][1]
+        comprobar("una réplica con retraso deja de recibir lecturas", en_replica == 0 and not retrasada['sana'],
+                  retrasada['error'] or '')
+    finally:
+        with replica.cursor() as cursor:
+            cursor.execute("SELECT pg_wal_replay_resume()")
+
+    esperar_replica(db, replica)
+    time.sleep(1.1)
+    en_replica, en_primario, _ = leer(5)
+    comprobar("al ponerse al día vuelve a recibir lecturas", en_replica == 5,
+              f"réplica={en_replica} primario={en_primario}")
+
+    db.close()
+    replica.close()
+    if fallos:
+        print(f"{fallos} comprobaciones fallidas.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""
+Prueba de carga de las rutas de la aplicación por HTTP: latencia
+p50/p95/p99, peticiones por segundo (sin contar errores ni ventas
+rechazadas, que se informan aparte) y consultas a la base de datos por
+petición (de pg_stat_statements si está instalada o, si no, de la
+cabecera Server-Timing), ruta por ruta y con una concurrencia fija.
+
+Los datos se generan en el esquema `--esquema` de BENCH_DATABASE_URL (solo
+la primera vez, o siempre con --repoblar). Sin --url se arranca la
+aplicación en este mismo proceso; con --url se ataca un servidor ya en
+marcha, que debe usar la misma base de datos y esquema, por ejemplo:
+
+    DATABASE_URL="$BENCH_DATABASE_URL?options=-csearch_path%3Dbench_rutas,public" \\
+        gunicorn --bind 0.0.0.0:8000 app:app
+
+Uso:
+    BENCH_DATABASE_URL=... python -m benchmarks.rutas --productos 100000 \\
+        --clientes 500000 --ventas 2500000 --lineas 2 --concurrencia 8 \\
+        --guardar antes.json
+    BENCH_DATABASE_URL=... python -m benchmarks.rutas --comparar antes.json
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from benchmarks.comun import conectar, poblar_clientes, poblar_productos, poblar_ventas, resumen
+
+USUARIO = 'bench_gerente'
+CLAVE = 'bench_clave'
+
+TERMINOS_INVENTARIO = ['Escritorio Lima', 'nogal', 'Butaca', 'Sala']
+TERMINOS_CLIENTES = ['Ma', 'María López', '10045', 'rojas']
+
+# Redirección de las rutas que siempre redirigen: solo esta cuenta como
+# éxito. Una venta rechazada (sin stock, cliente inexistente...) también
+# responde 302, pero de vuelta al formulario, y no debe contar como venta.
+DESTINOS_EXITO = {
+    'nueva_venta': '/inventario',
+}
+
+
+class SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    """Las redirecciones cuentan como respuesta: no se mide también la página de destino."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def esquema_poblado(db, esquema):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{esquema}.detalle_ventas",))
+        existe = cursor.fetchone()[0]
+    db.rollback()
+    return existe
+
+
+def tamanos_poblados(db, esquema, args):
+    """
+    Ajusta --productos y --clientes a los datos ya generados en `esquema`,
+    para que las ventas no pidan productos o clientes que no existen.
+    """
+    with db.cursor() as cursor:
+        cursor.execute(f"SELECT (SELECT count(*) FROM {esquema}.productos), "
+                       f"(SELECT count(*) FROM {esquema}.clientes)")
+        productos, clientes = cursor.fetchone()
+    db.rollback()
+    if (productos, clientes) != (args.productos, args.clientes):
+        print(f"El esquema {esquema} ya tiene {productos} productos y {clientes} clientes; se usan esos "
+              f"(--repoblar para generar los pedidos).")
+        args.productos, args.clientes = productos, clientes
+
+
+def poblar(db, esquema, args):
+    # Importado aquí para que la aplicación no se cargue antes de fijar DATABASE_URL
+    from esquema import crear_esquema
+    import resumenes
+
+    with db.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {esquema} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {esquema}")
+        cursor.execute(f"SET search_path TO {esquema}, public")
+    db.commit()
+    inicio = time.perf_counter()
+    crear_esquema(db)
+    poblar_productos(db, args.productos)
+    poblar_clientes(db, args.clientes)
+    poblar_ventas(db, args.ventas, args.clientes, args.productos, lineas=args.lineas)
+    with db.cursor() as cursor:
+        cursor.execute("INSERT INTO usuarios (username, password, rol) VALUES (%s, %s, 'gerente')",
+                       (USUARIO, generate_password_hash(CLAVE)))
+    db.commit()
+    resumenes.reconstruir(db)
+    with db.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    db.commit()
+    print(f"Datos generados en {time.perf_counter() - inicio:.1f} s: {args.productos} productos, "
+          f"{args.clientes} clientes, {args.ventas} ventas x {args.lineas} líneas")
+
+
+def escenarios(args):
+    """nombre -> función(azar) que devuelve (ruta, datos_post o None)."""
+    hoy = date.today()
+    hace_una_semana = (hoy - timedelta(days=7)).isoformat()
+
+    def venta(azar):
+        productos = [{'id': azar.randint(1, args.productos), 'cantidad': 1, 'descripcion_producto': ''}
+                     for _ in range(azar.randint(1, 4))]
+        return '/ventas/nueva', {
+            'cliente_cedula': str(1000000 + azar.randint(1, args.clientes)),
+            'metodo_pago': azar.choice(['Efectivo', 'Tarjeta', 'Zelle']),
+            'descripcion_general': 'benchmark',
+            'productos_vendidos': json.dumps(productos),
+        }
+
+    return {
+        'login': lambda azar: ('/login', {'username': USUARIO, 'password': CLAVE}),
+        'inventario': lambda azar: ('/inventario?' + urllib.parse.urlencode(
+            {'query': azar.choice(TERMINOS_INVENTARIO)}), None),
+        'buscar_cliente': lambda azar: ('/buscar_cliente?' + urllib.parse.urlencode(
+            {'q': azar.choice(TERMINOS_CLIENTES)}), None),
+        'clientes': lambda azar: ('/clientes', None),
+        'nueva_venta': venta,
+        'historial_ventas': lambda azar: ('/historial/ventas', None),
+        'historial_ventas_fechas': lambda azar: ('/historial/ventas?' + urllib.parse.urlencode(
+            {'fecha_inicio': hace_una_semana, 'fecha_fin': hoy.isoformat()}), None),
+        # Historial de un cliente: búsqueda por cédula en el historial general y la API con su resumen
+        'historial_cliente': lambda azar: ('/historial/ventas?' + urllib.parse.urlencode(
+            {'query': str(1000000 + azar.randint(1, args.clientes))}), None),
+        'historial_cliente_api': lambda azar: (
+            f"/api/clientes/{1000000 + azar.randint(1, args.clientes)}/historial", None),
+        'reporte_csv': lambda azar: ('/reportes/generar', {
+            'report_type': 'csv', 'start_date': hace_una_semana, 'end_date': hoy.isoformat()}),
+    }
+
+
+def iniciar_sesion(base):
+    """Inicia sesión una vez y devuelve las cookies, para compartirlas entre hilos."""
+    cookies = http.cookiejar.CookieJar()
+    datos = urllib.parse.urlencode({'username': USUARIO, 'password': CLAVE}).encode()
+    try:
+        cliente_http(cookies).open(base + '/login', datos)
+    except urllib.error.HTTPError as err:
+        if err.code != 302:
+            raise
+    return cookies
+
+
+def cliente_http(cookies):
+    return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies), SinRedirecciones())
+
+
+def _consultas_server_timing(cabeceras):
+    encontrado = re.search(r'(\d+) consultas', cabeceras.get('Server-Timing') or '')
+    return int(encontrado.group(1)) if encontrado else None
+
+
+def pedir(opener, base, ruta, datos):
+    """
+    Hace la petición (leyendo toda la respuesta) y devuelve el código de
+    estado, las consultas que dice la cabecera Server-Timing y la ruta a la
+    que redirige (o None).
+    """
+    cuerpo = urllib.parse.urlencode(datos).encode() if datos is not None else None
+    try:
+        with opener.open(base + ruta, cuerpo) as respuesta:
+            respuesta.read()
+            return respuesta.status, _consultas_server_timing(respuesta.headers), None
+    except urllib.error.HTTPError as err:
+        err.read()
+        destino = err.headers.get('Location')
+        return (err.code, _consultas_server_timing(err.headers),
+                urllib.parse.urlsplit(destino).path if destino else None)
+
+
+def consultas_ejecutadas(db):
+    """Total de sentencias según pg_stat_statements, o None si no está instalada."""
+    with db.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM pg_extension WHERE extname = 'pg_stat_statements'")
+        if not cursor.fetchone()[0]:
+            db.rollback()
+            return None
+        cursor.execute("SELECT sum(calls) FROM pg_stat_statements WHERE dbid = "
+                       "(SELECT oid FROM pg_database WHERE datname = current_database())")
+        total = cursor.fetchone()[0] or 0
+    db.rollback()
+    return total
+
+
+def ejecutar(base, generador, peticiones, concurrencia, semilla, destino_exito=None):
+    """
+    Lanza `peticiones` peticiones repartidas entre `concurrencia` hilos. Con
+    `destino_exito`, las respuestas que no redirigen ahí cuentan como
+    rechazadas (las de 4xx/5xx siguen contando como errores).
+    """
+    tiempos = []
+    errores = []
+    rechazadas = []
+    consultas = []
+    lock = threading.Lock()
+    restantes = [peticiones]
+    cookies = iniciar_sesion(base)
+    clientes = [cliente_http(cookies) for _ in range(concurrencia)]
+
+    def trabajador(numero):
+        azar = random.Random(semilla + numero)
+        while True:
+            with lock:
+                if restantes[0] <= 0:
+                    return
+                restantes[0] -= 1
+            ruta, datos = generador(azar)
+            inicio = time.perf_counter()
+            try:
+                estado, n_consultas, destino = pedir(clientes[numero], base, ruta, datos)
+            except OSError as err:
+                estado, n_consultas, destino = str(err), None, None
+            duracion = (time.perf_counter() - inicio) * 1000
+            with lock:
+                tiempos.append(duracion)
+                if n_consultas is not None:
+                    consultas.append(n_consultas)
+                if not isinstance(estado, int) or estado >= 400:
+                    errores.append(estado)
+                elif destino_exito is not None and destino != destino_exito:
+                    rechazadas.append(destino or estado)
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+    return tiempos, errores, rechazadas, consultas, segundos
+
+
+def servidor_local(url_db, esquema):
+    """Arranca la aplicación en un hilo con el servidor de werkzeug y devuelve su URL."""
+    separador = '&' if '?' in url_db else '?'
+    os.environ['DATABASE_URL'] = f"{url_db}{separador}options=-csearch_path%3D{esquema},public"
+    from werkzeug.serving import make_server
+    from app import app
+
+    # Sin una línea de log por petición
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    servidor = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_port}", servidor
+
+
+def imprimir_fila(nombre, r, anterior=None):
+    if not r['n']:
+        print(f"{nombre:<26} sin datos")
+        return
+    consultas = f"{r['consultas']:6.1f}" if r['consultas'] is not None else '     -'
+    linea = (f"{nombre:<26} {r['rps']:8.1f} {r['p50']:9.2f} {r['p95']:9.2f} {r['p99']:9.2f} "
+             f"{consultas} {r['errores']:6} {r.get('rechazadas', 0):7}")
+    if anterior and anterior.get('n'):
+        linea += (f"   p50 {(r['p50'] / anterior['p50'] - 1) * 100:+6.1f}%"
+                  f"  pet/s {(r['rps'] / anterior['rps'] - 1) * 100:+6.1f}%")
+    print(linea)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--esquema', default='bench_rutas')
+    parser.add_argument('--repoblar', action='store_true', help="vuelve a generar los datos")
+    parser.add_argument('--productos', type=int, default=10000)
+    parser.add_argument('--clientes', type=int, default=50000)
+    parser.add_argument('--ventas', type=int, default=200000)
+    parser.add_argument('--lineas', type=int, default=2, help="líneas de detalle por venta")
+    parser.add_argument('--url', help="servidor ya arrancado (por defecto, uno local en este proceso)")
+    parser.add_argument('--concurrencia', type=int, default=8)
+    parser.add_argument('--peticiones', type=int, default=400, help="peticiones por ruta")
+    parser.add_argument('--rutas', help="lista separada por comas (por defecto, todas)")
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--guardar', help="guarda los resultados en este JSON")
+    parser.add_argument('--comparar', help="JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    url_db = os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL')
+    db = conectar()
+    if args.repoblar or not esquema_poblado(db, args.esquema):
+        poblar(db, args.esquema, args)
+    else:
+        tamanos_poblados(db, args.esquema, args)
+
+    servidor = None
+    base = args.url
+    if base is None:
+        base, servidor = servidor_local(url_db, args.esquema)
+
+    todos = escenarios(args)
+    nombres = args.rutas.split(',') if args.rutas else list(todos)
+    anteriores = {}
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anteriores = json.load(f)['rutas']
+
+    resultados = {}
+    print(f"{'ruta':<26} {'pet/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'cons.':>6} {'errores':>6} "
+          f"{'rechaz.':>7}")
+    try:
+        for nombre in nombres:
+            antes = consultas_ejecutadas(db)
+            tiempos, errores, rechazadas, consultas, segundos = ejecutar(
+                base, todos[nombre], args.peticiones, args.concurrencia, args.semilla,
+                DESTINOS_EXITO.get(nombre))
+            despues = consultas_ejecutadas(db)
+            r = resumen(tiempos)
+            # Solo las peticiones que han hecho su trabajo cuentan como rendimiento
+            r['rps'] = (len(tiempos) - len(errores) - len(rechazadas)) / segundos
+            r['errores'] = len(errores)
+            r['rechazadas'] = len(rechazadas)
+            if antes is not None and tiempos:
+                r['consultas'] = (despues - antes) / len(tiempos)
+            else:
+                r['consultas'] = sum(consultas) / len(consultas) if consultas else None
+            resultados[nombre] = r
+            imprimir_fila(nombre, r, anteriores.get(nombre))
+            if errores:
+                print(f"    primeros errores: {errores[:3]}")
+            if rechazadas:
+                print(f"    rechazadas (redirigen a): {rechazadas[:3]}")
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+        db.close()
+
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': vars(args), 'rutas': resultados}, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
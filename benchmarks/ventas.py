@@ -0,0 +1,154 @@
+"""
+Ventas concurrentes contra los mismos productos: mide ventas/segundo y
+comprueba que no se vende más stock del que había.
+
+Compara registrar_venta() (número fijo de sentencias) con el método
+anterior de tres sentencias por línea, y con registrar_venta_idempotente()
+(clave por venta y reintentos) enviando dos veces una parte de las ventas
+(--repetidas), como un doble clic: ninguna debe registrarse dos veces.
+
+Uso: BENCH_DATABASE_URL=... python -m benchmarks.ventas --hilos 8 --ventas 200
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+
+import psycopg2
+import psycopg2.errors
+
+from benchmarks.comun import conectar, crear_tablas, esquema_temporal, poblar_clientes
+import resumenes
+import ventas
+from ventas import VentaRechazada, registrar_venta, registrar_venta_idempotente
+
+ESQUEMA = 'bench_ventas'
+
+
+def registrar_venta_por_linea(cursor, cliente_cedula, total_venta, metodo_pago, descripcion, productos_vendidos):
+    """Implementación anterior de nueva_venta(), como referencia."""
+    cursor.execute("SELECT id FROM clientes WHERE cedula = %s", (cliente_cedula,))
+    cliente_id = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO ventas (id_cliente, fecha, total, metodo_pago, descripcion) VALUES (%s, NOW(), %s, %s, %s) RETURNING id",
+                   (cliente_id, total_venta or 0, metodo_pago, descripcion))
+    venta_id = cursor.fetchone()[0]
+    for producto in productos_vendidos:
+        cursor.execute("SELECT cantidad FROM productos WHERE id = %s FOR UPDATE", (producto['id'],))
+        if cursor.fetchone()[0] < producto['cantidad']:
+            raise VentaRechazada("Sin stock")
+        cursor.execute("INSERT INTO detalle_ventas (id_venta, id_producto, cantidad, precio_unitario, descripcion) VALUES (%s, %s, %s, (SELECT precio FROM productos WHERE id = %s), %s)",
+                       (venta_id, producto['id'], producto['cantidad'], producto['id'], producto['descripcion_producto']))
+        cursor.execute("UPDATE productos SET cantidad = cantidad - %s WHERE id = %s", (producto['cantidad'], producto['id']))
+    return venta_id
+
+
+def preparar(db, productos, stock):
+    with db.cursor() as cursor:
+        cursor.execute("TRUNCATE detalle_ventas, ventas, productos RESTART IDENTITY CASCADE")
+        cursor.execute("""
+            INSERT INTO productos (nombre, categoria, color, precio, cantidad)
+            SELECT 'Producto ' || i, 'Sala', 'Negro', 100, %s FROM generate_series(1, %s) AS i
+        """, (stock, productos))
+    db.commit()
+
+
+def ejecutar(funcion, hilos, ventas_por_hilo, productos, lineas, repetidas=None):
+    """Con `repetidas` (fracción de ventas enviadas dos veces) `funcion` es registrar_venta_idempotente."""
+    resultados = {'ok': 0, 'sin_stock': 0, 'interbloqueos': 0, 'repetidas': 0}
+    lock = threading.Lock()
+
+    def trabajador(semilla):
+        azar = random.Random(semilla)
+        db = conectar()
+        db.cursor().execute(f"SET search_path TO {ESQUEMA}, public")
+        db.commit()
+        for _ in range(ventas_por_hilo):
+            # Orden aleatorio de las líneas: el caso que provoca interbloqueos
+            carrito = [{'id': azar.randint(1, productos), 'cantidad': azar.randint(1, 3),
+                        'descripcion_producto': ''} for _ in range(lineas)]
+            cedula = str(1000000 + azar.randint(1, 100))
+            clave = 'ok'
+            try:
+                if repetidas is None:
+                    with db.cursor() as cursor:
+                        funcion(cursor, cedula, None, 'Efectivo', '', carrito)
+                    db.commit()
+                else:
+                    clave_venta = uuid.uuid4().hex
+                    for _ in range(2 if azar.random() < repetidas else 1):
+                        _, nueva = funcion(db, clave_venta, 'benchmark', cedula, None, 'Efectivo', '', carrito)
+                        if not nueva:
+                            with lock:
+                                resultados['repetidas'] += 1
+            except VentaRechazada:
+                db.rollback()
+                clave = 'sin_stock'
+            except psycopg2.errors.DeadlockDetected:
+                db.rollback()
+                clave = 'interbloqueos'
+            with lock:
+                resultados[clave] += 1
+        db.close()
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    resultados['segundos'] = time.perf_counter() - inicio
+    return resultados
+
+
+def comprobar_stock(db, stock):
+    with db.cursor() as cursor:
+        cursor.execute("""
+            SELECT count(*) FILTER (WHERE p.cantidad < 0),
+                   count(*) FILTER (WHERE p.cantidad + coalesce(v.vendido, 0) <> %s)
+            FROM productos p
+            LEFT JOIN (SELECT id_producto, sum(cantidad) AS vendido
+                       FROM detalle_ventas GROUP BY id_producto) v ON v.id_producto = p.id
+        """, (stock,))
+        negativos, descuadrados = cursor.fetchone()
+    db.rollback()
+    return negativos, descuadrados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--ventas', type=int, default=200, help="ventas por hilo")
+    parser.add_argument('--productos', type=int, default=20, help="productos disputados")
+    parser.add_argument('--lineas', type=int, default=10, help="líneas por venta")
+    parser.add_argument('--stock', type=int, default=2000)
+    parser.add_argument('--repetidas', type=float, default=0.1, help="fracción de ventas enviadas dos veces")
+    args = parser.parse_args()
+
+    db = conectar()
+    try:
+        with esquema_temporal(db, ESQUEMA):
+            crear_tablas(db)
+            ventas.crear_tablas(db)
+            resumenes.crear_tablas(db)
+            poblar_clientes(db, 100)
+            for nombre, funcion, repetidas in (('por línea (anterior)', registrar_venta_por_linea, None),
+                                               ('por lotes', registrar_venta, None),
+                                               ('idempotente', registrar_venta_idempotente, args.repetidas)):
+                preparar(db, args.productos, args.stock)
+                r = ejecutar(funcion, args.hilos, args.ventas, args.productos, args.lineas, repetidas)
+                negativos, descuadrados = comprobar_stock(db, args.stock)
+                with db.cursor() as cursor:
+                    cursor.execute("SELECT count(*) FROM ventas")
+                    registradas = cursor.fetchone()[0]
+                db.rollback()
+                print(f"{nombre:<22} {r['ok'] / r['segundos']:8.1f} ventas/s  ok={r['ok']} "
+                      f"sin_stock={r['sin_stock']} interbloqueos={r['interbloqueos']} "
+                      f"repetidas={r['repetidas']} ventas_de_más={registradas - r['ok']} "
+                      f"stock_negativo={negativos} descuadres={descuadrados}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
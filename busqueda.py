@@ -0,0 +1,162 @@
+import re
+import sys
+
+import psycopg2
+import psycopg2.errors
+
+# Índices que permiten resolver las búsquedas ILIKE '%texto%' con pg_trgm
+# en lugar de recorrer las tablas completas, más índices btree para las
+# búsquedas por prefijo (cédula y nombre en el autocompletado).
+INDICES_BUSQUEDA = [
+    ("idx_productos_nombre_trgm", "productos USING gin (nombre gin_trgm_ops)"),
+    ("idx_productos_categoria_trgm", "productos USING gin (categoria gin_trgm_ops)"),
+    ("idx_productos_color_trgm", "productos USING gin (color gin_trgm_ops)"),
+    ("idx_clientes_nombre_trgm", "clientes USING gin (nombre gin_trgm_ops)"),
+    ("idx_clientes_cedula_trgm", "clientes USING gin (cedula gin_trgm_ops)"),
+    ("idx_clientes_telefono_trgm", "clientes USING gin (telefono gin_trgm_ops)"),
+    ("idx_clientes_direccion_trgm", "clientes USING gin (direccion gin_trgm_ops)"),
+]
+# Los de prefijo son btree normales: no dependen de pg_trgm
+INDICES_PREFIJO = [
+    ("idx_clientes_cedula_prefijo", "clientes (cedula text_pattern_ops)"),
+    ("idx_clientes_nombre_prefijo", "clientes (lower(nombre) text_pattern_ops)"),
+]
+INDICES_BUSQUEDA += INDICES_PREFIJO
+
+# pg_trgm no puede usar el índice con menos de 3 caracteres
+MINIMO_TRIGRAMA = 3
+
+# Se desactiva el orden por similitud si la extensión pg_trgm no existe
+_pg_trgm_disponible = True
+
+
+def crear_indices_busqueda(db, concurrente=False):
+    """
+    Crea la extensión pg_trgm y los índices de búsqueda si no existen.
+    Con `concurrente=True` se usa CREATE INDEX CONCURRENTLY para no bloquear
+    las escrituras en producción (requiere autocommit).
+    """
+    autocommit_anterior = db.autocommit
+    db.autocommit = concurrente
+    try:
+        with db.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            modo = "CONCURRENTLY " if concurrente else ""
+            for nombre, definicion in INDICES_BUSQUEDA:
+                cursor.execute(f"CREATE INDEX {modo}IF NOT EXISTS {nombre} ON {definicion}")
+        if not concurrente:
+            db.commit()
+    except psycopg2.Error:
+        # Sin deshacer no se puede volver a cambiar el autocommit
+        if not concurrente:
+            db.rollback()
+        raise
+    finally:
+        db.autocommit = autocommit_anterior
+
+
+def escapar_like(texto):
+    """Escapa los comodines de LIKE para que el texto del usuario se busque literal."""
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def es_cedula(texto):
+    """True si el texto parece una cédula (solo dígitos, puntos o guiones)."""
+    return bool(re.fullmatch(r'[0-9][0-9.\-]*', texto))
+
+
+def condicion_productos(query):
+    patron = f"%{escapar_like(query)}%"
+    return "(nombre ILIKE %s OR categoria ILIKE %s OR color ILIKE %s)", [patron] * 3
+
+
+def condicion_clientes(query):
+    patron = f"%{escapar_like(query)}%"
+    return ("(nombre ILIKE %s OR cedula ILIKE %s OR telefono ILIKE %s OR direccion ILIKE %s)",
+            [patron] * 4)
+
+
+def condicion_cliente_venta(query, alias='c'):
+    """
+    Filtro de cliente para el historial de ventas: una cédula usa la búsqueda
+    por prefijo (índice btree), el resto busca por nombre o cédula con pg_trgm.
+    """
+    if es_cedula(query):
+        return f"{alias}.cedula LIKE %s", [f"{escapar_like(query)}%"]
+    patron = f"%{escapar_like(query)}%"
+    return f"({alias}.nombre ILIKE %s OR {alias}.cedula ILIKE %s)", [patron, patron]
+
+
+def buscar_clientes(cursor, q, limite=10):
+    """
+    Autocompletado de clientes ordenado por relevancia. Devuelve filas
+    (cedula, nombre).
+
+    - Cédula: coincidencia exacta primero y luego por prefijo.
+    - Texto corto: prefijo del nombre, en el orden de idx_clientes_nombre_prefijo
+      (~<~ es el orden de text_pattern_ops) para leer solo las primeras filas.
+    - Resto: ILIKE con índice trigram, primero los nombres que empiezan por
+      el texto y luego por similitud de palabra.
+    """
+    q = q.strip()
+    if not q:
+        return []
+
+    prefijo = f"{escapar_like(q)}%"
+    if es_cedula(q):
+        cursor.execute("""
+            SELECT cedula, nombre FROM clientes
+            WHERE cedula LIKE %s
+            ORDER BY cedula = %s DESC, cedula
+            LIMIT %s
+        """, (prefijo, q, limite))
+        filas = cursor.fetchall()
+        if filas:
+            return filas
+
+    if len(q) < MINIMO_TRIGRAMA:
+        cursor.execute("""
+            SELECT cedula, nombre FROM clientes
+            WHERE lower(nombre) LIKE lower(%s)
+            ORDER BY lower(nombre) USING ~<~
+            LIMIT %s
+        """, (prefijo, limite))
+        return cursor.fetchall()
+
+    global _pg_trgm_disponible
+    patron = f"%{escapar_like(q)}%"
+    if _pg_trgm_disponible:
+        try:
+            cursor.execute("""
+                SELECT cedula, nombre FROM clientes
+                WHERE nombre ILIKE %s OR cedula ILIKE %s
+                ORDER BY lower(nombre) LIKE lower(%s) DESC,
+                         word_similarity(%s, nombre) DESC,
+                         nombre
+                LIMIT %s
+            """, (patron, patron, prefijo, q, limite))
+            return cursor.fetchall()
+        except psycopg2.errors.UndefinedFunction:
+            # Falta la extensión pg_trgm (no se ha ejecutado busqueda.py)
+            print("pg_trgm no está instalada; el autocompletado se ordena solo por prefijo y nombre.")
+            cursor.connection.rollback()
+            _pg_trgm_disponible = False
+
+    cursor.execute("""
+        SELECT cedula, nombre FROM clientes
+        WHERE nombre ILIKE %s OR cedula ILIKE %s
+        ORDER BY lower(nombre) LIKE lower(%s) DESC, nombre
+        LIMIT %s
+    """, (patron, patron, prefijo, limite))
+    return cursor.fetchall()
+
+
+if __name__ == '__main__':
+    # Uso: python busqueda.py [--concurrente]
+    from app import obtener_database_url
+    db = psycopg2.connect(obtener_database_url())
+    try:
+        crear_indices_busqueda(db, concurrente='--concurrente' in sys.argv)
+        print("Índices de búsqueda creados.")
+    finally:
+        db.close()
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Respuestas más pequeñas que esto (en bytes) se envían sin comprimir
+COMPRESION_MINIMO = int(os.environ.get('COMPRESION_MINIMO', 1024))
+# Nivel de gzip (1-9) y calidad de brotli (0-11): valores moderados, porque
+# las páginas se comprimen en cada petición
+GZIP_NIVEL = int(os.environ.get('COMPRESION_GZIP_NIVEL', 6))
+BROTLI_CALIDAD = int(os.environ.get('COMPRESION_BROTLI_CALIDAD', 5))
+
+COMPRIMIBLES = {'text/html', 'text/plain', 'text/css', 'text/csv', 'application/json',
+                'application/javascript', 'text/javascript', 'image/svg+xml'}
+
+# Los recursos con huella (?v=...) no cambian nunca: el navegador los guarda un año
+CACHE_RECURSOS = 'public, max-age=31536000, immutable'
+
+_lock = threading.Lock()
+_huellas = {}           # ruta -> (mtime, huella)
+_estaticos = {}         # (ruta, mtime, codificación) -> cuerpo comprimido
+
+
+def huella(ruta):
+    """Primeros caracteres del sha256 del archivo; se recalcula solo si cambia su mtime."""
+    mtime = os.stat(ruta).st_mtime_ns
+    with _lock:
+        guardada = _huellas.get(ruta)
+    if guardada and guardada[0] == mtime:
+        return guardada[1]
+    with open(ruta, 'rb') as f:
+        valor = hashlib.sha256(f.read()).hexdigest()[:12]
+    with _lock:
+        _huellas[ruta] = (mtime, valor)
+    return valor
+
+
+def huella_carpeta(carpeta):
+    """Huella del contenido de todos los archivos de `carpeta` (p. ej. las plantillas), una vez por proceso."""
+    with _lock:
+        guardada = _huellas.get(carpeta)
+    if guardada:
+        return guardada[1]
+    suma = hashlib.sha256()
+    for raiz, _, archivos in sorted(os.walk(carpeta)):
+        for nombre in sorted(archivos):
+            ruta = os.path.join(raiz, nombre)
+            suma.update(os.path.relpath(ruta, carpeta).encode('utf-8'))
+            with open(ruta, 'rb') as f:
+                suma.update(f.read())
+    valor = suma.hexdigest()[:12]
+    with _lock:
+        _huellas[carpeta] = (None, valor)
+    return valor
+
+
+def _codificacion(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def _comprimir(datos, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=BROTLI_CALIDAD)
+    return gzip.compress(datos, compresslevel=GZIP_NIVEL)
+
+
+def comprimir(request, response, ruta_estatico=None):
+    """
+    Comprime la respuesta con brotli (si está instalado) o gzip según
+    Accept-Encoding, si su tipo lo merece y supera COMPRESION_MINIMO.
+
+    Las respuestas en streaming (reportes) se dejan como están. Los archivos
+    estáticos (`ruta_estatico`) se comprimen una vez y se guardan en memoria.
+    """
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRIMIBLES):
+        return response
+    response.vary.add('Accept-Encoding')
+    codificacion = _codificacion(request.accept_encodings)
+    if codificacion is None:
+        return response
+
+    if ruta_estatico is not None:
+        if response.content_length is not None and response.content_length < COMPRESION_MINIMO:
+            return response
+        clave = (ruta_estatico, os.stat(ruta_estatico).st_mtime_ns, codificacion)
+        with _lock:
+            cuerpo = _estaticos.get(clave)
+        if cuerpo is None:
+            with open(ruta_estatico, 'rb') as f:
+                cuerpo = _comprimir(f.read(), codificacion)
+            with _lock:
+                _estaticos[clave] = cuerpo
+        response.direct_passthrough = False
+    else:
+        if response.is_streamed or response.direct_passthrough:
+            return response
+        datos = response.get_data()
+        if len(datos) < COMPRESION_MINIMO:
+            return response
+        cuerpo = _comprimir(datos, codificacion)
+
+    response.set_data(cuerpo)
+    response.headers['Content-Encoding'] = codificacion
+    # La representación comprimida no es idéntica byte a byte a la original
+    etag, debil = response.get_etag()
+    if etag and not debil:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,52 @@
+import json
+import threading
+
+import versiones
+
+
+class CacheCatalogo:
+    """
+    Catálogo de productos para el formulario de venta, ya serializado a JSON.
+
+    Cada petición solo lee el número de versión; los productos se vuelven a
+    leer de la base de datos cuando otra escritura (de cualquier worker) ha
+    incrementado la versión.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.cuerpo = None
+
+    def obtener(self, db):
+        """Devuelve (version, cuerpo_json) recargando los productos solo si cambió la versión."""
+        version, = versiones.leer(db, ['productos'])
+        with self._lock:
+            if self.version == version:
+                return self.version, self.cuerpo
+
+        with db.cursor() as cursor:
+            cursor.execute("SELECT id, nombre, precio, cantidad FROM productos ORDER BY nombre")
+            productos = [
+                {'id': fila[0], 'nombre': fila[1], 'precio': float(fila[2]), 'cantidad': fila[3]}
+                for fila in cursor.fetchall()
+            ]
+        cuerpo = json.dumps({'version': version, 'productos': productos},
+                            ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self.version = version
+            self.cuerpo = cuerpo
+        return version, cuerpo
+
+    def invalidar(self, db, *otros):
+        """
+        Incrementa la versión después del commit de una escritura en productos
+        (ver versiones.incrementar). `otros` son más versiones que la misma
+        escritura cambia (p. ej. 'ventas'), incrementadas en la misma consulta.
+        """
+        with self._lock:
+            self.version = None
+        versiones.incrementar(db, 'productos', *otros)
+
+
+cache_catalogo = CacheCatalogo()
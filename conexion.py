@@ -1,5 +1,11 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import urllib.parse
 
 def conectar():
@@ -11,3 +17,282 @@ def conectar():
 
     # Conéctate usando la URL
     return psycopg2.connect(url)
+
+
+# --- POOL DE CONEXIONES ---
+
+class PoolAgotado(psycopg2.pool.PoolError):
+    """
+    Se lanza cuando no se libera ninguna conexión dentro del tiempo de espera.
+    Hereda de psycopg2.Error para que las rutas la traten como un error de base de datos.
+    """
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones PostgreSQL por proceso (un pool por worker de gunicorn).
+
+    Mantiene entre `minconn` y `maxconn` conexiones abiertas, comprueba que
+    siguen vivas al entregarlas, las recicla tras `max_usos` préstamos o
+    `max_edad` segundos y las devuelve limpias (sin transacción abierta y con
+    autocommit desactivado) para que el siguiente uso no herede estado.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10.0,
+                 max_usos=1000, max_edad=1800.0, chequeo_inactiva=30.0, connection_factory=None):
+        self.dsn = dsn
+        self.connection_factory = connection_factory
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_usos = max_usos
+        self.max_edad = max_edad
+        self.chequeo_inactiva = chequeo_inactiva
+        self.pid = os.getpid()
+
+        self._libres = []       # [(conn, devuelta_en)]
+        self._info = {}         # id(conn) -> {'creada': t, 'usos': n}
+        self._en_uso = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'prestamos': 0,
+            'esperas': 0,
+            'tiempo_espera': 0.0,
+            'timeouts': 0,
+            'creadas': 0,
+            'recicladas': 0,
+            'descartadas': 0,
+            'fallos_chequeo': 0,
+        }
+
+        for _ in range(minconn):
+            conn = self._conectar()
+            self._registrar(conn)
+            self._libres.append((conn, time.monotonic()))
+
+    def _conectar(self):
+        return psycopg2.connect(self.dsn, connection_factory=self.connection_factory)
+
+    def _registrar(self, conn):
+        self._info[id(conn)] = {'creada': time.monotonic(), 'usos': 0}
+        self._stats['creadas'] += 1
+
+    def _cerrar(self, conn):
+        self._info.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _caducada(self, conn):
+        info = self._info.get(id(conn))
+        if info is None:
+            return True
+        if self.max_usos and info['usos'] >= self.max_usos:
+            return True
+        if self.max_edad and time.monotonic() - info['creada'] >= self.max_edad:
+            return True
+        return False
+
+    def _viva(self, conn, inactiva_desde):
+        if conn.closed:
+            return False
+        # Solo se hace ping si la conexión lleva un rato sin usarse
+        if time.monotonic() - inactiva_desde < self.chequeo_inactiva:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reservar(self, inicio, espero):
+        """
+        Reserva un hueco del pool (cuenta en `_en_uso`) con el lock tomado.
+        Devuelve (conexión libre o None si hay que abrir una, cuándo se
+        devolvió, espero, conexiones caducadas que hay que cerrar).
+        """
+        caducadas = []
+        with self._cond:
+            while True:
+                while self._libres:
+                    conn, devuelta_en = self._libres.pop()
+                    if self._caducada(conn):
+                        self._stats['recicladas'] += 1
+                        self._info.pop(id(conn), None)
+                        caducadas.append(conn)
+                        continue
+                    self._en_uso += 1
+                    return conn, devuelta_en, espero, caducadas
+
+                if self._en_uso < self.maxconn:
+                    self._en_uso += 1
+                    return None, None, espero, caducadas
+
+                restante = self.timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolAgotado(
+                        f"No hay conexiones disponibles tras {self.timeout} segundos "
+                        f"({self.maxconn} en uso)."
+                    )
+                if not espero:
+                    espero = True
+                    self._stats['esperas'] += 1
+                self._cond.wait(restante)
+
+    def _liberar_hueco(self, conn=None, estadistica=None):
+        """Deshace una reserva de _reservar (conexión que no se llega a prestar)."""
+        with self._cond:
+            self._en_uso -= 1
+            if conn is not None:
+                self._info.pop(id(conn), None)
+            if estadistica:
+                self._stats[estadistica] += 1
+            self._cond.notify()
+
+    def obtener(self):
+        """
+        Presta una conexión del pool, esperando como máximo `timeout` segundos.
+
+        El lock solo se toma para reservar el hueco y apuntar el préstamo:
+        abrir una conexión o hacer ping a una inactiva se hace fuera, para
+        que una base de datos lenta o caída no frene los demás préstamos y
+        devoluciones del worker.
+        """
+        inicio = time.monotonic()
+        espero = False
+        while True:
+            conn, devuelta_en, espero, caducadas = self._reservar(inicio, espero)
+            for vieja in caducadas:
+                try:
+                    vieja.close()
+                except psycopg2.Error:
+                    pass
+
+            if conn is None:
+                try:
+                    conn = self._conectar()
+                except BaseException:
+                    self._liberar_hueco()
+                    raise
+                with self._cond:
+                    self._registrar(conn)
+                    return self._prestar(conn, inicio, espero)
+
+            if self._viva(conn, devuelta_en):
+                with self._cond:
+                    return self._prestar(conn, inicio, espero)
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+            self._liberar_hueco(conn, 'fallos_chequeo')
+
+    def _prestar(self, conn, inicio, espero):
+        # El hueco ya lo ha contado _reservar en _en_uso
+        self._info[id(conn)]['usos'] += 1
+        self._stats['prestamos'] += 1
+        if espero:
+            self._stats['tiempo_espera'] += time.monotonic() - inicio
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        """Devuelve una conexión al pool dejándola sin transacción y en modo por defecto."""
+        if not descartar and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                descartar = True
+
+        with self._cond:
+            self._en_uso -= 1
+            if descartar or conn.closed:
+                self._stats['descartadas'] += 1
+                self._cerrar(conn)
+            elif self._caducada(conn):
+                self._stats['recicladas'] += 1
+                self._cerrar(conn)
+            else:
+                self._libres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def conexion(self):
+        conn = self.obtener()
+        descartar = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # La conexión puede haber quedado rota; no se reutiliza
+            descartar = True
+            raise
+        finally:
+            self.devolver(conn, descartar=descartar)
+
+    def estadisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['en_uso'] = self._en_uso
+            stats['libres'] = len(self._libres)
+            stats['minconn'] = self.minconn
+            stats['maxconn'] = self.maxconn
+        return stats
+
+    def cerrar_todo(self):
+        with self._cond:
+            while self._libres:
+                conn, _ = self._libres.pop()
+                self._cerrar(conn)
+
+
+# Un pool por URL (primario y réplicas de lectura, ver replicas.py)
+_pools = {}
+_pools_pid = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool(dsn, connection_factory=None):
+    """
+    Devuelve el pool de `dsn` del proceso actual, creándolo si hace falta.
+    Si el proceso es un fork (worker de gunicorn) se crean pools nuevos,
+    porque las conexiones heredadas del padre no se pueden compartir.
+    `connection_factory` (la clase de las conexiones) solo se usa al crearlo.
+    """
+    global _pools_pid
+    with _pool_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(dsn)
+    if pool is not None:
+        return pool
+    # Se crea fuera del lock: abrir las conexiones iniciales de una réplica
+    # caída no debe frenar a las peticiones que usan los demás pools
+    pool = PoolConexiones(
+        dsn,
+        minconn=int(os.environ.get('DB_POOL_MIN', 1)),
+        maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+        timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        max_usos=int(os.environ.get('DB_POOL_MAX_USOS', 1000)),
+        max_edad=float(os.environ.get('DB_POOL_MAX_EDAD', 1800)),
+        chequeo_inactiva=float(os.environ.get('DB_POOL_CHEQUEO', 30)),
+        connection_factory=connection_factory,
+    )
+    with _pool_lock:
+        existente = _pools.setdefault(dsn, pool)
+    if existente is not pool:
+        pool.cerrar_todo()
+    return existente
+
+
+def estadisticas_pool(dsn):
+    """Estadísticas del pool de `dsn` del proceso actual (vacío si aún no se ha creado)."""
+    if _pools_pid != os.getpid() or dsn not in _pools:
+        return {}
+    return _pools[dsn].estadisticas()
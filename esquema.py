@@ -0,0 +1,256 @@
+import sys
+
+import psycopg2
+import psycopg2.errors
+
+import busqueda
+import movimientos
+import resumenes
+import ventas
+import versiones
+
+# Tablas que usa la aplicación. Todo es idempotente (IF NOT EXISTS) y se
+# puede volver a ejecutar. Sobre una base de datos con datos, las columnas
+# con nulos y los índices únicos con filas duplicadas se saltan con un aviso
+# (hay que corregir esas filas y volver a ejecutarlo), y en producción
+# conviene usar --concurrente para no bloquear las escrituras.
+SQL_TABLAS = [
+    """
+    CREATE TABLE IF NOT EXISTS usuarios (
+        id SERIAL PRIMARY KEY,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        rol TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS productos (
+        id SERIAL PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        color TEXT NOT NULL,
+        precio NUMERIC(12, 2) NOT NULL,
+        cantidad INTEGER NOT NULL,
+        descripcion TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS clientes (
+        id SERIAL PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        cedula TEXT NOT NULL,
+        telefono TEXT,
+        direccion TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ventas (
+        id SERIAL PRIMARY KEY,
+        id_cliente INTEGER NOT NULL REFERENCES clientes (id),
+        fecha TIMESTAMP NOT NULL DEFAULT NOW(),
+        total NUMERIC(12, 2) NOT NULL,
+        metodo_pago TEXT,
+        descripcion TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS detalle_ventas (
+        id SERIAL PRIMARY KEY,
+        id_venta INTEGER NOT NULL REFERENCES ventas (id),
+        id_producto INTEGER NOT NULL REFERENCES productos (id),
+        cantidad INTEGER NOT NULL,
+        precio_unitario NUMERIC(12, 2) NOT NULL,
+        descripcion TEXT
+    )
+    """,
+]
+
+# Columnas que las consultas dan por no nulas (orden del keyset, joins,
+# totales). En una base de datos creada antes de este módulo se imponen con
+# ALTER TABLE (ver _imponer_no_nulas); las que tienen nulos se saltan.
+COLUMNAS_NO_NULAS = [
+    ('usuarios', 'username'), ('usuarios', 'password'), ('usuarios', 'rol'),
+    ('productos', 'nombre'), ('productos', 'categoria'), ('productos', 'precio'), ('productos', 'cantidad'),
+    ('clientes', 'nombre'), ('clientes', 'cedula'),
+    ('ventas', 'id_cliente'), ('ventas', 'fecha'), ('ventas', 'total'),
+    ('detalle_ventas', 'id_venta'), ('detalle_ventas', 'id_producto'),
+    ('detalle_ventas', 'cantidad'), ('detalle_ventas', 'precio_unitario'),
+]
+
+# Índices de las columnas por las que filtran, ordenan y unen las rutas
+INDICES = [
+    # Login
+    ("idx_usuarios_username", "UNIQUE", "usuarios (username)"),
+    # Búsqueda por cédula (nueva venta, autocompletado) y unicidad
+    ("idx_clientes_cedula", "UNIQUE", "clientes (cedula)"),
+    # Orden de los listados paginados (keyset)
+    ("idx_productos_orden", "", "productos (categoria, nombre, id)"),
+    ("idx_clientes_orden", "", "clientes (nombre, id)"),
+    # Importación masiva: los productos se identifican por nombre y color
+    ("idx_productos_nombre_color", "", "productos (nombre, color)"),
+    # Historial y reportes por fecha; id desempata el keyset
+    ("idx_ventas_fecha", "", "ventas (fecha DESC, id DESC)"),
+    # Ventas de un cliente (historial paginado por fecha e id) y comprobación
+    # de la FK al borrar clientes
+    ("idx_ventas_cliente_orden", "", "ventas (id_cliente, fecha DESC, id DESC)"),
+    # Detalle de un lote de ventas y FK al borrar productos
+    ("idx_detalle_ventas_id_venta", "", "detalle_ventas (id_venta)"),
+    ("idx_detalle_ventas_id_producto", "", "detalle_ventas (id_producto)"),
+]
+
+# Índices sustituidos por otros de INDICES; se borran después de crear los nuevos
+INDICES_REEMPLAZADOS = [
+    "idx_ventas_id_cliente",  # por idx_ventas_cliente_orden
+]
+
+
+def _imponer_no_nulas(db):
+    """
+    Impone COLUMNAS_NO_NULAS sin recorrer las tablas con el bloqueo
+    exclusivo de SET NOT NULL: primero un CHECK NOT VALID, que se valida
+    con un bloqueo que no impide leer ni escribir, y después SET NOT NULL,
+    que con el CHECK ya validado no vuelve a recorrer la tabla. Las columnas
+    con nulos se saltan con un aviso.
+    """
+    for tabla, columna in COLUMNAS_NO_NULAS:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT attnotnull FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = %s",
+                           (tabla, columna))
+            if cursor.fetchone()[0]:
+                db.rollback()
+                continue
+            cursor.execute(f"SELECT count(*) FROM {tabla} WHERE {columna} IS NULL")
+            nulos = cursor.fetchone()[0]
+        db.rollback()
+        if nulos:
+            print(f"No se impone NOT NULL en {tabla}.{columna}: hay {nulos} filas con nulos. "
+                  f"Corrígelas y vuelve a ejecutar esquema.py.")
+            continue
+
+        restriccion = f"{tabla}_{columna}_no_nulo"
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {tabla} DROP CONSTRAINT IF EXISTS {restriccion}")
+                cursor.execute(f"ALTER TABLE {tabla} ADD CONSTRAINT {restriccion} "
+                               f"CHECK ({columna} IS NOT NULL) NOT VALID")
+            db.commit()
+            with db.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {tabla} VALIDATE CONSTRAINT {restriccion}")
+                cursor.execute(f"ALTER TABLE {tabla} ALTER COLUMN {columna} SET NOT NULL")
+                cursor.execute(f"ALTER TABLE {tabla} DROP CONSTRAINT {restriccion}")
+            db.commit()
+        except psycopg2.errors.CheckViolation:
+            # Se han insertado nulos después de contarlos
+            db.rollback()
+            with db.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {tabla} DROP CONSTRAINT IF EXISTS {restriccion}")
+            db.commit()
+            print(f"No se impone NOT NULL en {tabla}.{columna}: hay filas con nulos. "
+                  f"Corrígelas y vuelve a ejecutar esquema.py.")
+
+
+def _duplicados(cursor, definicion):
+    """Hasta 5 valores repetidos (con cuántas filas tienen) de las columnas de `definicion`."""
+    tabla, columnas = definicion.split(' ', 1)
+    columnas = columnas.strip('()')
+    cursor.execute(f"SELECT {columnas}, count(*) FROM {tabla} GROUP BY {columnas} "
+                   f"HAVING count(*) > 1 ORDER BY count(*) DESC LIMIT 5")
+    return cursor.fetchall()
+
+
+def _describir(duplicado):
+    *valores, filas = duplicado
+    return f"{', '.join(map(str, valores))}: {filas} filas"
+
+
+def _crear_indices(cursor, indices, concurrente):
+    modo = "CONCURRENTLY " if concurrente else ""
+    for nombre, tipo, definicion in indices:
+        # Un CREATE INDEX CONCURRENTLY fallido deja el índice marcado como no
+        # válido, y IF NOT EXISTS no lo volvería a crear
+        cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (nombre,))
+        fila = cursor.fetchone()
+        if fila and fila[0]:
+            continue
+        if fila:
+            cursor.execute(f"DROP INDEX {modo}IF EXISTS {nombre}")
+        if tipo != "UNIQUE":
+            cursor.execute(f"CREATE {tipo} INDEX {modo}IF NOT EXISTS {nombre} ON {definicion}")
+            continue
+
+        duplicados = _duplicados(cursor, definicion)
+        if duplicados:
+            print(f"No se crea el índice único {nombre}: hay valores repetidos en {definicion} "
+                  f"({'; '.join(_describir(fila) for fila in duplicados)}). "
+                  f"Corrígelos y vuelve a ejecutar esquema.py.")
+            continue
+        if not concurrente:
+            cursor.execute("SAVEPOINT indice_unico")
+        try:
+            cursor.execute(f"CREATE UNIQUE INDEX {modo}IF NOT EXISTS {nombre} ON {definicion}")
+        except psycopg2.errors.UniqueViolation:
+            # Se han insertado repetidos después de comprobarlo
+            if concurrente:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}")
+            else:
+                cursor.execute("ROLLBACK TO SAVEPOINT indice_unico")
+            print(f"No se crea el índice único {nombre}: hay valores repetidos en {definicion}. "
+                  f"Corrígelos y vuelve a ejecutar esquema.py.")
+
+
+def crear_esquema(db, concurrente=False, busqueda_trigramas=True):
+    """
+    Crea tablas, restricciones NOT NULL (ver _imponer_no_nulas), índices
+    (los de esta lista y los de busqueda.py; los únicos se saltan si hay
+    filas repetidas), tablas de resúmenes (diarios y por cliente), de
+    movimientos de inventario y de claves de las ventas, y las secuencias
+    de versión de los datos. Borra los índices de INDICES_REEMPLAZADOS.
+
+    Con `concurrente=True` los índices se crean con CONCURRENTLY para no
+    bloquear las escrituras en producción. Si la extensión pg_trgm no se
+    puede instalar, los índices de búsqueda se omiten con un aviso.
+    """
+    with db.cursor() as cursor:
+        for sql in SQL_TABLAS + resumenes.SQL_TABLAS + movimientos.SQL_TABLAS + ventas.SQL_TABLAS:
+            cursor.execute(sql)
+    db.commit()
+    _imponer_no_nulas(db)
+    versiones.crear_secuencias(db)
+
+    # CREATE INDEX CONCURRENTLY no puede ir dentro de una transacción
+    autocommit_anterior = db.autocommit
+    db.autocommit = concurrente
+    try:
+        with db.cursor() as cursor:
+            _crear_indices(cursor, INDICES, concurrente)
+            _crear_indices(cursor, [(nombre, "", definicion) for nombre, definicion in busqueda.INDICES_PREFIJO],
+                           concurrente)
+            for nombre in INDICES_REEMPLAZADOS:
+                cursor.execute(f"DROP INDEX {'CONCURRENTLY ' if concurrente else ''}IF EXISTS {nombre}")
+        if not concurrente:
+            db.commit()
+    except psycopg2.Error:
+        if not concurrente:
+            db.rollback()
+        raise
+    finally:
+        db.autocommit = autocommit_anterior
+
+    if busqueda_trigramas:
+        try:
+            busqueda.crear_indices_busqueda(db, concurrente=concurrente)
+        except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.UndefinedFile,
+                psycopg2.errors.InsufficientPrivilege) as err:
+            print(f"No se crearon los índices de búsqueda (pg_trgm no disponible): {err}")
+
+
+if __name__ == '__main__':
+    # Uso: python esquema.py [--concurrente] [--sin-trigramas]
+    from app import obtener_database_url
+    db = psycopg2.connect(obtener_database_url())
+    try:
+        crear_esquema(db, concurrente='--concurrente' in sys.argv,
+                      busqueda_trigramas='--sin-trigramas' not in sys.argv)
+        print("Esquema de la base de datos actualizado.")
+    finally:
+        db.close()
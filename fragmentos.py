@@ -0,0 +1,104 @@
+import os
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+# Límites de la caché de fragmentos de cada worker
+MAX_ENTRADAS = int(os.environ.get('FRAGMENTOS_MAX_ENTRADAS', 20000))
+MAX_BYTES = int(float(os.environ.get('FRAGMENTOS_MAX_MB', 32)) * 1024 * 1024)
+
+
+class CacheFragmentos:
+    """
+    HTML ya renderizado de filas y bloques de los listados, con expulsión
+    LRU por número de entradas y por tamaño total.
+
+    Las filas se guardan con la clave (tipo, id, versión, variante): la
+    versión es el xmin de la fila, que PostgreSQL cambia en cada UPDATE, así
+    que una fila modificada por otro worker (o por una venta) simplemente no
+    se encuentra. invalidar() además libera en el acto las de este worker.
+    """
+
+    def __init__(self, max_entradas=MAX_ENTRADAS, max_bytes=MAX_BYTES):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()      # clave -> Markup
+        self._por_registro = {}             # (tipo, id) -> claves de sus filas
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            html = self._entradas.get(clave)
+            if html is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return html
+
+    def guardar(self, clave, html, registro=None):
+        """`registro` = (tipo, id) si el fragmento es una fila, para poder invalidarla."""
+        html = Markup(html)
+        tamano = len(html)
+        if tamano > self.max_bytes:
+            return html
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = html
+            self.bytes += tamano
+            if registro is not None:
+                self._por_registro.setdefault(registro, set()).add(clave)
+            while len(self._entradas) > self.max_entradas or self.bytes > self.max_bytes:
+                self._quitar(next(iter(self._entradas)))
+                self.expulsiones += 1
+        return html
+
+    def fila(self, tipo, fila, variante, renderizar):
+        """HTML de la fila `fila` (con 'id' y 'version'), renderizándola con renderizar() si no está."""
+        clave = ('fila', tipo, fila['id'], fila['version'], variante)
+        html = self.obtener(clave)
+        if html is None:
+            html = self.guardar(clave, renderizar(), registro=(tipo, fila['id']))
+        return html
+
+    def invalidar(self, tipo, registro_id):
+        """Olvida todas las versiones de la fila `registro_id` (tras editarla o borrarla)."""
+        with self._lock:
+            for clave in self._por_registro.pop((tipo, int(registro_id)), ()):
+                if clave in self._entradas:
+                    self._quitar(clave, olvidar=False)
+
+    def _quitar(self, clave, olvidar=True):
+        html = self._entradas.pop(clave)
+        self.bytes -= len(html)
+        if olvidar and clave[0] == 'fila':
+            claves = self._por_registro.get((clave[1], clave[2]))
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._por_registro[(clave[1], clave[2])]
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._por_registro.clear()
+            self.bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self.bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'expulsiones': self.expulsiones,
+            }
+
+
+cache_fragmentos = CacheFragmentos()
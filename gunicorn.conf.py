@@ -0,0 +1,34 @@
+import gc
+import os
+
+# Configuración de gunicorn (start.sh la carga con --config).
+#
+# SERVIDOR_PRECARGA=1: el maestro importa la aplicación una sola vez
+# (preload_app) y los workers se crean con fork, así que comparten con él
+# las páginas de memoria del código y de las bibliotecas (copy-on-write) y
+# un worker que se reinicia arranca casi al instante. Las conexiones, el
+# hilo de autocompletado y el pool de reportes se crean en cada worker.
+#
+# No se usa con los workers gevent: gevent tiene que parchear la
+# biblioteca estándar antes de que se importe la aplicación.
+PRECARGA = (os.environ.get('SERVIDOR_PRECARGA', '').lower() in ('1', 'true', 'si', 'sí')
+            and os.environ.get('SERVIDOR_MODO') != 'gevent')
+
+# app.py lo consulta para no arrancar hilos ni conexiones en el maestro
+os.environ['SERVIDOR_PRECARGA'] = '1' if PRECARGA else '0'
+
+preload_app = PRECARGA
+
+if PRECARGA:
+    def when_ready(server):
+        # Con la aplicación ya cargada: las bibliotecas de los reportes se
+        # importan aquí una vez para todos los workers, y gc.freeze() saca
+        # lo cargado de las pasadas del recolector, que si no escribiría en
+        # esas páginas y obligaría a copiarlas en cada worker
+        import reportes
+        reportes.precargar()
+        gc.freeze()
+
+    def post_fork(server, worker):
+        import app
+        app.iniciar_worker()
@@ -0,0 +1,407 @@
+import csv
+import io
+import sys
+import tempfile
+import time
+from decimal import Decimal, InvalidOperation
+
+from psycopg2.extras import execute_values
+
+import asincrono
+from autocompletado import normalizar, notificar_cambio
+
+# Importación masiva de productos y clientes desde CSV o XLSX. Las filas se
+# leen y validan de una en una, las válidas se cargan con COPY en una tabla
+# temporal y desde ahí se actualizan/insertan en la tabla real con dos
+# sentencias, todo en una transacción.
+
+# Filas por sentencia cuando no se puede usar COPY (modo gevent)
+TAMANO_LOTE = 1000
+# Errores que se devuelven con su fila; el resto solo se cuentan
+MAX_ERRORES_LISTADOS = 1000
+# Lo que ocupan en memoria las filas válidas antes de pasar a disco
+MAX_MEMORIA_CARGA = 8 * 1024 * 1024
+
+PRECIO_MAXIMO = Decimal('9999999999.99')     # NUMERIC(12, 2)
+CANTIDAD_MAXIMA = 2 ** 31 - 1                # INTEGER
+
+
+class ImportacionInvalida(Exception):
+    """El archivo no se puede importar (formato desconocido, faltan columnas...)."""
+
+
+class FilaInvalida(ValueError):
+    """Una fila no pasa la validación; se informa y se omite."""
+
+
+class ErroresFilas:
+    """
+    Errores de validación de un archivo: guarda (numero_de_fila, mensaje) de
+    los primeros MAX_ERRORES_LISTADOS y del resto solo lleva la cuenta, para
+    que un archivo grande lleno de filas malas no los acumule todos en memoria.
+    """
+
+    def __init__(self):
+        self.listados = []
+        self.total = 0
+
+    def anotar(self, numero, mensaje):
+        self.total += 1
+        if len(self.listados) < MAX_ERRORES_LISTADOS:
+            self.listados.append((numero, mensaje))
+
+
+def _texto(valor):
+    """Valor de una celda como texto sin espacios (los números enteros de Excel sin '.0')."""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def _obligatorio(valor, campo):
+    texto = _texto(valor)
+    if not texto:
+        raise FilaInvalida(f"Falta {campo}.")
+    return texto
+
+
+def _opcional(valor):
+    return _texto(valor) or None
+
+
+def _precio(valor):
+    texto = _texto(valor).replace(' ', '')
+    # Admite coma decimal ("1250,50") si no hay punto
+    if ',' in texto and '.' not in texto:
+        texto = texto.replace(',', '.')
+    try:
+        precio = Decimal(texto).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise FilaInvalida(f"Precio no válido: '{_texto(valor)}'.")
+    if not 0 <= precio <= PRECIO_MAXIMO:
+        raise FilaInvalida(f"Precio fuera de rango: {precio}.")
+    return precio
+
+
+def _cantidad(valor):
+    texto = _texto(valor)
+    try:
+        cantidad = int(texto)
+    except ValueError:
+        raise FilaInvalida(f"Cantidad no válida: '{texto}'.")
+    if not 0 <= cantidad <= CANTIDAD_MAXIMA:
+        raise FilaInvalida(f"Cantidad fuera de rango: {cantidad}.")
+    return cantidad
+
+
+def _validar_producto(fila):
+    return (
+        _obligatorio(fila.get('nombre'), 'el nombre'),
+        _obligatorio(fila.get('categoria'), 'la categoría'),
+        _obligatorio(fila.get('color'), 'el color'),
+        _precio(fila.get('precio')),
+        _cantidad(fila.get('cantidad')),
+        _opcional(fila.get('descripcion')),
+    )
+
+
+def _validar_cliente(fila):
+    return (
+        _obligatorio(fila.get('nombre'), 'el nombre'),
+        _obligatorio(fila.get('cedula'), 'la cédula'),
+        _opcional(fila.get('telefono')),
+        _opcional(fila.get('direccion')),
+    )
+
+
+# tipo -> datos de la importación:
+#   columnas: columnas de la tabla, en el orden en que las devuelve validar
+#   obligatorias: cabeceras que debe tener el archivo
+#   clave: columnas que identifican el registro (las demás se actualizan)
+TIPOS = {
+    'productos': {
+        'columnas': ['nombre', 'categoria', 'color', 'precio', 'cantidad', 'descripcion'],
+        'obligatorias': ['nombre', 'categoria', 'color', 'precio', 'cantidad'],
+        'validar': _validar_producto,
+        'clave': ['nombre', 'color'],
+        'descripcion_clave': 'el nombre y color',
+    },
+    'clientes': {
+        'columnas': ['nombre', 'cedula', 'telefono', 'direccion'],
+        'obligatorias': ['nombre', 'cedula'],
+        'validar': _validar_cliente,
+        'clave': ['cedula'],
+        'descripcion_clave': 'la cédula',
+    },
+}
+
+SQL_TABLA_TEMPORAL = {
+    'productos': """
+        CREATE TEMP TABLE importacion_productos (
+            fila INTEGER, nombre TEXT, categoria TEXT, color TEXT,
+            precio NUMERIC(12, 2), cantidad INTEGER, descripcion TEXT
+        ) ON COMMIT DROP
+    """,
+    'clientes': """
+        CREATE TEMP TABLE importacion_clientes (
+            fila INTEGER, nombre TEXT, cedula TEXT, telefono TEXT, direccion TEXT
+        ) ON COMMIT DROP
+    """,
+}
+
+
+def _sql_actualizar(tipo, columnas):
+    """
+    UPDATE de los registros existentes con las `columnas` que trae el archivo
+    (una columna opcional que no viene no se borra). Las filas que no cambian
+    no se reescriben.
+    """
+    datos = TIPOS[tipo]
+    cambian = [columna for columna in columnas if columna not in datos['clave']]
+    if not cambian:
+        return None
+    asignaciones = ', '.join(f"{columna} = s.{columna}" for columna in cambian)
+    coincide = ' AND '.join(f"t.{columna} = s.{columna}" for columna in datos['clave'])
+    return f"""
+        UPDATE {tipo} t SET {asignaciones}
+        FROM importacion_{tipo} s
+        WHERE {coincide}
+          AND ({', '.join(f't.{c}' for c in cambian)}) IS DISTINCT FROM ({', '.join(f's.{c}' for c in cambian)})
+    """
+
+
+def _sql_insertar(tipo):
+    datos = TIPOS[tipo]
+    columnas = ', '.join(datos['columnas'])
+    coincide = ' AND '.join(f"t.{columna} = s.{columna}" for columna in datos['clave'])
+    return f"""
+        INSERT INTO {tipo} ({columnas})
+        SELECT {', '.join(f's.{c}' for c in datos['columnas'])}
+        FROM importacion_{tipo} s
+        WHERE NOT EXISTS (SELECT 1 FROM {tipo} t WHERE {coincide})
+        ORDER BY s.fila
+    """
+
+
+def _cabecera(nombre):
+    """'Cédula ' -> 'cedula', para aceptar las cabeceras escritas a mano."""
+    return normalizar(_texto(nombre)).replace(' ', '_')
+
+
+def _filas_csv(archivo):
+    # utf-8-sig quita el BOM que añade Excel al guardar como CSV
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    try:
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.reader(texto, dialecto)
+    except UnicodeDecodeError:
+        raise ImportacionInvalida("El CSV debe estar guardado en UTF-8.")
+    finally:
+        # El archivo es del llamador: que no lo cierre el recolector
+        texto.detach()
+
+
+def _filas_xlsx(archivo):
+    # openpyxl solo hace falta para importar, así que se carga aquí
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportacionInvalida("Para importar archivos XLSX hay que instalar openpyxl.")
+    try:
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+    except Exception as err:
+        raise ImportacionInvalida(f"No se pudo leer el archivo XLSX: {err}")
+    try:
+        # En modo read_only las filas se leen del XML a medida que se piden
+        yield from libro.worksheets[0].iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def leer_filas(archivo, nombre_archivo):
+    """Recorre las filas (listas de celdas, la primera es la cabecera) de un CSV o XLSX."""
+    extension = nombre_archivo.rsplit('.', 1)[-1].lower() if '.' in nombre_archivo else ''
+    if extension == 'csv':
+        return _filas_csv(archivo)
+    if extension == 'xlsx':
+        return _filas_xlsx(archivo)
+    raise ImportacionInvalida("Formato no admitido: el archivo debe ser .csv o .xlsx.")
+
+
+def leer_cabecera(filas, tipo):
+    """Lee la primera fila y devuelve {columna: posición} de las columnas conocidas."""
+    cabecera = [_cabecera(nombre) for nombre in next(filas, None) or []]
+    faltan = [columna for columna in TIPOS[tipo]['obligatorias'] if columna not in cabecera]
+    if faltan:
+        raise ImportacionInvalida(f"Faltan columnas en la cabecera: {', '.join(faltan)}.")
+    return {columna: cabecera.index(columna) for columna in TIPOS[tipo]['columnas'] if columna in cabecera}
+
+
+def validar_filas(filas, tipo, posiciones, errores):
+    """
+    Genera (numero_de_fila, tupla) de las filas válidas que siguen a la
+    cabecera. Las inválidas se anotan en `errores` (un ErroresFilas) con su
+    número de fila y el mensaje. Las filas se numeran como en la hoja de cálculo: la cabecera
+    es la 1.
+    """
+    datos = TIPOS[tipo]
+    posiciones_clave = [datos['columnas'].index(columna) for columna in datos['clave']]
+    vistas = {}
+    for numero, celdas in enumerate(filas, start=2):
+        if not any(_texto(celda) for celda in celdas):
+            continue
+        fila = {columna: celdas[i] if i < len(celdas) else None for columna, i in posiciones.items()}
+        try:
+            valores = datos['validar'](fila)
+        except FilaInvalida as err:
+            errores.anotar(numero, str(err))
+            continue
+        # Una clave repetida en el archivo dejaría el resultado a merced del orden del UPDATE
+        clave = tuple(valores[i] for i in posiciones_clave)
+        if clave in vistas:
+            errores.anotar(numero, f"Repite {datos['descripcion_clave']} de la fila {vistas[clave]}.")
+            continue
+        vistas[clave] = numero
+        yield numero, valores
+
+
+def _cargar_copy(cursor, tabla, columnas, filas):
+    """Escribe las filas en un CSV temporal (en memoria hasta MAX_MEMORIA_CARGA) y las carga con COPY."""
+    with tempfile.SpooledTemporaryFile(max_size=MAX_MEMORIA_CARGA, mode='w+', newline='',
+                                       encoding='utf-8') as buffer:
+        escritor = csv.writer(buffer)
+        total = 0
+        for numero, valores in filas:
+            # Los opcionales vacíos son None y se escriben sin comillas: COPY los lee como NULL
+            escritor.writerow((numero,) + valores)
+            total += 1
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {tabla} (fila, {', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return total
+
+
+def _cargar_lotes(cursor, tabla, columnas, filas):
+    """Alternativa a COPY para el modo gevent: INSERT multi-fila por lotes."""
+    sql = f"INSERT INTO {tabla} (fila, {', '.join(columnas)}) VALUES %s"
+    total = 0
+    lote = []
+    for numero, valores in filas:
+        lote.append((numero,) + valores)
+        if len(lote) >= TAMANO_LOTE:
+            execute_values(cursor, sql, lote, page_size=TAMANO_LOTE)
+            total += len(lote)
+            lote = []
+    if lote:
+        execute_values(cursor, sql, lote, page_size=TAMANO_LOTE)
+        total += len(lote)
+    return total
+
+
+def importar(db, tipo, archivo, nombre_archivo, solo_validar=False):
+    """
+    Importa un CSV/XLSX de productos (se identifican por nombre y color) o
+    clientes (por cédula): actualiza los existentes e inserta los nuevos en
+    una sola transacción. Las filas inválidas se omiten y se informan.
+
+    Con `solo_validar=True` hace todo el trabajo y deshace la transacción.
+    Lanza ImportacionInvalida si el archivo no se puede procesar, y deja
+    pasar psycopg2.Error (la transacción queda deshecha).
+
+    Devuelve un dict con las filas leídas, válidas, insertadas, actualizadas,
+    sin_cambios, los errores (hasta MAX_ERRORES_LISTADOS), el total de
+    errores, los segundos y las filas por segundo.
+    """
+    if tipo not in TIPOS:
+        raise ImportacionInvalida(f"Tipo de importación desconocido: {tipo}.")
+    datos = TIPOS[tipo]
+    tabla = f"importacion_{tipo}"
+    inicio = time.perf_counter()
+    errores = ErroresFilas()
+
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(SQL_TABLA_TEMPORAL[tipo])
+            filas = iter(leer_filas(archivo, nombre_archivo))
+            posiciones = leer_cabecera(filas, tipo)
+            filas = validar_filas(filas, tipo, posiciones, errores)
+            cargar = _cargar_lotes if asincrono.modo_verde() else _cargar_copy
+            validas = cargar(cursor, tabla, datos['columnas'], filas)
+            cursor.execute(f"ANALYZE {tabla}")
+
+            actualizadas = 0
+            sql_actualizar = _sql_actualizar(tipo, posiciones)
+            if sql_actualizar:
+                cursor.execute(sql_actualizar)
+                actualizadas = cursor.rowcount
+            cursor.execute(_sql_insertar(tipo))
+            insertadas = cursor.rowcount
+
+            if tipo == 'clientes' and (actualizadas or insertadas):
+                # Los workers recargan su índice de autocompletado completo
+                notificar_cambio(cursor, '*')
+        if solo_validar:
+            db.rollback()
+        else:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    segundos = time.perf_counter() - inicio
+    leidas = validas + errores.total
+    return {
+        'tipo': tipo,
+        'leidas': leidas,
+        'validas': validas,
+        'insertadas': insertadas,
+        'actualizadas': actualizadas,
+        'sin_cambios': validas - insertadas - actualizadas,
+        'errores': errores.listados,
+        'total_errores': errores.total,
+        'solo_validar': solo_validar,
+        'segundos': segundos,
+        'filas_por_segundo': leidas / segundos if segundos else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    # Uso: python importacion.py productos|clientes archivo.csv|archivo.xlsx [--validar]
+    import psycopg2
+    from app import obtener_database_url
+    import versiones
+    from catalogo import cache_catalogo
+
+    argumentos = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if len(argumentos) != 2 or argumentos[0] not in TIPOS:
+        sys.exit("Uso: python importacion.py productos|clientes archivo.csv|archivo.xlsx [--validar]")
+    tipo, ruta = argumentos
+    db = psycopg2.connect(obtener_database_url())
+    try:
+        with open(ruta, 'rb') as archivo:
+            resultado = importar(db, tipo, archivo, ruta, solo_validar='--validar' in sys.argv)
+        if not resultado['solo_validar'] and (resultado['insertadas'] or resultado['actualizadas']):
+            if tipo == 'productos':
+                cache_catalogo.invalidar(db)
+            else:
+                versiones.incrementar(db, 'clientes')
+    except ImportacionInvalida as err:
+        sys.exit(str(err))
+    finally:
+        db.close()
+
+    for numero, mensaje in resultado['errores']:
+        print(f"Fila {numero}: {mensaje}")
+    if resultado['total_errores'] > len(resultado['errores']):
+        print(f"... y {resultado['total_errores'] - len(resultado['errores'])} errores más.")
+    print(f"{resultado['leidas']} filas leídas, {resultado['validas']} válidas, "
+          f"{resultado['insertadas']} insertadas, {resultado['actualizadas']} actualizadas, "
+          f"{resultado['sin_cambios']} sin cambios, {resultado['total_errores']} con errores "
+          f"en {resultado['segundos']:.2f} s ({resultado['filas_por_segundo']:.0f} filas/s)"
+          + (" (solo validación, no se guardó nada)" if resultado['solo_validar'] else ""))
@@ -0,0 +1,257 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import psycopg2.extensions
+
+# Sentencias más lentas que esto (en ms) se escriben en el log con su ruta
+UMBRAL_LENTA_MS = float(os.environ.get('DB_CONSULTA_LENTA_MS', 500))
+# Con 0 no se añade la cabecera Server-Timing a las respuestas
+SERVER_TIMING = os.environ.get('METRICAS_SERVER_TIMING', '1') != '0'
+
+# Límites (en segundos) del histograma de duración de las peticiones
+LIMITES_DURACION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Medicion:
+    """Lo que ha gastado una petición en la base de datos."""
+
+    __slots__ = ('ruta', 'inicio', 'consultas', 'tiempo_db', 'filas', 'tiempo_conexion')
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.filas = 0
+        self.tiempo_conexion = 0.0
+
+
+_medicion = ContextVar('medicion', default=None)
+
+
+def iniciar_peticion(ruta):
+    _medicion.set(Medicion(ruta))
+
+
+def medicion_actual():
+    return _medicion.get()
+
+
+def _registrar_sentencia(cursor, sql, segundos, copia=False):
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion.consultas += 1
+        medicion.tiempo_db += segundos
+        # Con un cursor normal rowcount ya son las filas recibidas (o copiadas);
+        # los cursores con nombre solo ejecutan el DECLARE aquí y no se cuentan
+        if cursor.name is None and (copia or cursor.description is not None) and cursor.rowcount > 0:
+            medicion.filas += cursor.rowcount
+    if segundos * 1000 >= UMBRAL_LENTA_MS:
+        registro.sentencia_lenta()
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        ruta = medicion.ruta if medicion is not None else '-'
+        print(f"Consulta lenta ({segundos * 1000:.0f} ms) en {ruta}: {' '.join(str(sql).split())[:500]}")
+
+
+class CursorMedido:
+    """Mezcla para cualquier clase de cursor: mide cada sentencia ejecutada."""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _registrar_sentencia(self, query, time.perf_counter() - inicio)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _registrar_sentencia(self, query, time.perf_counter() - inicio)
+
+    def copy_expert(self, sql, file, size=8192):
+        inicio = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _registrar_sentencia(self, sql, time.perf_counter() - inicio, copia=True)
+
+
+_clases_medidas = {}
+
+
+def _clase_medida(cursor_factory):
+    clase = _clases_medidas.get(cursor_factory)
+    if clase is None:
+        clase = type(f"{cursor_factory.__name__}Medido", (CursorMedido, cursor_factory), {})
+        _clases_medidas[cursor_factory] = clase
+    return clase
+
+
+class ConexionMedida(psycopg2.extensions.connection):
+    """
+    Conexión cuyos cursores (incluidos RealDictCursor y los cursores con
+    nombre) se miden con CursorMedido, sin cambiar el código que los usa.
+    """
+
+    def cursor(self, *args, **kwargs):
+        cursor_factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _clase_medida(cursor_factory)
+        return super().cursor(*args, **kwargs)
+
+
+@contextmanager
+def conexion_medida(pool):
+    """pool.conexion() sumando a la petición el tiempo que se tardó en obtenerla."""
+    inicio = time.perf_counter()
+    with pool.conexion() as conn:
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.tiempo_conexion += time.perf_counter() - inicio
+        yield conn
+
+
+def server_timing(medicion, total):
+    return (f'db;dur={medicion.tiempo_db * 1000:.2f};desc="{medicion.consultas} consultas, {medicion.filas} filas", '
+            f'conexion;dur={medicion.tiempo_conexion * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}')
+
+
+class RegistroMetricas:
+    """Acumulados por ruta de este worker, para /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rutas = {}
+        self._lentas = 0
+        # Ventas (ver ventas.py): reintentos por error, repetidas y espera por bloqueos
+        self._reintentos = {}
+        self._reintentos_agotados = 0
+        self._ventas_repetidas = 0
+        self._bloqueo_segundos = 0.0
+        self._bloqueos = 0
+
+    def sentencia_lenta(self):
+        with self._lock:
+            self._lentas += 1
+
+    def venta_reintentada(self, error, agotada=False):
+        with self._lock:
+            self._reintentos[error] = self._reintentos.get(error, 0) + 1
+            if agotada:
+                self._reintentos_agotados += 1
+
+    def venta_repetida(self):
+        with self._lock:
+            self._ventas_repetidas += 1
+
+    def espera_bloqueo(self, segundos):
+        """Duración de una sentencia de la venta que puede esperar por un bloqueo de otra."""
+        with self._lock:
+            self._bloqueo_segundos += segundos
+            self._bloqueos += 1
+
+    def terminar_peticion(self, estado):
+        """Cierra la medición de la petición actual y devuelve (medicion, duracion)."""
+        medicion = _medicion.get()
+        if medicion is None:
+            return None, 0.0
+        _medicion.set(None)
+        duracion = time.perf_counter() - medicion.inicio
+        clave = (medicion.ruta or 'desconocida', estado // 100 * 100)
+        with self._lock:
+            datos = self._rutas.get(clave)
+            if datos is None:
+                datos = self._rutas[clave] = {
+                    'peticiones': 0, 'segundos': 0.0, 'consultas': 0, 'db_segundos': 0.0,
+                    'filas': 0, 'conexion_segundos': 0.0, 'cubetas': [0] * len(LIMITES_DURACION),
+                }
+            datos['peticiones'] += 1
+            datos['segundos'] += duracion
+            datos['consultas'] += medicion.consultas
+            datos['db_segundos'] += medicion.tiempo_db
+            datos['filas'] += medicion.filas
+            datos['conexion_segundos'] += medicion.tiempo_conexion
+            for i, limite in enumerate(LIMITES_DURACION):
+                if duracion <= limite:
+                    datos['cubetas'][i] += 1
+        return medicion, duracion
+
+    def exportar(self, pool=None):
+        """Texto en el formato de exposición de Prometheus."""
+        worker = os.getpid()
+        with self._lock:
+            rutas = {clave: dict(datos, cubetas=list(datos['cubetas'])) for clave, datos in self._rutas.items()}
+            lentas = self._lentas
+            reintentos = dict(self._reintentos)
+            ventas = (self._reintentos_agotados, self._ventas_repetidas, self._bloqueo_segundos, self._bloqueos)
+
+        lineas = []
+
+        def metrica(nombre, tipo, ayuda, muestras):
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in muestras:
+                texto = ','.join(f'{k}="{v}"' for k, v in dict(etiquetas, worker=worker).items())
+                lineas.append(f"{nombre}{{{texto}}} {valor}")
+
+        def por_ruta(campo):
+            return [({'ruta': ruta, 'estado': estado}, datos[campo]) for (ruta, estado), datos in rutas.items()]
+
+        metrica('muebles_peticiones_total', 'counter', 'Peticiones atendidas.', por_ruta('peticiones'))
+        metrica('muebles_consultas_total', 'counter', 'Sentencias SQL ejecutadas.', por_ruta('consultas'))
+        metrica('muebles_db_segundos_total', 'counter', 'Tiempo en la base de datos.', por_ruta('db_segundos'))
+        metrica('muebles_filas_total', 'counter', 'Filas recibidas de la base de datos.', por_ruta('filas'))
+        metrica('muebles_conexion_segundos_total', 'counter', 'Tiempo obteniendo conexiones del pool.',
+                por_ruta('conexion_segundos'))
+
+        histograma = []
+        for (ruta, estado), datos in rutas.items():
+            for limite, cantidad in zip(LIMITES_DURACION, datos['cubetas']):
+                histograma.append(({'ruta': ruta, 'estado': estado, 'le': limite}, cantidad))
+            histograma.append(({'ruta': ruta, 'estado': estado, 'le': '+Inf'}, datos['peticiones']))
+        lineas.append("# HELP muebles_peticion_segundos Duración de las peticiones.")
+        lineas.append("# TYPE muebles_peticion_segundos histogram")
+        for etiquetas, valor in histograma:
+            texto = ','.join(f'{k}="{v}"' for k, v in dict(etiquetas, worker=worker).items())
+            lineas.append(f"muebles_peticion_segundos_bucket{{{texto}}} {valor}")
+        for (ruta, estado), datos in rutas.items():
+            texto = f'ruta="{ruta}",estado="{estado}",worker="{worker}"'
+            lineas.append(f"muebles_peticion_segundos_sum{{{texto}}} {datos['segundos']}")
+            lineas.append(f"muebles_peticion_segundos_count{{{texto}}} {datos['peticiones']}")
+
+        metrica('muebles_consultas_lentas_total', 'counter',
+                f'Sentencias de más de {UMBRAL_LENTA_MS:g} ms.', [({}, lentas)])
+
+        agotados, repetidas, bloqueo_segundos, bloqueos = ventas
+        metrica('muebles_ventas_reintentos_total', 'counter',
+                'Ventas repetidas tras un interbloqueo o conflicto de serialización.',
+                [({'error': error}, cantidad) for error, cantidad in reintentos.items()])
+        metrica('muebles_ventas_reintentos_agotados_total', 'counter',
+                'Ventas que fallaron tras agotar los reintentos.', [({}, agotados)])
+        metrica('muebles_ventas_repetidas_total', 'counter',
+                'Envíos repetidos de una venta ya registrada (misma clave).', [({}, repetidas)])
+        metrica('muebles_ventas_bloqueo_segundos_total', 'counter',
+                'Tiempo de las sentencias de venta que esperan por bloqueos.', [({}, bloqueo_segundos)])
+        metrica('muebles_ventas_bloqueo_sentencias_total', 'counter',
+                'Sentencias de venta que pueden esperar por bloqueos.', [({}, bloqueos)])
+
+        if pool:
+            for clave in ('prestamos', 'esperas', 'timeouts', 'creadas', 'recicladas', 'descartadas',
+                          'fallos_chequeo'):
+                metrica(f'muebles_pool_{clave}_total', 'counter', f'Pool de conexiones: {clave}.',
+                        [({}, pool[clave])])
+            metrica('muebles_pool_espera_segundos_total', 'counter', 'Pool de conexiones: tiempo de espera.',
+                    [({}, pool['tiempo_espera'])])
+            for clave in ('en_uso', 'libres', 'maxconn'):
+                metrica(f'muebles_pool_{clave}', 'gauge', f'Pool de conexiones: {clave}.', [({}, pool[clave])])
+
+        return '\n'.join(lineas) + '\n'
+
+
+registro = RegistroMetricas()
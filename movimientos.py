@@ -0,0 +1,153 @@
+from collections import OrderedDict
+
+import psycopg2.errors
+from psycopg2.extras import execute_values
+
+# Libro de movimientos de inventario: cada entrada, devolución o ajuste de
+# stock queda registrado con el stock que dejó. Las ventas no pasan por aquí
+# (su detalle ya está en detalle_ventas).
+SQL_TABLAS = [
+    """
+    CREATE TABLE IF NOT EXISTS movimientos_inventario (
+        id BIGSERIAL PRIMARY KEY,
+        id_producto INTEGER NOT NULL REFERENCES productos (id),
+        fecha TIMESTAMP NOT NULL DEFAULT NOW(),
+        tipo TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        stock_resultante INTEGER NOT NULL,
+        motivo TEXT,
+        usuario TEXT
+    )
+    """,
+    # Historial de un producto y FK al borrar productos
+    "CREATE INDEX IF NOT EXISTS idx_movimientos_inventario_producto "
+    "ON movimientos_inventario (id_producto, id DESC)",
+]
+
+# tipo -> signo que debe tener la cantidad (None = cualquiera salvo 0)
+TIPOS = {
+    'entrada': 1,       # recepción de mercancía
+    'devolucion': 1,    # devolución de un cliente
+    'ajuste': None,     # corrección tras un conteo, mermas...
+}
+
+# Movimientos por lote, para que un lote no retenga los bloqueos demasiado tiempo
+MAX_MOVIMIENTOS = 5000
+
+
+class MovimientoRechazado(Exception):
+    """El lote de movimientos no se puede aplicar (producto inexistente, stock negativo...)."""
+
+
+def crear_tablas(db):
+    with db.cursor() as cursor:
+        for sql in SQL_TABLAS:
+            cursor.execute(sql)
+    db.commit()
+
+
+def validar_movimientos(movimientos):
+    """
+    Convierte la lista recibida ([{id, cantidad, tipo, motivo}]) en tuplas
+    (id_producto, cantidad, tipo, motivo), en el mismo orden.
+    """
+    if not movimientos or not isinstance(movimientos, list):
+        raise MovimientoRechazado("No hay movimientos que aplicar.")
+    if len(movimientos) > MAX_MOVIMIENTOS:
+        raise MovimientoRechazado(f"Como máximo {MAX_MOVIMIENTOS} movimientos por lote.")
+    validados = []
+    for numero, movimiento in enumerate(movimientos, start=1):
+        try:
+            id_producto = int(movimiento['id'])
+            cantidad = int(movimiento['cantidad'])
+            tipo = movimiento.get('tipo', 'ajuste')
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise MovimientoRechazado(f"Movimiento {numero}: faltan el id o la cantidad, o no son números.")
+        if tipo not in TIPOS:
+            raise MovimientoRechazado(f"Movimiento {numero}: tipo desconocido '{tipo}' "
+                                      f"(debe ser {', '.join(TIPOS)}).")
+        if cantidad == 0 or (TIPOS[tipo] is not None and cantidad * TIPOS[tipo] < 0):
+            raise MovimientoRechazado(f"Movimiento {numero}: cantidad no válida para el tipo {tipo}: {cantidad}.")
+        validados.append((id_producto, cantidad, tipo, movimiento.get('motivo') or None))
+    return validados
+
+
+def aplicar_movimientos(cursor, movimientos, usuario=None):
+    """
+    Aplica un lote de movimientos de stock relativos con un número fijo de
+    sentencias:
+
+    1. Bloquea los productos afectados (FOR UPDATE, en orden de id, como
+       registrar_venta(), para que un lote y una venta no se bloqueen
+       mutuamente).
+    2. Suma el neto de cada producto con un único UPDATE relativo
+       (`cantidad = cantidad + delta`), así que no pisa las ventas
+       confirmadas entre la lectura y la escritura.
+    3. Registra cada movimiento en movimientos_inventario con el stock que
+       dejó, en un solo INSERT multi-fila.
+
+    Ningún movimiento puede dejar el stock en negativo. No hace commit; lanza
+    MovimientoRechazado si el lote no es válido y el llamador debe deshacer
+    la transacción. Devuelve {id_producto: stock_final}.
+    """
+    validados = validar_movimientos(movimientos)
+    netos = {}
+    for id_producto, cantidad, _, _ in validados:
+        netos[id_producto] = netos.get(id_producto, 0) + cantidad
+    netos = OrderedDict(sorted(netos.items()))
+    ids = list(netos)
+
+    cursor.execute("SELECT id, cantidad FROM productos WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (ids,))
+    stock = dict(cursor.fetchall())
+
+    registros = []
+    for id_producto, cantidad, tipo, motivo in validados:
+        if id_producto not in stock:
+            raise MovimientoRechazado(f"El producto ID {id_producto} no existe.")
+        stock[id_producto] += cantidad
+        if stock[id_producto] < 0:
+            raise MovimientoRechazado(f"El movimiento de {cantidad} deja el producto ID {id_producto} "
+                                      f"con stock negativo ({stock[id_producto]}).")
+        registros.append((id_producto, tipo, cantidad, stock[id_producto], motivo, usuario))
+
+    cursor.execute("""
+        UPDATE productos p
+        SET cantidad = p.cantidad + d.delta
+        FROM unnest(%s::int[], %s::int[]) AS d(id, delta)
+        WHERE p.id = d.id AND p.cantidad + d.delta >= 0
+    """, (ids, list(netos.values())))
+    if cursor.rowcount != len(ids):
+        # No debería ocurrir con las filas bloqueadas, pero nunca se deja stock negativo
+        raise MovimientoRechazado("El stock cambió durante la operación. Inténtalo de nuevo.")
+
+    try:
+        execute_values(cursor,
+                       "INSERT INTO movimientos_inventario (id_producto, tipo, cantidad, stock_resultante, motivo, "
+                       "usuario) VALUES %s",
+                       registros, page_size=len(registros))
+    except psycopg2.errors.UndefinedTable:
+        # La tabla la crea esquema.py; no se crea aquí, en mitad de un movimiento
+        raise MovimientoRechazado("Falta la tabla movimientos_inventario: ejecuta 'python esquema.py' "
+                                  "antes de registrar movimientos.")
+
+    return {id_producto: stock[id_producto] for id_producto in ids}
+
+
+def historial_movimientos(cursor, id_producto, limite=50, antes_de=None):
+    """
+    Últimos movimientos de un producto, del más reciente al más antiguo.
+    `antes_de` es el id del último movimiento de la página anterior.
+    """
+    condicion = "id_producto = %s"
+    params = [id_producto]
+    if antes_de is not None:
+        condicion += " AND id < %s"
+        params.append(antes_de)
+    cursor.execute(f"""
+        SELECT id, fecha, tipo, cantidad, stock_resultante, motivo, usuario
+        FROM movimientos_inventario
+        WHERE {condicion}
+        ORDER BY id DESC
+        LIMIT %s
+    """, params + [limite])
+    return cursor.fetchall()
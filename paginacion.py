@@ -0,0 +1,98 @@
+import base64
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import request, url_for
+
+# Tamaño de página por defecto y máximo para los listados
+POR_PAGINA_DEFECTO = int(os.environ.get('PAGINA_TAMANO', 50))
+POR_PAGINA_MAXIMO = int(os.environ.get('PAGINA_TAMANO_MAX', 500))
+
+
+def tamano_pagina():
+    """Lee `por_pagina` de la URL, limitado entre 1 y POR_PAGINA_MAXIMO."""
+    try:
+        por_pagina = int(request.args.get('por_pagina', POR_PAGINA_DEFECTO))
+    except ValueError:
+        por_pagina = POR_PAGINA_DEFECTO
+    return max(1, min(por_pagina, POR_PAGINA_MAXIMO))
+
+
+def _a_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    raise TypeError(f"Tipo no soportado en el cursor: {type(valor)}")
+
+
+def codificar_cursor(valores):
+    """Convierte los valores de la última fila en un token opaco para la URL."""
+    datos = json.dumps(list(valores), default=_a_json, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(token):
+    """Devuelve la lista de valores del token, o None si no hay token o no es válido."""
+    if not token:
+        return None
+    try:
+        relleno = '=' * (-len(token) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(token + relleno))
+    except (ValueError, TypeError):
+        return None
+    return valores if isinstance(valores, list) else None
+
+
+def condicion_keyset(columnas, descendente=False):
+    """
+    Construye la condición "(col1, col2, ...) > (%s, %s, ...)" a partir del
+    cursor de la URL. Devuelve (None, []) si se pide la primera página.
+    Las columnas deben ser las del ORDER BY, terminando en una columna única.
+    """
+    valores = decodificar_cursor(request.args.get('cursor'))
+    if not valores or len(valores) != len(columnas):
+        return None, []
+    operador = '<' if descendente else '>'
+    marcadores = ', '.join(['%s'] * len(columnas))
+    return f"({', '.join(columnas)}) {operador} ({marcadores})", valores
+
+
+def contar_aproximado(cursor, sql_query, params):
+    """
+    Estimación del número de filas según el planificador (EXPLAIN), sin
+    recorrer la tabla como haría un COUNT(*).
+    """
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql_query, params)
+    fila = cursor.fetchone()
+    plan = fila['QUERY PLAN'] if isinstance(fila, dict) else fila[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def paginar(filas, por_pagina, clave, total_aprox=None):
+    """
+    Recorta las `por_pagina + 1` filas leídas a una página y prepara los
+    enlaces de navegación. `clave` devuelve los valores del ORDER BY de una fila.
+    """
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    siguiente = codificar_cursor(clave(filas[-1])) if hay_mas else None
+
+    args = request.args.to_dict()
+    es_primera = 'cursor' not in args
+    args.pop('cursor', None)
+    # Los parámetros de la ruta (p. ej. la cédula de /api/clientes/<cedula>/historial)
+    args.update(request.view_args or {})
+
+    pagina = {
+        'por_pagina': por_pagina,
+        'cursor_siguiente': siguiente,
+        'siguiente_url': url_for(request.endpoint, **args, cursor=siguiente) if siguiente else None,
+        'primera_url': None if es_primera else url_for(request.endpoint, **args),
+        'total_aprox': total_aprox,
+    }
+    return filas, pagina
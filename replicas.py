@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+# URLs de las réplicas de solo lectura (streaming replication del primario
+# DATABASE_URL), separadas por espacios: una URL puede llevar comas (varios
+# hosts, search_path). Sin ninguna, todas las rutas usan el primario.
+URLS = os.environ.get('DATABASE_REPLICAS', '').split()
+# Una réplica con más retraso que esto (segundos) no recibe lecturas
+RETRASO_MAXIMO = float(os.environ.get('REPLICA_RETRASO_MAXIMO', 5))
+# Cada cuánto (segundos) comprueba cada worker el estado y el retraso de cada réplica
+INTERVALO_CHEQUEO = float(os.environ.get('REPLICA_CHEQUEO', 5))
+# Segundos para conectar con una réplica antes de darla por caída
+TIEMPO_CONEXION = int(os.environ.get('REPLICA_TIEMPO_CONEXION', 2))
+# Tras una escritura, las lecturas del mismo usuario van al primario durante
+# estos segundos, para que vea lo que acaba de guardar
+PRIMARIO_TRAS_ESCRIBIR = float(os.environ.get('REPLICA_PRIMARIO_TRAS_ESCRIBIR', 5))
+
+# Sin cambios pendientes de aplicar el retraso es 0 aunque la última
+# transacción aplicada sea antigua (un primario sin escrituras)
+SQL_RETRASO = """
+    SELECT pg_is_in_recovery(),
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+"""
+
+
+def activadas():
+    return bool(URLS)
+
+
+def posicion_primario(db):
+    """Posición actual del WAL del primario, para exigirla después a la réplica."""
+    with db.cursor() as cursor:
+        cursor.execute("SELECT pg_current_wal_lsn()::text")
+        return cursor.fetchone()[0]
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.dsn = psycopg2.extensions.make_dsn(url, connect_timeout=TIEMPO_CONEXION)
+        self.sana = False
+        self.retraso = None
+        self.comprobada = None
+        self.error = None
+
+
+class EnrutadorLecturas:
+    """
+    Reparte las lecturas entre las réplicas por turnos, saltándose las que
+    no responden o van más de RETRASO_MAXIMO segundos por detrás; si no
+    queda ninguna, la lectura va al primario.
+
+    El estado de cada réplica se comprueba como mucho cada INTERVALO_CHEQUEO
+    segundos en cada worker, con una conexión del propio pool de la réplica.
+    """
+
+    def __init__(self, urls):
+        self.replicas = [Replica(url) for url in urls]
+        self._lock = threading.Lock()
+        self._siguiente = 0
+        self._stats = {'replica': 0, 'primario': 0, 'atrasada': 0, 'tras_escribir': 0, 'fallos': 0}
+
+    def _comprobar(self, replica, abrir):
+        try:
+            with abrir(replica.dsn) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(SQL_RETRASO)
+                    en_recuperacion, retraso = cursor.fetchone()
+                conn.rollback()
+        except psycopg2.Error as err:
+            self.marcar_caida(replica, err)
+            return
+        replica.comprobada = time.monotonic()
+        replica.retraso = float(retraso)
+        if not en_recuperacion:
+            # Una réplica promovida ya no recibe los cambios del primario
+            replica.sana = False
+            replica.error = "no está en recuperación (¿promovida?)"
+        elif replica.retraso > RETRASO_MAXIMO:
+            replica.sana = False
+            replica.error = f"retraso de {replica.retraso:.1f} s"
+        else:
+            replica.sana = True
+            replica.error = None
+
+    def marcar_caida(self, replica, err):
+        error = (str(err).strip().splitlines() or [type(err).__name__])[0]
+        if replica.sana or replica.comprobada is None:
+            print(f"Réplica de lectura no disponible, se usa el primario: {error}")
+        replica.sana = False
+        replica.comprobada = time.monotonic()
+        replica.error = error
+        with self._lock:
+            self._stats['fallos'] += 1
+
+    def elegir(self, abrir):
+        """La siguiente réplica sana por turnos, o None. `abrir(dsn)` presta una conexión del pool de dsn."""
+        with self._lock:
+            inicio = self._siguiente
+            self._siguiente = (self._siguiente + 1) % len(self.replicas)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(inicio + i) % len(self.replicas)]
+            if replica.comprobada is None or time.monotonic() - replica.comprobada >= INTERVALO_CHEQUEO:
+                self._comprobar(replica, abrir)
+            if replica.sana:
+                return replica
+        return None
+
+    def contar(self, clave):
+        with self._lock:
+            self._stats[clave] += 1
+
+    @contextmanager
+    def conexion(self, abrir, primario, lsn_minimo=None):
+        """
+        Conexión para una ruta de solo lectura: de una réplica sana o, si no
+        hay ninguna, la de `primario()`. Con `lsn_minimo` (ver
+        posicion_primario) la réplica solo se usa si ya ha aplicado el WAL
+        hasta esa posición; si no, la lectura va al primario.
+
+        Un fallo de conexión con la réplica antes de entregarla también
+        pasa la lectura al primario; después, la réplica se marca caída y el
+        error llega a la ruta como cualquier otro de la base de datos.
+        """
+        replica = self.elegir(abrir) if self.replicas else None
+        if replica is not None:
+            entregada = False
+            try:
+                with abrir(replica.dsn) as conn:
+                    if lsn_minimo is None or self._al_dia(conn, lsn_minimo):
+                        self.contar('replica')
+                        entregada = True
+                        yield conn
+                        return
+                self.contar('atrasada')
+            except psycopg2.Error as err:
+                if entregada:
+                    if isinstance(err, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                        self.marcar_caida(replica, err)
+                    raise
+                self.marcar_caida(replica, err)
+        self.contar('primario')
+        with primario() as conn:
+            yield conn
+
+    @staticmethod
+    def _al_dia(conn, lsn_minimo):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn", (lsn_minimo,))
+            al_dia = cursor.fetchone()[0]
+        conn.rollback()
+        return bool(al_dia)
+
+    def url_lectura(self, abrir, primario_url):
+        """URL de una réplica sana para un proceso aparte (reportes en segundo plano), o la del primario."""
+        replica = self.elegir(abrir) if self.replicas else None
+        return replica.url if replica is not None else primario_url
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['replicas'] = [{
+            'sana': replica.sana,
+            'retraso': replica.retraso,
+            'error': replica.error,
+        } for replica in self.replicas]
+        return stats
+
+
+enrutador_lecturas = EnrutadorLecturas(URLS)
@@ -0,0 +1,246 @@
+import csv
+import io
+import os
+import tempfile
+
+from flask import Response
+
+import asincrono
+import resumenes
+
+# Filas que se piden al servidor en cada viaje del cursor con nombre
+TAMANO_LOTE = 2000
+# Tamaño de los trozos en los que se envía el archivo al navegador
+TAMANO_TROZO = 64 * 1024
+
+COLUMNAS_VENTAS = ['id', 'fecha', 'nombre_cliente', 'cedula_cliente', 'total', 'metodo_pago', 'descripcion']
+
+# Rango de fechas sin convertir v.fecha a date, para poder usar un índice sobre fecha
+SQL_VENTAS = """
+    SELECT
+        v.id,
+        v.fecha,
+        c.nombre AS nombre_cliente,
+        c.cedula AS cedula_cliente,
+        v.total,
+        v.metodo_pago,
+        v.descripcion
+    FROM ventas v
+    JOIN clientes c ON v.id_cliente = c.id
+    WHERE v.fecha >= %s::date AND v.fecha < %s::date + INTERVAL '1 day'
+    ORDER BY v.fecha DESC
+"""
+
+
+# Resúmenes para el PDF, leídos de las tablas de resumenes.py:
+# modo -> (título, cabecera del grupo, cabecera de la cantidad, agrupación)
+RESUMENES_PDF = {
+    'por_dia': ('Resumen de Ventas por Día', 'Día', 'Ventas', 'dia'),
+    'por_metodo': ('Resumen de Ventas por Método de Pago', 'Método de Pago', 'Ventas', 'metodo'),
+    'por_producto': ('Resumen de Ventas por Producto', 'Producto', 'Unidades', 'producto'),
+    'por_categoria': ('Resumen de Ventas por Categoría', 'Categoría', 'Unidades', 'categoria'),
+}
+
+# Un PDF detallado se guarda entero en memoria (fpdf no escribe por partes),
+# así que se limita el número de ventas; para más, usar Excel/CSV o un resumen.
+PDF_MAX_FILAS = int(os.environ.get('REPORTE_PDF_MAX_FILAS', 50000))
+
+# xlsxwriter y fpdf solo se cargan al generar el primer reporte de ese tipo:
+# la mayoría de los workers nunca lo hacen y así arrancan antes y ocupan menos.
+_tabla_pdf = None
+
+
+class ReporteDemasiadoGrande(Exception):
+    """El rango pedido supera PDF_MAX_FILAS para un PDF detallado."""
+
+
+def filas_ventas(db, fecha_inicio, fecha_fin, lote=TAMANO_LOTE):
+    """
+    Recorre las ventas del rango con un cursor del lado del servidor, así
+    que en memoria solo hay un lote de filas (tuplas) a la vez.
+    """
+    with db.cursor(name='reporte_ventas') as cursor:
+        cursor.itersize = lote
+        cursor.execute(SQL_VENTAS, (fecha_inicio, fecha_fin))
+        for fila in cursor:
+            yield fila
+
+
+def escribir_excel(db, fecha_inicio, fecha_fin, archivo):
+    """Escribe el reporte en `archivo` con xlsxwriter en modo constant_memory. Devuelve las filas escritas."""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(archivo, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'remove_timezone': True,
+    })
+    worksheet = workbook.add_worksheet('Reporte de Ventas')
+    negrita = workbook.add_format({'bold': True})
+    worksheet.write_row(0, 0, COLUMNAS_VENTAS, negrita)
+
+    total_filas = 0
+    for total_filas, fila in enumerate(filas_ventas(db, fecha_inicio, fecha_fin), start=1):
+        worksheet.write_row(total_filas, 0, fila)
+    workbook.close()
+    return total_filas
+
+
+def copiar_csv(db, fecha_inicio, fecha_fin, archivo):
+    """
+    Vuelca el reporte en CSV con COPY ... TO STDOUT (lo formatea PostgreSQL).
+    Devuelve las filas copiadas.
+
+    Con gevent (asincrono.py) psycopg2 no admite COPY y las filas se leen
+    por lotes con el cursor con nombre.
+    """
+    if asincrono.modo_verde():
+        texto = io.TextIOWrapper(archivo, encoding='utf-8', newline='', write_through=True)
+        escritor = csv.writer(texto, lineterminator='\n')
+        escritor.writerow(COLUMNAS_VENTAS)
+        total_filas = 0
+        for total_filas, fila in enumerate(filas_ventas(db, fecha_inicio, fecha_fin), start=1):
+            escritor.writerow(fila)
+        texto.detach()
+        return total_filas
+    with db.cursor() as cursor:
+        consulta = cursor.mogrify(SQL_VENTAS, (fecha_inicio, fecha_fin)).decode('utf-8')
+        cursor.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER true)", archivo)
+        return cursor.rowcount
+
+
+def archivo_temporal():
+    """Archivo en disco que se borra solo al cerrarse."""
+    return tempfile.TemporaryFile()
+
+
+def respuesta_archivo(archivo, mimetype, nombre_archivo):
+    """
+    Envía el archivo por trozos (respuesta chunked) y lo cierra al terminar,
+    sin cargarlo entero en memoria.
+    """
+    archivo.seek(0)
+
+    def generar():
+        try:
+            while True:
+                trozo = archivo.read(TAMANO_TROZO)
+                if not trozo:
+                    break
+                yield trozo
+        finally:
+            archivo.close()
+
+    return Response(generar(), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment;filename={nombre_archivo}"})
+
+
+def _texto(valor):
+    """fpdf 1.7 solo admite latin-1; lo que no se pueda representar se sustituye."""
+    if valor is None:
+        return ''
+    return str(valor).encode('latin-1', 'replace').decode('latin-1')
+
+
+def clase_tabla_pdf():
+    """Clase TablaPDF (subclase de FPDF), creada la primera vez que se pide."""
+    global _tabla_pdf
+    if _tabla_pdf is not None:
+        return _tabla_pdf
+    from fpdf import FPDF
+
+    class TablaPDF(FPDF):
+        """PDF con una tabla cuya cabecera se repite en cada página."""
+
+        def __init__(self, titulo, subtitulo, columnas):
+            super().__init__()
+            self.titulo = titulo
+            self.subtitulo = subtitulo
+            self.columnas = columnas      # [(cabecera, ancho, alineación)]
+            self.set_auto_page_break(True, margin=15)
+
+        def header(self):
+            self.set_font('Arial', 'B', 12)
+            self.cell(0, 8, _texto(self.titulo), 0, 1, 'C')
+            self.set_font('Arial', '', 9)
+            self.cell(0, 6, _texto(self.subtitulo), 0, 1, 'C')
+            self.ln(3)
+            self.set_font('Arial', 'B', 9)
+            self.set_fill_color(230, 230, 230)
+            for cabecera, ancho, _ in self.columnas:
+                self.cell(ancho, 7, _texto(cabecera), 1, 0, 'C', 1)
+            self.ln()
+            self.set_font('Arial', '', 8)
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_font('Arial', 'I', 8)
+            self.cell(0, 10, _texto(f'Página {self.page_no()}'), 0, 0, 'C')
+
+        def fila(self, valores, negrita=False):
+            if negrita:
+                self.set_font('Arial', 'B', 8)
+            for (_, ancho, alineacion), valor in zip(self.columnas, valores):
+                self.cell(ancho, 6, _texto(valor), 1, 0, alineacion)
+            self.ln()
+            if negrita:
+                self.set_font('Arial', '', 8)
+
+    _tabla_pdf = TablaPDF
+    return _tabla_pdf
+
+
+def precargar():
+    """Importa las bibliotecas de los reportes (para el maestro de gunicorn con preload_app)."""
+    import xlsxwriter  # noqa: F401
+    clase_tabla_pdf()
+
+
+def _moneda(valor):
+    return f"${valor:,.2f}"
+
+
+def generar_pdf(db, fecha_inicio, fecha_fin, modo, archivo):
+    """
+    Escribe en `archivo` el reporte PDF y devuelve el número de filas de la tabla.
+
+    - 'detalle': una fila por venta, leídas por lotes como tuplas.
+    - 'por_dia', 'por_metodo', 'por_producto', 'por_categoria': totales de
+      las tablas de resúmenes, sin recorrer las ventas.
+    """
+    subtitulo = f"Del {fecha_inicio} al {fecha_fin}"
+
+    if modo in RESUMENES_PDF:
+        titulo, cabecera, cabecera_cantidad, agrupar = RESUMENES_PDF[modo]
+        with db.cursor() as cursor:
+            grupos = resumenes.consultar(cursor, agrupar, fecha_inicio, fecha_fin)
+        if not grupos:
+            return 0
+        pdf = clase_tabla_pdf()(titulo, subtitulo, [(cabecera, 90, 'L'), (cabecera_cantidad, 40, 'R'), ('Total', 60, 'R')])
+        pdf.add_page()
+        for grupo, cantidad, total in grupos:
+            pdf.fila((grupo, cantidad, _moneda(total)))
+        pdf.fila(('TOTAL', sum(g[1] for g in grupos), _moneda(sum(g[2] for g in grupos))), negrita=True)
+        total_filas = len(grupos)
+    else:
+        pdf = clase_tabla_pdf()('Reporte de Ventas', subtitulo, [
+            ('ID', 15, 'R'), ('Fecha', 32, 'L'), ('Cliente', 58, 'L'),
+            ('Cédula', 25, 'L'), ('Método de Pago', 30, 'L'), ('Total', 30, 'R'),
+        ])
+        pdf.add_page()
+        total_filas = 0
+        suma = 0
+        for venta_id, fecha, nombre, cedula, total, metodo_pago, _ in filas_ventas(db, fecha_inicio, fecha_fin):
+            total_filas += 1
+            if total_filas > PDF_MAX_FILAS:
+                raise ReporteDemasiadoGrande(
+                    f"El rango tiene más de {PDF_MAX_FILAS} ventas. Usa un resumen, Excel o CSV."
+                )
+            suma += total
+            pdf.fila((venta_id, fecha.strftime('%Y-%m-%d %H:%M'), nombre[:40], cedula, metodo_pago, _moneda(total)))
+        if not total_filas:
+            return 0
+        pdf.fila(('', '', '', '', 'TOTAL', _moneda(suma)), negrita=True)
+
+    archivo.write(pdf.output(dest='S').encode('latin-1'))
+    return total_filas
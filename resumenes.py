@@ -0,0 +1,280 @@
+import sys
+
+import psycopg2
+
+# Totales diarios y por cliente mantenidos en cada venta, para que los
+# reportes, el panel y el historial de un cliente no tengan que recorrer
+# ventas y detalle_ventas.
+SQL_TABLAS = [
+    """
+    CREATE TABLE IF NOT EXISTS resumen_ventas_diario (
+        dia DATE NOT NULL,
+        metodo_pago TEXT NOT NULL,
+        ventas INTEGER NOT NULL DEFAULT 0,
+        total NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, metodo_pago)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resumen_productos_diario (
+        dia DATE NOT NULL,
+        id_producto INTEGER NOT NULL,
+        categoria TEXT,
+        unidades INTEGER NOT NULL DEFAULT 0,
+        importe NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, id_producto)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resumen_clientes (
+        id_cliente INTEGER PRIMARY KEY REFERENCES clientes (id) ON DELETE CASCADE,
+        compras INTEGER NOT NULL DEFAULT 0,
+        total NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        primera_compra TIMESTAMP,
+        ultima_compra TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resumen_clientes_productos (
+        id_cliente INTEGER NOT NULL REFERENCES clientes (id) ON DELETE CASCADE,
+        id_producto INTEGER NOT NULL,
+        unidades INTEGER NOT NULL DEFAULT 0,
+        importe NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (id_cliente, id_producto)
+    )
+    """,
+    # Productos más comprados de un cliente sin ordenar todos los suyos
+    """
+    CREATE INDEX IF NOT EXISTS idx_resumen_clientes_productos_unidades
+    ON resumen_clientes_productos (id_cliente, unidades DESC, id_producto)
+    """,
+]
+
+# Tablas de cada grupo de resúmenes; cada grupo se mantiene si sus tablas
+# existen, así que una base de datos sin las nuevas sigue con las demás
+TABLAS = {
+    'diario': ('resumen_ventas_diario', 'resumen_productos_diario'),
+    'clientes': ('resumen_clientes', 'resumen_clientes_productos'),
+}
+
+# Productos que se muestran en el resumen de un cliente
+PRODUCTOS_CLIENTE = 5
+
+# Agrupaciones disponibles: consulta que devuelve (grupo, cantidad, total)
+CONSULTAS = {
+    'dia': """
+        SELECT dia AS grupo, sum(ventas) AS cantidad, sum(total) AS total
+        FROM resumen_ventas_diario
+        WHERE dia BETWEEN %s::date AND %s::date
+        GROUP BY dia
+        ORDER BY dia
+    """,
+    'metodo': """
+        SELECT metodo_pago AS grupo, sum(ventas) AS cantidad, sum(total) AS total
+        FROM resumen_ventas_diario
+        WHERE dia BETWEEN %s::date AND %s::date
+        GROUP BY metodo_pago
+        ORDER BY total DESC
+    """,
+    'producto': """
+        SELECT coalesce(p.nombre, 'Producto ' || r.id_producto) AS grupo,
+               sum(r.unidades) AS cantidad, sum(r.importe) AS total
+        FROM resumen_productos_diario r
+        LEFT JOIN productos p ON p.id = r.id_producto
+        WHERE r.dia BETWEEN %s::date AND %s::date
+        GROUP BY r.id_producto, p.nombre
+        ORDER BY total DESC
+    """,
+    'categoria': """
+        SELECT coalesce(categoria, 'N/A') AS grupo, sum(unidades) AS cantidad, sum(importe) AS total
+        FROM resumen_productos_diario
+        WHERE dia BETWEEN %s::date AND %s::date
+        GROUP BY 1
+        ORDER BY total DESC
+    """,
+}
+
+# Grupo -> si existen sus tablas en esta base de datos (sin clave = aún no se ha comprobado)
+_tablas_disponibles = {}
+_avisados = set()
+
+
+def crear_tablas(db):
+    with db.cursor() as cursor:
+        for sql in SQL_TABLAS:
+            cursor.execute(sql)
+    db.commit()
+
+
+def _disponibles(cursor, grupo):
+    # Solo se recuerda que las tablas existen: si faltan se vuelve a mirar en
+    # la siguiente venta, para notar cuándo se crean sin reiniciar la aplicación.
+    if grupo in _tablas_disponibles:
+        return True
+    cursor.execute("SELECT bool_and(to_regclass(t) IS NOT NULL) FROM unnest(%s::text[]) AS t",
+                   (list(TABLAS[grupo]),))
+    if cursor.fetchone()[0]:
+        _tablas_disponibles[grupo] = True
+        return True
+    if grupo not in _avisados:
+        _avisados.add(grupo)
+        print(f"Faltan las tablas de resúmenes ({grupo}); ejecuta 'python esquema.py' y "
+              f"'python resumenes.py --reconstruir'.")
+    return False
+
+
+def registrar_venta(cursor, id_cliente, fecha, metodo_pago, total_venta, lineas):
+    """
+    Suma una venta a los resúmenes dentro de la transacción de la venta.
+    `lineas` es [(id_producto, categoria, unidades, importe)] ordenada por id,
+    para que las filas se bloqueen siempre en el mismo orden.
+    """
+    if _disponibles(cursor, 'diario'):
+        _registrar_diario(cursor, fecha.date(), metodo_pago, total_venta, lineas)
+    if _disponibles(cursor, 'clientes'):
+        _registrar_cliente(cursor, id_cliente, fecha, total_venta, lineas)
+
+
+def _registrar_diario(cursor, dia, metodo_pago, total_venta, lineas):
+    cursor.execute("""
+        INSERT INTO resumen_ventas_diario (dia, metodo_pago, ventas, total)
+        VALUES (%s, coalesce(%s, 'N/A'), 1, %s)
+        ON CONFLICT (dia, metodo_pago) DO UPDATE
+        SET ventas = resumen_ventas_diario.ventas + 1,
+            total = resumen_ventas_diario.total + EXCLUDED.total
+    """, (dia, metodo_pago, total_venta))
+    cursor.execute("""
+        INSERT INTO resumen_productos_diario (dia, id_producto, categoria, unidades, importe)
+        SELECT %s, l.id_producto, l.categoria, l.unidades, l.importe
+        FROM unnest(%s::int[], %s::text[], %s::int[], %s::numeric[]) AS l(id_producto, categoria, unidades, importe)
+        ON CONFLICT (dia, id_producto) DO UPDATE
+        SET unidades = resumen_productos_diario.unidades + EXCLUDED.unidades,
+            importe = resumen_productos_diario.importe + EXCLUDED.importe,
+            categoria = EXCLUDED.categoria
+    """, (dia, [l[0] for l in lineas], [l[1] for l in lineas], [l[2] for l in lineas], [l[3] for l in lineas]))
+
+
+def _registrar_cliente(cursor, id_cliente, fecha, total_venta, lineas):
+    # Una sola sentencia para el resumen del cliente y sus productos
+    cursor.execute("""
+        WITH cliente AS (
+            INSERT INTO resumen_clientes (id_cliente, compras, total, primera_compra, ultima_compra)
+            VALUES (%s, 1, %s, %s, %s)
+            ON CONFLICT (id_cliente) DO UPDATE
+            SET compras = resumen_clientes.compras + 1,
+                total = resumen_clientes.total + EXCLUDED.total,
+                primera_compra = least(resumen_clientes.primera_compra, EXCLUDED.primera_compra),
+                ultima_compra = greatest(resumen_clientes.ultima_compra, EXCLUDED.ultima_compra)
+        )
+        INSERT INTO resumen_clientes_productos (id_cliente, id_producto, unidades, importe)
+        SELECT %s, l.id_producto, l.unidades, l.importe
+        FROM unnest(%s::int[], %s::int[], %s::numeric[]) AS l(id_producto, unidades, importe)
+        ON CONFLICT (id_cliente, id_producto) DO UPDATE
+        SET unidades = resumen_clientes_productos.unidades + EXCLUDED.unidades,
+            importe = resumen_clientes_productos.importe + EXCLUDED.importe
+    """, (id_cliente, total_venta, fecha, fecha,
+          id_cliente, [l[0] for l in lineas], [l[2] for l in lineas], [l[3] for l in lineas]))
+
+
+def reconstruir(db, desde=None, hasta=None):
+    """
+    Recalcula los resúmenes a partir de ventas y detalle_ventas (carga
+    inicial o reparación). Sin fechas recalcula todo el historial; los
+    resúmenes por cliente abarcan todas sus compras y se recalculan siempre
+    enteros.
+    """
+    crear_tablas(db)
+    desde = desde or '-infinity'
+    hasta = hasta or 'infinity'
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM resumen_ventas_diario WHERE dia BETWEEN %s::date AND %s::date", (desde, hasta))
+        cursor.execute("DELETE FROM resumen_productos_diario WHERE dia BETWEEN %s::date AND %s::date", (desde, hasta))
+        cursor.execute("""
+            INSERT INTO resumen_ventas_diario (dia, metodo_pago, ventas, total)
+            SELECT v.fecha::date, coalesce(v.metodo_pago, 'N/A'), count(*), sum(v.total)
+            FROM ventas v
+            WHERE v.fecha >= %s::date AND v.fecha < %s::date + INTERVAL '1 day'
+            GROUP BY 1, 2
+        """, (desde, hasta))
+        cursor.execute("""
+            INSERT INTO resumen_productos_diario (dia, id_producto, categoria, unidades, importe)
+            SELECT v.fecha::date, dv.id_producto, max(p.categoria), sum(dv.cantidad),
+                   sum(dv.cantidad * dv.precio_unitario)
+            FROM ventas v
+            JOIN detalle_ventas dv ON dv.id_venta = v.id
+            LEFT JOIN productos p ON p.id = dv.id_producto
+            WHERE v.fecha >= %s::date AND v.fecha < %s::date + INTERVAL '1 day'
+            GROUP BY 1, 2
+        """, (desde, hasta))
+        cursor.execute("DELETE FROM resumen_clientes_productos")
+        cursor.execute("DELETE FROM resumen_clientes")
+        cursor.execute("""
+            INSERT INTO resumen_clientes (id_cliente, compras, total, primera_compra, ultima_compra)
+            SELECT id_cliente, count(*), sum(total), min(fecha), max(fecha)
+            FROM ventas
+            GROUP BY id_cliente
+        """)
+        cursor.execute("""
+            INSERT INTO resumen_clientes_productos (id_cliente, id_producto, unidades, importe)
+            SELECT v.id_cliente, dv.id_producto, sum(dv.cantidad), sum(dv.cantidad * dv.precio_unitario)
+            FROM ventas v
+            JOIN detalle_ventas dv ON dv.id_venta = v.id
+            GROUP BY 1, 2
+        """)
+    db.commit()
+    _tablas_disponibles.update(dict.fromkeys(TABLAS, True))
+
+
+def consultar(cursor, agrupar, desde, hasta):
+    """Filas [(grupo, cantidad, total)] del rango agrupadas por día, método, producto o categoría."""
+    cursor.execute(CONSULTAS[agrupar], (desde, hasta))
+    return cursor.fetchall()
+
+
+def resumen_cliente(cursor, id_cliente):
+    """
+    Compras, total gastado, primera y última compra y los PRODUCTOS_CLIENTE
+    productos más comprados del cliente, leídos del resumen (dos filas por
+    índice, no su historial). Un cliente sin compras tiene 0 compras.
+    """
+    resumen = {'compras': 0, 'total': 0.0, 'primera_compra': None, 'ultima_compra': None, 'productos': []}
+    if not _disponibles(cursor, 'clientes'):
+        return resumen
+    cursor.execute("SELECT compras, total, primera_compra, ultima_compra FROM resumen_clientes WHERE id_cliente = %s",
+                   (id_cliente,))
+    fila = cursor.fetchone()
+    if fila is None:
+        return resumen
+    compras, total, primera, ultima = fila
+    cursor.execute("""
+        SELECT r.id_producto, coalesce(p.nombre, 'Producto ' || r.id_producto), r.unidades, r.importe
+        FROM resumen_clientes_productos r
+        LEFT JOIN productos p ON p.id = r.id_producto
+        WHERE r.id_cliente = %s
+        ORDER BY r.unidades DESC, r.id_producto
+        LIMIT %s
+    """, (id_cliente, PRODUCTOS_CLIENTE))
+    resumen.update({
+        'compras': compras,
+        'total': float(total),
+        'primera_compra': primera.isoformat() if primera else None,
+        'ultima_compra': ultima.isoformat() if ultima else None,
+        'productos': [{'id': id_producto, 'nombre': nombre, 'unidades': unidades, 'importe': float(importe)}
+                      for id_producto, nombre, unidades, importe in cursor.fetchall()],
+    })
+    return resumen
+
+
+if __name__ == '__main__':
+    # Uso: python resumenes.py --reconstruir [desde] [hasta]
+    from app import obtener_database_url
+    if '--reconstruir' not in sys.argv:
+        print("Uso: python resumenes.py --reconstruir [desde] [hasta]")
+        sys.exit(1)
+    fechas = [a for a in sys.argv[1:] if not a.startswith('--')]
+    db = psycopg2.connect(obtener_database_url())
+    try:
+        reconstruir(db, *fechas[:2])
+        print("Resúmenes de ventas reconstruidos.")
+    finally:
+        db.close()
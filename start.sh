@@ -1,2 +1,9 @@
 pip install gunicorn
-gunicorn --bind 0.0.0.0:8000 app:app
\ No newline at end of file
+# SERVIDOR_MODO=gevent: un worker atiende muchas peticiones a la vez (ver asincrono.py)
+# SERVIDOR_PRECARGA=1: los workers sync comparten la aplicación cargada en el maestro (ver gunicorn.conf.py)
+if [ "$SERVIDOR_MODO" = "gevent" ]; then
+    pip install gevent
+    gunicorn --config gunicorn.conf.py --worker-class gevent --worker-connections "${GEVENT_CONEXIONES:-200}" --bind 0.0.0.0:8000 app:app
+else
+    gunicorn --config gunicorn.conf.py --bind 0.0.0.0:8000 app:app
+fi
@@ -0,0 +1,298 @@
+// URLs que pasa la plantilla en los atributos data-* de la etiqueta <script>
+const urls = document.currentScript.dataset;
+
+let productosEnVenta = [];
+const totalVentaSpan = document.getElementById('total-venta');
+const totalVentaInput = document.getElementById('total_venta_input');
+const productosVendidosInput = document.getElementById('productos_vendidos_input');
+const productosResumenContainer = document.getElementById('productos-resumen-container');
+const textoSinProductos = document.getElementById('texto-sin-productos');
+
+const productoInput = document.getElementById('producto_selector');
+const productosOptions = document.getElementById('productosOptions');
+const precioInput = document.getElementById('precio_input');
+
+// El catálogo se pide una vez al abrir el formulario; si no ha cambiado,
+// el servidor responde 304 y el navegador reutiliza su copia.
+async function cargarCatalogo() {
+    try {
+        const response = await fetch(urls.catalogo, { cache: 'no-cache' });
+        const catalogo = await response.json();
+        const fragmento = document.createDocumentFragment();
+        catalogo.productos.forEach(producto => {
+            const option = document.createElement('option');
+            option.dataset.id = producto.id;
+            option.dataset.nombre = producto.nombre;
+            option.dataset.precio = producto.precio;
+            option.dataset.stock = producto.cantidad;
+            option.value = `${producto.nombre} (Stock: ${producto.cantidad})`;
+            fragmento.appendChild(option);
+        });
+        productosOptions.innerHTML = '';
+        productosOptions.appendChild(fragmento);
+    } catch (error) {
+        console.error('Error al cargar el catálogo de productos:', error);
+    }
+}
+
+// Precios, stock y total del carrito según el servidor (una sola consulta).
+// Devuelve null si no se ha podido comprobar: la venta lo vuelve a comprobar al registrarse.
+async function validarCarrito(productos) {
+    try {
+        const response = await fetch(urls.validarCarrito, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ productos: productos.map(p => ({ id: p.id, cantidad: p.cantidad })) }),
+        });
+        if (!response.ok) {
+            return null;
+        }
+        return await response.json();
+    } catch (error) {
+        console.error('Error al validar el carrito:', error);
+        return null;
+    }
+}
+
+// Copia al carrito y al catálogo los precios y el stock actuales; devuelve
+// true si algún precio del carrito ha cambiado
+function aplicarValidacion(resultado) {
+    let preciosCambiados = false;
+    resultado.lineas.forEach(linea => {
+        const producto = productosEnVenta.find(p => Number(p.id) === linea.id);
+        if (producto && producto.precio !== linea.precio) {
+            producto.precio = linea.precio;
+            preciosCambiados = true;
+        }
+        const opcion = productosOptions.querySelector(`[data-id='${linea.id}']`);
+        if (opcion) {
+            opcion.dataset.precio = linea.precio;
+            opcion.dataset.stock = linea.stock;
+        }
+    });
+    return preciosCambiados;
+}
+
+function actualizarTotal() {
+    let total = productosEnVenta.reduce((sum, item) => sum + (item.precio * item.cantidad), 0);
+    totalVentaSpan.textContent = total.toFixed(2);
+    totalVentaInput.value = total.toFixed(2);
+
+    if (productosEnVenta.length > 0) {
+        textoSinProductos.style.display = 'none';
+    } else {
+        textoSinProductos.style.display = 'block';
+    }
+}
+
+function renderizarProductosEnVenta() {
+    productosResumenContainer.innerHTML = '';
+    if (productosEnVenta.length === 0) {
+        productosResumenContainer.appendChild(textoSinProductos);
+    }
+    productosEnVenta.forEach((producto, index) => {
+        const row = document.createElement('div');
+        row.className = 'row g-2 mb-2 align-items-center border-bottom pb-2';
+        row.innerHTML = `
+            <div class="col-8">
+                <strong>${producto.nombre}</strong><br>
+                <small>Cantidad: ${producto.cantidad} x $${producto.precio.toFixed(2)}</small>
+            </div>
+            <div class="col-3 text-end">
+                $${(producto.cantidad * producto.precio).toFixed(2)}
+            </div>
+            <div class="col-1 text-end">
+                <button type="button" class="btn btn-danger btn-sm eliminar-producto" data-index="${index}">
+                    <i class="fas fa-trash"></i>
+                </button>
+            </div>
+            <input type="hidden" name="descripcion_producto_${producto.id}" value="${producto.descripcion_producto}">
+        `;
+        productosResumenContainer.appendChild(row);
+    });
+    actualizarTotal();
+}
+
+productoInput.addEventListener('change', function() {
+    const valorSeleccionado = this.value;
+    const opcion = productosOptions.querySelector(`[value='${valorSeleccionado}']`);
+    if (opcion) {
+        const precio = parseFloat(opcion.dataset.precio);
+        precioInput.value = precio.toFixed(2);
+    } else {
+        precioInput.value = "";
+    }
+});
+
+document.getElementById('agregar-producto').addEventListener('click', async function() {
+    const valorSeleccionado = productoInput.value;
+    const opcion = productosOptions.querySelector(`[value='${valorSeleccionado}']`);
+
+    if (!opcion) {
+        alert('Por favor, selecciona un producto de la lista.');
+        return;
+    }
+
+    const id = opcion.dataset.id;
+    const cantidad = parseInt(document.getElementById('cantidad_input').value, 10);
+    const precio = parseFloat(precioInput.value);
+    const descripcion_producto = document.getElementById('descripcion_producto_input').value;
+
+    if (cantidad <= 0 || isNaN(precio) || precio <= 0) {
+        alert('Por favor, especifica una cantidad y un precio válidos.');
+        return;
+    }
+
+    const nombre = opcion.dataset.nombre;
+    const stock = parseInt(opcion.dataset.stock, 10);
+
+    const productoExistenteIndex = productosEnVenta.findIndex(p => p.id === id);
+    let cantidadTotal = cantidad;
+    if (productoExistenteIndex !== -1) {
+        cantidadTotal += productosEnVenta[productoExistenteIndex].cantidad;
+    }
+
+    if (cantidadTotal > stock) {
+        alert(`No hay suficiente stock para este producto. Disponible: ${stock}`);
+        return;
+    }
+
+    // El catálogo puede estar desactualizado: se comprueba el carrito completo con el servidor
+    const carrito = productosEnVenta.map(p => ({ id: p.id, cantidad: p.id === id ? cantidadTotal : p.cantidad }));
+    if (productoExistenteIndex === -1) {
+        carrito.push({ id, cantidad });
+    }
+    this.disabled = true;
+    const resultado = await validarCarrito(carrito);
+    this.disabled = false;
+    if (resultado && resultado.errores.length > 0) {
+        aplicarValidacion(resultado);
+        renderizarProductosEnVenta();
+        alert(resultado.errores.join('\n'));
+        return;
+    }
+
+    if (productoExistenteIndex !== -1) {
+        productosEnVenta[productoExistenteIndex].cantidad += cantidad;
+        productosEnVenta[productoExistenteIndex].descripcion_producto += ` - ${descripcion_producto}`;
+    } else {
+        productosEnVenta.push({ id, nombre, precio, cantidad, descripcion_producto });
+    }
+    if (resultado) {
+        aplicarValidacion(resultado);
+    }
+
+    renderizarProductosEnVenta();
+    productoInput.value = "";
+    document.getElementById('cantidad_input').value = 1;
+    precioInput.value = "";
+    document.getElementById('descripcion_producto_input').value = "";
+});
+
+productosResumenContainer.addEventListener('click', function(e) {
+    if (e.target.classList.contains('eliminar-producto') || e.target.closest('.eliminar-producto')) {
+        const button = e.target.closest('.eliminar-producto');
+        const index = button.dataset.index;
+        productosEnVenta.splice(index, 1);
+        renderizarProductosEnVenta();
+    }
+});
+
+document.getElementById('btn-finalizar-venta-summary').addEventListener('click', async function() {
+    if (productosEnVenta.length === 0) {
+        alert('No puedes registrar una venta sin productos.');
+        return;
+    }
+
+    const cliente_cedula = document.getElementById('cliente_cedula_input').value;
+    if (!cliente_cedula) {
+        alert('Debes ingresar la cédula del cliente para registrar la venta.');
+        return;
+    }
+
+    // Última comprobación antes de confirmar, para no enviar una venta que el servidor rechazaría
+    this.disabled = true;
+    const resultado = await validarCarrito(productosEnVenta);
+    this.disabled = false;
+    if (resultado) {
+        const preciosCambiados = aplicarValidacion(resultado);
+        renderizarProductosEnVenta();
+        if (resultado.errores.length > 0) {
+            alert(resultado.errores.join('\n'));
+            return;
+        }
+        if (preciosCambiados) {
+            alert('Algunos precios han cambiado. Revisa el total antes de confirmar la venta.');
+        }
+    }
+
+    // Buscar el nombre del cliente en el datalist
+    const clientesOptions = document.getElementById('clientes_list').options;
+    let cliente_nombre = "Cliente no encontrado";
+    for (let option of clientesOptions) {
+        if (option.value === cliente_cedula) {
+            // Extraer el nombre del texto de la opción (formato: cedula - nombre)
+            cliente_nombre = option.textContent.split(' - ')[1] || cliente_cedula;
+            break;
+        }
+    }
+
+    const metodo_pago_text = document.getElementById('metodo_pago').options[document.getElementById('metodo_pago').selectedIndex].text;
+
+    document.getElementById('modal-cliente').textContent = `${cliente_nombre} (${cliente_cedula})`;
+    document.getElementById('modal-metodo-pago').textContent = metodo_pago_text;
+    document.getElementById('modal-total').textContent = `$${totalVentaSpan.textContent}`;
+
+    const modalProductosLista = document.getElementById('modal-lista-productos');
+    modalProductosLista.innerHTML = '';
+    productosEnVenta.forEach(producto => {
+        const li = document.createElement('li');
+        li.textContent = `${producto.nombre} x${producto.cantidad} - Subtotal: $${(producto.precio * producto.cantidad).toFixed(2)}`;
+        modalProductosLista.appendChild(li);
+    });
+
+    const confirmacionModal = new bootstrap.Modal(document.getElementById('confirmacionModal'));
+    confirmacionModal.show();
+});
+
+document.getElementById('btn-finalizar-venta-modal').addEventListener('click', function() {
+    // Evita el doble clic; si aun así llega un segundo envío, el servidor
+    // lo reconoce por la clave del formulario y no repite la venta
+    this.disabled = true;
+    productosVendidosInput.value = JSON.stringify(productosEnVenta);
+    document.getElementById('formNuevaVenta').submit();
+});
+
+document.addEventListener('DOMContentLoaded', function() {
+    const clienteInput = document.getElementById('cliente_cedula_input');
+    const clientesList = document.getElementById('clientes_list');
+
+    clienteInput.addEventListener('input', async function() {
+        const query = this.value;
+        if (query.length < 2) {
+            clientesList.innerHTML = '';
+            return;
+        }
+
+        try {
+            // Llama a la ruta en el servidor para buscar clientes por nombre o cédula
+            const response = await fetch(`${urls.buscarCliente}?q=${encodeURIComponent(query)}`);
+            const clientes = await response.json();
+
+            clientesList.innerHTML = '';
+            clientes.forEach(cliente => {
+                const option = document.createElement('option');
+                option.value = cliente.cedula;
+                option.textContent = `${cliente.cedula} - ${cliente.nombre}`;
+                clientesList.appendChild(option);
+            });
+
+        } catch (error) {
+            console.error('Error al buscar clientes:', error);
+        }
+    });
+});
+
+// Inicializar el renderizado para mostrar el texto "Aún no se han añadido productos."
+renderizarProductosEnVenta();
+cargarCatalogo();
@@ -0,0 +1,52 @@
+// URLs que pasa la plantilla en los atributos data-* de la etiqueta <script>
+const urls = document.currentScript.dataset;
+
+const formReporte = document.getElementById('formReporte');
+const estadoReporte = document.getElementById('estado-reporte');
+
+function mostrarEstado(mensaje, tipo, enlace) {
+    const alerta = document.createElement('div');
+    alerta.className = `alert alert-${tipo} mb-0`;
+    alerta.textContent = mensaje;
+    if (enlace) {
+        const a = document.createElement('a');
+        a.href = enlace;
+        a.textContent = 'descargar';
+        alerta.appendChild(a);
+    }
+    estadoReporte.replaceChildren(alerta);
+}
+
+async function seguirTrabajo(url) {
+    const response = await fetch(url);
+    const trabajo = await response.json();
+    if (trabajo.estado === 'listo') {
+        mostrarEstado('Reporte listo: ', 'success', trabajo.url_descarga);
+    } else if (trabajo.estado === 'vacio' || trabajo.estado === 'error') {
+        mostrarEstado(trabajo.mensaje || 'No se pudo generar el reporte.', trabajo.estado === 'vacio' ? 'info' : 'danger');
+    } else {
+        mostrarEstado('Generando el reporte...', 'secondary');
+        setTimeout(() => seguirTrabajo(url), 2000);
+    }
+}
+
+formReporte.addEventListener('submit', async function(e) {
+    if (!document.getElementById('en_segundo_plano').checked) {
+        return;
+    }
+    e.preventDefault();
+    const datos = new FormData(formReporte);
+    datos.append('report_type', e.submitter.value);
+    try {
+        const response = await fetch(urls.crearTrabajo, { method: 'POST', body: datos });
+        const trabajo = await response.json();
+        if (!response.ok) {
+            mostrarEstado(trabajo.error, 'danger');
+            return;
+        }
+        seguirTrabajo(trabajo.url_estado);
+    } catch (error) {
+        console.error('Error al encolar el reporte:', error);
+        mostrarEstado('Error al encolar el reporte.', 'danger');
+    }
+});
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import psycopg2
+
+from reportes import ReporteDemasiadoGrande, copiar_csv, escribir_excel, generar_pdf
+
+# Los trabajos se guardan en disco (un .json de estado y el archivo generado)
+# para que cualquier worker de gunicorn pueda consultar o descargar un
+# trabajo que lanzó otro.
+DIRECTORIO = os.environ.get('REPORTES_DIR', os.path.join(tempfile.gettempdir(), 'muebles2000_reportes'))
+MAX_PROCESOS = int(os.environ.get('REPORTES_MAX_PROCESOS', 2))
+MAX_PENDIENTES = int(os.environ.get('REPORTES_MAX_PENDIENTES', 10))
+# Segundos que se conserva un reporte terminado
+TTL = int(os.environ.get('REPORTES_TTL', 3600))
+# Un trabajo "en_curso" más antiguo que esto se considera perdido (worker caído)
+TIEMPO_MAXIMO = int(os.environ.get('REPORTES_TIEMPO_MAXIMO', 1800))
+
+EXTENSIONES = {'excel': 'xlsx', 'csv': 'csv', 'pdf': 'pdf'}
+MIMETYPES = {
+    'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'pdf': 'application/pdf',
+}
+
+_ID_VALIDO = re.compile(r'^[0-9a-f]{40}$')
+
+
+class ColaLlena(Exception):
+    """Hay demasiados reportes pendientes en este worker."""
+
+
+def _ruta(trabajo_id, extension='json'):
+    return os.path.join(DIRECTORIO, f"{trabajo_id}.{extension}")
+
+
+def _guardar_estado(trabajo_id, estado):
+    # Escritura atómica: nadie lee nunca un .json a medio escribir
+    temporal = _ruta(trabajo_id, f"json.{os.getpid()}.tmp")
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estado, f)
+    os.replace(temporal, _ruta(trabajo_id))
+
+
+def leer_estado(trabajo_id):
+    """Estado del trabajo, o None si no existe (o el id no es válido)."""
+    if not _ID_VALIDO.match(trabajo_id or ''):
+        return None
+    try:
+        with open(_ruta(trabajo_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def ruta_resultado(estado):
+    return _ruta(estado['id'], EXTENSIONES[estado['tipo']])
+
+
+def _ejecutar(trabajo_id, dsn, tipo, fecha_inicio, fecha_fin, pdf_modo):
+    """Genera el reporte en un proceso del pool, con su propia conexión."""
+    estado = leer_estado(trabajo_id)
+    estado['estado'] = 'en_curso'
+    estado['iniciado'] = time.time()
+    _guardar_estado(trabajo_id, estado)
+
+    destino = ruta_resultado(estado)
+    temporal = destino + '.tmp'
+    db = None
+    try:
+        db = psycopg2.connect(dsn)
+        with open(temporal, 'wb') as archivo:
+            if tipo == 'excel':
+                filas = escribir_excel(db, fecha_inicio, fecha_fin, archivo)
+            elif tipo == 'csv':
+                filas = copiar_csv(db, fecha_inicio, fecha_fin, archivo)
+            else:
+                filas = generar_pdf(db, fecha_inicio, fecha_fin, pdf_modo, archivo)
+        if filas:
+            os.replace(temporal, destino)
+            estado['estado'] = 'listo'
+        else:
+            os.remove(temporal)
+            estado['estado'] = 'vacio'
+            estado['mensaje'] = "No se encontraron ventas para el rango de fechas seleccionado."
+        estado['filas'] = filas
+    except (psycopg2.Error, ReporteDemasiadoGrande, OSError) as err:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        estado['estado'] = 'error'
+        estado['mensaje'] = str(err)
+    finally:
+        if db is not None:
+            db.close()
+    estado['terminado'] = time.time()
+    _guardar_estado(trabajo_id, estado)
+
+
+def _caducado(estado, ahora):
+    if estado['estado'] in ('pendiente', 'en_curso'):
+        return ahora - estado['creado'] > TIEMPO_MAXIMO
+    return ahora - estado.get('terminado', estado['creado']) > TTL
+
+
+def _borrar(trabajo_id, tipo):
+    for ruta in (_ruta(trabajo_id, EXTENSIONES.get(tipo, 'pdf')), _ruta(trabajo_id)):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+def limpiar():
+    """Borra los trabajos caducados y sus archivos."""
+    ahora = time.time()
+    for nombre in os.listdir(DIRECTORIO):
+        if not nombre.endswith('.json'):
+            continue
+        estado = leer_estado(nombre[:-5])
+        if estado and _caducado(estado, ahora):
+            _borrar(estado['id'], estado['tipo'])
+
+
+class ColaReportes:
+    """
+    Cola de reportes en segundo plano de un worker: un ProcessPoolExecutor
+    con MAX_PROCESOS procesos y como mucho MAX_PENDIENTES trabajos en espera.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pendientes = 0
+
+    def _obtener_executor(self):
+        # Un executor por proceso: el de un padre no sirve tras el fork de gunicorn.
+        # Se usa "spawn" para que los hijos no hereden las conexiones del worker.
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=MAX_PROCESOS,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            self._pid = os.getpid()
+            self._pendientes = 0
+        return self._executor
+
+    def enviar(self, dsn, tipo, fecha_inicio, fecha_fin, pdf_modo='detalle', version=None):
+        """
+        Encola un reporte y devuelve su estado. Dos peticiones iguales (mismo
+        tipo, rango, modo y `version`) comparten el mismo trabajo mientras no
+        caduque. `version` son las versiones de los datos del reporte (ver
+        versiones.py): tras una venta la clave cambia y un reporte terminado
+        no se sirve con datos viejos.
+        """
+        if tipo not in EXTENSIONES:
+            raise ValueError(f"Tipo de reporte no válido: {tipo}")
+        if tipo != 'pdf':
+            pdf_modo = None
+
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        limpiar()
+
+        clave = json.dumps([tipo, fecha_inicio, fecha_fin, pdf_modo, version])
+        trabajo_id = hashlib.sha1(clave.encode('utf-8')).hexdigest()
+        estado = {
+            'id': trabajo_id,
+            'tipo': tipo,
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'pdf_modo': pdf_modo,
+            'estado': 'pendiente',
+            'creado': time.time(),
+        }
+
+        with self._lock:
+            if self._pendientes >= MAX_PENDIENTES:
+                raise ColaLlena("Hay demasiados reportes en preparación. Inténtalo en unos minutos.")
+            # O_EXCL hace que solo un worker cree el trabajo si llegan dos iguales a la vez
+            try:
+                descriptor = os.open(_ruta(trabajo_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                existente = leer_estado(trabajo_id)
+                if existente is None:
+                    # El .json existe pero aún se está escribiendo: se trata como pendiente
+                    return estado
+                if existente['estado'] not in ('error', 'vacio'):
+                    return existente
+                # Un trabajo fallido o sin datos no se reutiliza: se borra y se vuelve a lanzar
+                _borrar(trabajo_id, tipo)
+                try:
+                    descriptor = os.open(_ruta(trabajo_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    # Otro worker lo ha vuelto a lanzar entre el borrado y este intento
+                    return leer_estado(trabajo_id) or estado
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump(estado, f)
+
+            argumentos = (_ejecutar, trabajo_id, dsn, tipo, fecha_inicio, fecha_fin, pdf_modo)
+            try:
+                future = self._obtener_executor().submit(*argumentos)
+            except BrokenProcessPool:
+                # Algún proceso del pool murió: se crea uno nuevo
+                self._executor = None
+                future = self._obtener_executor().submit(*argumentos)
+            self._pendientes += 1
+
+        def terminado(future):
+            with self._lock:
+                self._pendientes -= 1
+            if future.exception() is not None:
+                fallido = dict(estado, estado='error', mensaje=str(future.exception()), terminado=time.time())
+                _guardar_estado(trabajo_id, fallido)
+
+        future.add_done_callback(terminado)
+        return estado
+
+
+cola_reportes = ColaReportes()
@@ -0,0 +1,267 @@
+import os
+import random
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+import psycopg2.errors
+from psycopg2.extras import execute_values
+
+import metricas
+import resumenes
+
+# Claves de idempotencia de las ventas: el formulario envía una clave única y
+# un segundo envío con la misma clave (doble clic, reintento del navegador)
+# devuelve la venta ya registrada en lugar de repetirla. Se guardan en la
+# misma transacción que la venta, así que valen para todos los workers.
+SQL_TABLAS = [
+    """
+    CREATE TABLE IF NOT EXISTS ventas_idempotencia (
+        clave TEXT PRIMARY KEY,
+        id_venta INTEGER REFERENCES ventas (id) ON DELETE SET NULL,
+        usuario TEXT,
+        creada TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    # Borrado de las claves caducadas
+    "CREATE INDEX IF NOT EXISTS idx_ventas_idempotencia_creada ON ventas_idempotencia (creada)",
+]
+
+# Horas que se recuerda una clave (tiempo en el que se detecta un envío repetido)
+CLAVE_TTL_HORAS = float(os.environ.get('VENTAS_CLAVE_TTL_HORAS', 24))
+MAX_LONGITUD_CLAVE = 100
+# Claves caducadas que borra cada venta (sin esperar por las que borra otra)
+PURGA_POR_VENTA = 100
+
+# Reintentos de una venta que falla por un interbloqueo o un conflicto de
+# serialización, con espera exponencial (y algo de azar para que las ventas
+# en conflicto no vuelvan a coincidir)
+REINTENTOS = int(os.environ.get('VENTAS_REINTENTOS', 3))
+ESPERA_REINTENTO = float(os.environ.get('VENTAS_REINTENTO_ESPERA_MS', 50)) / 1000
+ERRORES_REINTENTABLES = (psycopg2.errors.DeadlockDetected, psycopg2.errors.SerializationFailure)
+
+
+class VentaRechazada(Exception):
+    """La venta no se puede registrar (cliente inexistente, falta de stock...)."""
+
+
+def crear_tablas(db):
+    with db.cursor() as cursor:
+        for sql in SQL_TABLAS:
+            cursor.execute(sql)
+    db.commit()
+
+
+def agrupar_productos(productos_vendidos):
+    """
+    Suma las cantidades por producto y las devuelve ordenadas por id, que es
+    el orden en el que se bloquean las filas (siempre el mismo en todas las
+    ventas, para que dos ventas concurrentes no se bloqueen mutuamente).
+    """
+    cantidades = {}
+    for producto in productos_vendidos:
+        id_producto = int(producto['id'])
+        cantidad = int(producto['cantidad'])
+        if cantidad <= 0:
+            raise VentaRechazada(f"Cantidad no válida para el producto ID {id_producto}.")
+        cantidades[id_producto] = cantidades.get(id_producto, 0) + cantidad
+    return OrderedDict(sorted(cantidades.items()))
+
+
+def validar_carrito(cursor, productos):
+    """
+    Comprueba un carrito con los precios y el stock actuales, en una sola
+    consulta y sin bloquear filas: el formulario de venta lo llama cada vez
+    que se añade un producto. La venta vuelve a comprobarlo todo con las
+    filas bloqueadas (ver registrar_venta).
+
+    Devuelve {'lineas', 'total', 'errores'}; las líneas van en el orden de
+    agrupar_productos, con el precio, el stock y el subtotal de cada una.
+    """
+    cantidades = agrupar_productos(productos)
+    cursor.execute("SELECT id, nombre, precio, cantidad FROM productos WHERE id = ANY(%s)", (list(cantidades),))
+    existentes = {fila[0]: fila[1:] for fila in cursor.fetchall()}
+
+    lineas, errores, total = [], [], Decimal(0)
+    for id_producto, cantidad in cantidades.items():
+        if id_producto not in existentes:
+            errores.append(f"El producto ID {id_producto} no existe.")
+            continue
+        nombre, precio, stock = existentes[id_producto]
+        if stock < cantidad:
+            errores.append(f"No hay suficiente stock para {nombre}. Disponible: {stock}")
+        total += cantidad * precio
+        lineas.append({'id': id_producto, 'nombre': nombre, 'precio': float(precio), 'cantidad': cantidad,
+                       'stock': stock, 'subtotal': float(cantidad * precio)})
+    return {'lineas': lineas, 'total': float(total), 'errores': errores}
+
+
+def comprobar_total(total, total_esperado):
+    """
+    Rechaza la venta si `total_esperado` (el que vio el cajero en el
+    formulario) no coincide con el calculado con los precios bloqueados.
+    """
+    if total_esperado in (None, ''):
+        return
+    try:
+        esperado = Decimal(str(total_esperado))
+        if not esperado.is_finite():
+            raise InvalidOperation
+        esperado = esperado.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise VentaRechazada("El total de la venta no es válido.")
+    if esperado != total:
+        raise VentaRechazada(f"Los precios han cambiado: el total de la venta es ${total:,.2f} "
+                             f"y no ${esperado:,.2f}. Revisa la venta antes de registrarla.")
+
+
+def registrar_venta(cursor, cliente_cedula, total_esperado, metodo_pago, descripcion, productos_vendidos):
+    """
+    Registra la venta con un número fijo de sentencias, sea cual sea el número
+    de productos:
+
+    1. Bloquea todos los productos de la venta (FOR UPDATE, en orden de id).
+    2. Inserta la venta buscando el cliente por cédula en la misma sentencia.
+    3. Inserta todas las líneas de detalle en un solo INSERT multi-fila.
+    4. Descuenta el stock con un único UPDATE que exige `cantidad >= n`.
+    5. Suma la venta a los resúmenes diarios y del cliente (ver resumenes.py).
+
+    El total se calcula con los precios de las filas bloqueadas, no se toma
+    del formulario; `total_esperado` (o None) solo se compara con él (ver
+    comprobar_total).
+
+    No hace commit; lanza VentaRechazada si la venta no es válida y el
+    llamador debe deshacer la transacción.
+    """
+    cantidades = agrupar_productos(productos_vendidos)
+    if not cantidades:
+        raise VentaRechazada("No puedes registrar una venta sin productos.")
+    ids = list(cantidades)
+
+    inicio = time.perf_counter()
+    cursor.execute("SELECT id, cantidad, precio, categoria FROM productos WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+                   (ids,))
+    metricas.registro.espera_bloqueo(time.perf_counter() - inicio)
+    existentes = {fila[0]: (fila[1], fila[2], fila[3]) for fila in cursor.fetchall()}
+
+    for id_producto, cantidad_vendida in cantidades.items():
+        if id_producto not in existentes:
+            raise VentaRechazada(f"El producto ID {id_producto} no existe.")
+        stock_actual = existentes[id_producto][0]
+        if stock_actual < cantidad_vendida:
+            raise VentaRechazada(f"No hay suficiente stock para el producto ID {id_producto}. Stock disponible: {stock_actual}")
+
+    total_venta = sum(cantidad * existentes[id_producto][1] for id_producto, cantidad in cantidades.items())
+    comprobar_total(total_venta, total_esperado)
+
+    cursor.execute("INSERT INTO ventas (id_cliente, fecha, total, metodo_pago, descripcion) "
+                   "SELECT id, NOW(), %s, %s, %s FROM clientes WHERE cedula = %s RETURNING id, id_cliente, fecha",
+                   (total_venta, metodo_pago, descripcion, cliente_cedula))
+    venta = cursor.fetchone()
+    if not venta:
+        raise VentaRechazada(f"Cliente con cédula {cliente_cedula} no encontrado. Por favor, regístrelo primero.")
+    venta_id, id_cliente, fecha = venta
+
+    # El precio unitario sale de la fila bloqueada, no de una subconsulta por línea
+    detalles = [
+        (venta_id, int(producto['id']), int(producto['cantidad']), existentes[int(producto['id'])][1],
+         producto.get('descripcion_producto'))
+        for producto in productos_vendidos
+    ]
+    execute_values(cursor,
+                   "INSERT INTO detalle_ventas (id_venta, id_producto, cantidad, precio_unitario, descripcion) VALUES %s",
+                   detalles, page_size=len(detalles))
+
+    cursor.execute("""
+        UPDATE productos p
+        SET cantidad = p.cantidad - d.cantidad
+        FROM unnest(%s::int[], %s::int[]) AS d(id, cantidad)
+        WHERE p.id = d.id AND p.cantidad >= d.cantidad
+    """, (ids, list(cantidades.values())))
+    if cursor.rowcount != len(ids):
+        # No debería ocurrir con las filas bloqueadas, pero nunca se vende sin stock
+        raise VentaRechazada("El stock cambió durante la venta. Inténtalo de nuevo.")
+
+    resumenes.registrar_venta(cursor, id_cliente, fecha, metodo_pago, total_venta, [
+        (id_producto, existentes[id_producto][2], cantidad, cantidad * existentes[id_producto][1])
+        for id_producto, cantidad in cantidades.items()
+    ])
+
+    return venta_id
+
+
+def reservar_clave(cursor, clave, usuario):
+    """
+    Reserva `clave` para la venta en curso y devuelve None, o el id de la
+    venta ya registrada con esa clave. Si otra transacción la tiene
+    reservada, espera a que termine: si se confirma, la venta es repetida;
+    si se deshace, la reserva pasa a esta.
+    """
+    if len(clave) > MAX_LONGITUD_CLAVE:
+        raise VentaRechazada("La clave de la venta no es válida. Recarga el formulario.")
+    inicio = time.perf_counter()
+    try:
+        cursor.execute("""
+            WITH caducadas AS (
+                DELETE FROM ventas_idempotencia WHERE clave IN (
+                    SELECT clave FROM ventas_idempotencia
+                    WHERE creada < NOW() - %s * INTERVAL '1 hour'
+                    LIMIT %s FOR UPDATE SKIP LOCKED
+                )
+            )
+            INSERT INTO ventas_idempotencia (clave, usuario) VALUES (%s, %s)
+            ON CONFLICT (clave) DO NOTHING
+        """, (CLAVE_TTL_HORAS, PURGA_POR_VENTA, clave, usuario))
+    except psycopg2.errors.UndefinedTable:
+        # La tabla la crea esquema.py; no se crea aquí, en mitad de una venta
+        raise VentaRechazada("Falta la tabla ventas_idempotencia: ejecuta 'python esquema.py' "
+                             "antes de registrar ventas.")
+    metricas.registro.espera_bloqueo(time.perf_counter() - inicio)
+    if cursor.rowcount == 1:
+        return None
+    cursor.execute("SELECT id_venta FROM ventas_idempotencia WHERE clave = %s", (clave,))
+    fila = cursor.fetchone()
+    if fila is None or fila[0] is None:
+        # La venta de la clave se borró después de registrarse
+        raise VentaRechazada("Esta venta ya se había enviado. Recarga el formulario para registrar otra.")
+    return fila[0]
+
+
+def registrar_venta_idempotente(db, clave, usuario, cliente_cedula, total_esperado, metodo_pago, descripcion,
+                                productos_vendidos):
+    """
+    registrar_venta() en su propia transacción, con commit. Devuelve
+    (id de la venta, True si se ha registrado ahora o False si `clave` ya
+    correspondía a una venta registrada).
+
+    Sin clave (clientes antiguos del formulario) no se comprueban repeticiones.
+    Si la transacción falla por un interbloqueo o un conflicto de
+    serialización se repite hasta REINTENTOS veces. VentaRechazada deshace
+    la transacción y se propaga, igual que los demás errores (el pool
+    deshace la transacción al devolver la conexión).
+    """
+    for intento in range(REINTENTOS + 1):
+        try:
+            with db.cursor() as cursor:
+                if clave:
+                    venta_id = reservar_clave(cursor, clave, usuario)
+                    if venta_id is not None:
+                        db.rollback()
+                        metricas.registro.venta_repetida()
+                        return venta_id, False
+                venta_id = registrar_venta(cursor, cliente_cedula, total_esperado, metodo_pago, descripcion,
+                                           productos_vendidos)
+                if clave:
+                    cursor.execute("UPDATE ventas_idempotencia SET id_venta = %s WHERE clave = %s",
+                                   (venta_id, clave))
+            db.commit()
+            return venta_id, True
+        except ERRORES_REINTENTABLES as err:
+            db.rollback()
+            metricas.registro.venta_reintentada(type(err).__name__, agotada=intento == REINTENTOS)
+            if intento == REINTENTOS:
+                raise
+            time.sleep(ESPERA_REINTENTO * 2 ** intento * random.uniform(0.5, 1.5))
+        except VentaRechazada:
+            db.rollback()
+            raise
@@ -0,0 +1,50 @@
+import psycopg2
+import psycopg2.errors
+
+# Versiones de los datos compartidas por todos los workers, para las cachés
+# (catálogo de ventas, ETag de los listados). Son secuencias y no filas para
+# que las escrituras no compitan por un bloqueo al incrementarlas.
+SECUENCIAS = {
+    'productos': 'catalogo_version',
+    'clientes': 'clientes_version',
+    'ventas': 'ventas_version',
+}
+
+
+def crear_secuencias(db):
+    with db.cursor() as cursor:
+        for secuencia in SECUENCIAS.values():
+            cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {secuencia}")
+    db.commit()
+
+
+def leer(db, datos):
+    """Versión actual de cada uno de `datos` (nombres de SECUENCIAS), en una sola consulta."""
+    # Antes del primer nextval() last_value ya vale 1 pero is_called es falso
+    columnas = ', '.join(f"(SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {SECUENCIAS[nombre]})"
+                         for nombre in datos)
+    with db.cursor() as cursor:
+        try:
+            cursor.execute(f"SELECT {columnas}")
+            return cursor.fetchone()
+        except psycopg2.errors.UndefinedTable:
+            db.rollback()
+    # Primera vez en una base de datos sin las secuencias
+    crear_secuencias(db)
+    return leer(db, datos)
+
+
+def incrementar(db, *datos):
+    """
+    Incrementa las versiones de `datos` después del commit de una escritura.
+    nextval() no es transaccional, por eso se llama tras confirmar los datos:
+    así nadie guarda en caché la versión nueva con los datos viejos.
+    """
+    columnas = ', '.join(f"nextval('{SECUENCIAS[nombre]}')" for nombre in datos)
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(f"SELECT {columnas}")
+        db.commit()
+    except psycopg2.errors.UndefinedTable:
+        db.rollback()
+        crear_secuencias(db)